@@ -0,0 +1,90 @@
+"""
+页面解析基准：在保存的 HTML 样本上比较各解析后端的吞吐（页/秒）
+
+样本文件命名为 <站点>_<类型>.html，类型为 ranking / toc / chapter。
+用法：python benchmarks/crawler_parse.py [--rounds 50] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.crawler.rules import Extractor, LxmlBackend, SoupBackend  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "html")
+
+
+def load_fixtures():
+    pages = []
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith(".html"):
+            site, kind = name[:-5].split("_", 1)
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                pages.append((site, kind, f.read()))
+    return pages
+
+
+def parse(extractor: Extractor, site: str, kind: str, html: str):
+    if kind == "ranking":
+        return extractor.ranking(html, site=site)
+    if kind == "toc":
+        return extractor.toc(html, site=site)
+    return extractor.chapter(html, site=site)
+
+
+def backends():
+    available = {}
+    for name, factory in (
+        ("lxml", LxmlBackend),
+        ("bs4+lxml", lambda: SoupBackend("lxml")),
+        ("bs4", SoupBackend)
+    ):
+        try:
+            available[name] = Extractor(factory())
+        except Exception as e:  # 未安装的后端跳过
+            print(f"跳过 {name}: {e}", file=sys.stderr)
+    return available
+
+
+def run(rounds: int = 50):
+    pages = load_fixtures()
+    extractors = backends()
+    reference = None
+    results = {}
+    for name, extractor in extractors.items():
+        outputs = [parse(extractor, *page) for page in pages]
+        if reference is None:
+            reference = outputs
+        consistent = outputs == reference
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for page in pages:
+                parse(extractor, *page)
+        elapsed = time.perf_counter() - start
+        count = rounds * len(pages)
+        results[name] = {
+            "pages": count,
+            "seconds": round(elapsed, 4),
+            "pages_per_sec": round(count / elapsed, 1),
+            "consistent": consistent
+        }
+    return {"fixtures": len(pages), "rounds": rounds, "backends": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="爬虫解析后端基准")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--json", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = run(args.rounds)
+    print(f"样本 {report['fixtures']} 页 × {report['rounds']} 轮")
+    for name, item in report["backends"].items():
+        flag = "" if item["consistent"] else "  (结果与首个后端不一致)"
+        print(f"{name:10s} {item['pages_per_sec']:10.1f} 页/秒{flag}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,260 @@
+"""
+本地假 OpenAI 兼容服务（/v1/chat/completions，支持 SSE 流式），用于在无网络、无费用的情况下验证重试、限流与熔断，
+以及做性能基准与压测
+
+延迟模型：首 token 前等待 latency（乘以 1 + jitter × Exp(1) 的长尾随机因子），之后按 tokens_per_sec 逐块输出
+completion_tokens 个 token（不超过请求的 max_tokens）；tokens_per_sec 为 0 时一次性返回。
+
+可注入的故障：
+- error_rate：按比例返回 500
+- rate_limit_rate：按比例返回 429（带 Retry-After）
+- capacity：并发超过该值的请求返回 429，模拟上游并发配额
+- fail_models：指定模型一律返回 503
+
+运行中可 POST /config 修改上述参数，GET /stats 查看计数。
+用法：python benchmarks/fake_openai.py [--port 8765] [--latency 0.5] [--tokens-per-sec 50] [--error-rate 0.1] [--capacity 8]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+
+DEFAULT_CONFIG = {
+    "latency": 0.05,          # 首 token 前的基础耗时（秒）
+    "jitter": 0.0,            # 长尾系数：实际等待 latency × (1 + jitter × Exp(1))
+    "tokens_per_sec": 0.0,    # 输出速度，0 为不限
+    "completion_tokens": 32,  # 每次回复的 token 数（不超过请求的 max_tokens）
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "retry_after": 1.0,       # 429 的 Retry-After（秒），0 表示不带
+    "capacity": 0,            # 0 为不限
+    "fail_models": [],
+    "chunks": 8               # 流式响应的分块数
+}
+
+
+class FakeOpenAI:
+    """可在进程内启动的假服务：with FakeOpenAI(capacity=4) as server: ... server.url"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config):
+        self.config: Dict = {**DEFAULT_CONFIG, **config}
+        self.counts: Dict[str, int] = {"requests": 0, "ok": 0, "429": 0, "500": 0, "503": 0, "disconnected": 0}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAI":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self, **config):
+        with self._lock:
+            self.config = {**DEFAULT_CONFIG, **config}
+            self.counts = {key: 0 for key in self.counts}
+            self.peak_in_flight = 0
+
+    def stats(self) -> Dict:
+        return {**self.counts, "in_flight": self.in_flight, "peak_in_flight": self.peak_in_flight}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    # ============ 请求处理 ============
+
+    def _fault(self, model: str):
+        """决定本次请求的故障：返回 (状态码, 额外响应头) 或 None"""
+        config = self.config
+        if model in config["fail_models"]:
+            return 503, {}
+        if config["capacity"] and self.in_flight > config["capacity"]:
+            return 429, {"Retry-After": str(config["retry_after"])} if config["retry_after"] else {}
+        roll = random.random()
+        if roll < config["rate_limit_rate"]:
+            return 429, {"Retry-After": str(config["retry_after"])} if config["retry_after"] else {}
+        if roll < config["rate_limit_rate"] + config["error_rate"]:
+            return 500, {}
+        return None
+
+    def _first_token_delay(self) -> float:
+        config = self.config
+        return config["latency"] * (1 + config["jitter"] * random.expovariate(1)) if config["jitter"] else config["latency"]
+
+    def _tokens(self, body: Dict) -> int:
+        limit = body.get("max_tokens") or body.get("max_completion_tokens")
+        return max(1, min(self.config["completion_tokens"], limit or self.config["completion_tokens"]))
+
+    def _generation_time(self, tokens: int) -> float:
+        return tokens / self.config["tokens_per_sec"] if self.config["tokens_per_sec"] else 0.0
+
+    @staticmethod
+    def _usage(body: Dict, completion: int) -> Dict:
+        prompt = sum(len(m.get("content") or "") for m in body.get("messages", []))
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def _completion(self, body: Dict) -> Dict:
+        tokens = self._tokens(body)
+        text = "字" * tokens
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": self._usage(body, tokens)
+        }
+
+    def _chunks(self, body: Dict):
+        """产出 (分块, 发送该分块前的等待秒数)"""
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model")}
+        tokens = self._tokens(body)
+        count = max(1, min(self.config["chunks"], tokens))
+        sizes = [tokens // count + (1 if i < tokens % count else 0) for i in range(count)]
+        for i, size in enumerate(sizes):
+            delta = {"content": "字" * size}
+            if i == 0:
+                delta["role"] = "assistant"
+            yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}, \
+                self._generation_time(size) if i else 0.0
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}, 0.0
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield {**base, "choices": [], "usage": self._usage(body, tokens)}, 0.0
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # 响应头与正文分两次写出，不关 Nagle 会撞上客户端的延迟 ACK，每个请求凭空多出约 40ms
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload: Dict, headers: Dict = None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> Dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    return self._json(200, fake.stats())
+                if self.path.rstrip("/").endswith("/models"):
+                    return self._json(200, {"object": "list", "data": []})
+                self._json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                body = self._body()
+                if self.path.rstrip("/") == "/config":
+                    fake.config.update(body)
+                    return self._json(200, fake.config)
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._json(404, {"error": {"message": "not found"}})
+
+                with fake._lock:
+                    fake.counts["requests"] += 1
+                    fake.in_flight += 1
+                    fake.peak_in_flight = max(fake.peak_in_flight, fake.in_flight)
+                try:
+                    fault = fake._fault(body.get("model"))
+                    if fault:
+                        status, headers = fault
+                        fake._count(str(status))
+                        return self._json(status, {"error": {"message": f"injected {status}", "type": "fake"}}, headers)
+                    time.sleep(fake._first_token_delay())
+                    fake._count("ok")
+                    if not body.get("stream"):
+                        time.sleep(fake._generation_time(fake._tokens(body)))
+                        return self._json(200, fake._completion(body))
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    try:
+                        for chunk, wait in fake._chunks(body):
+                            if wait:
+                                time.sleep(wait)
+                            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                            self.wfile.flush()
+                        self.wfile.write(b"data: [DONE]\n\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        fake._count("disconnected")  # 客户端提前关闭（如对冲落败）
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="假 OpenAI 兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=DEFAULT_CONFIG["latency"])
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=DEFAULT_CONFIG["completion_tokens"])
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=DEFAULT_CONFIG["retry_after"])
+    parser.add_argument("--capacity", type=int, default=0)
+    parser.add_argument("--fail-models", default="", help="逗号分隔，这些模型一律返回 503")
+    args = parser.parse_args()
+
+    server = FakeOpenAI(
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        capacity=args.capacity,
+        fail_models=[m for m in args.fail_models.split(",") if m]
+    )
+    print(f"假 OpenAI 服务：{server.url}（OPENAI_BASE_URL 指向此地址）")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
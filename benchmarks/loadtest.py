@@ -0,0 +1,463 @@
+"""
+FastAPI 服务压测：按真实比例混合 /api/analyze、/api/generate/story、/api/generate/chapter 流量，
+逐级加压，找出在 p95 SLO 内能承载的最大负载（饱和点），并记录各 worker 的 CPU 与内存
+
+- 默认在子进程中启动假 OpenAI 上游（benchmarks/fake_openai.py）与 uvicorn src.api.main:app（--workers N），
+  也可用 --url 指向已部署的服务（此时 --pids 指定要采样的进程）
+- closed：每级固定并发用户数，每个用户发完一个请求、思考 think 秒后再发下一个
+- open：每级固定到达率（泊松到达），不等待前一个请求完成；延迟从计划发出时刻算起，避免协同遗漏（coordinated omission）
+- 某一级 p95 超过 SLO 或错误率超过上限即视为饱和，默认再多跑一级后停止
+
+用法：
+  python benchmarks/loadtest.py --mode open --levels 2,4,8,16,32 --stage-seconds 20 --workers 2 --slo-p95 2.0
+  python benchmarks/loadtest.py --mode closed --levels 4,8,16,32,64 --mix analyze=3,story=1,chapter=6 --json out.json
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import CHAPTER, percentile  # noqa: E402
+
+DEFAULT_MIX = {"analyze": 3, "story": 1, "chapter": 6}
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _request(kind: str, i: int):
+    """各类请求的 (路径, 请求体)；i 保证提示词各不相同，不会被缓存或请求合并吸收"""
+    if kind == "analyze":
+        return "/api/analyze", {"content": f"第{i}段样本\n{CHAPTER}", "genre": "玄幻"}
+    if kind == "story":
+        return "/api/generate/story", {"genre": "玄幻", "theme": f"逆天改命{i}", "main_char": "林默"}
+    if kind == "chapter":
+        return "/api/generate/chapter", {"outline": f"大纲{i}", "previous_content": CHAPTER}
+    if kind == "chapter_stream":
+        return "/api/generate/chapter/stream", {"outline": f"流式大纲{i}", "previous_content": CHAPTER}
+    raise ValueError(f"未知的请求类型: {kind}")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in filter(None, text.split(",")):
+        kind, _, weight = item.partition("=")
+        _request(kind, 0)
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ============ 被测服务 ============
+
+class Service:
+    """子进程中的假上游 + uvicorn 服务"""
+
+    def __init__(self, workers: int = 1, upstream: Dict = None, env: Dict = None):
+        self.workers = workers
+        self.upstream = upstream or {}
+        self.env = env or {}
+        self.upstream_port = free_port()
+        self.port = free_port()
+        self.processes: List[subprocess.Popen] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def upstream_url(self) -> str:
+        return f"http://127.0.0.1:{self.upstream_port}"
+
+    def start(self) -> "Service":
+        fake = [sys.executable, os.path.join(ROOT, "benchmarks", "fake_openai.py"), "--port", str(self.upstream_port)]
+        for key, value in self.upstream.items():
+            fake += [f"--{key.replace('_', '-')}", str(value)]
+        self.processes.append(subprocess.Popen(fake, cwd=ROOT, stdout=subprocess.DEVNULL))
+        _wait_ready(f"{self.upstream_url}/stats")
+
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{self.upstream_url}/v1",
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "fake",
+            "JOB_WORKERS": "0",
+            **self.env
+        }
+        env.setdefault("MINIMAX_RPM", "0")
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.api.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=ROOT,
+            env=env
+        ))
+        _wait_ready(f"{self.url}/")
+        return self
+
+    def worker_pids(self) -> List[int]:
+        """uvicorn 单 worker 时应用跑在主进程里，多 worker 时跑在其子进程里"""
+        master = self.processes[-1].pid
+        children = _children(master)
+        return children or [master]
+
+    def upstream_stats(self) -> Dict:
+        return httpx.get(f"{self.upstream_url}/stats").json()
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务未就绪: {url}")
+
+
+def _children(pid: int) -> List[int]:
+    """pid 的子进程（跳过 multiprocessing 的 resource_tracker）"""
+    children = []
+    for name in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/{name}/cmdline", "rb") as f:
+                    cmdline = f.read()
+            except OSError:
+                continue
+            if int(fields[1]) == pid and b"resource_tracker" not in cmdline:
+                children.append(int(name))
+    return sorted(children)
+
+
+# ============ 资源采样 ============
+
+class ResourceSampler:
+    """后台线程每 interval 秒读取 /proc 中各 worker 的 CPU 时间与 RSS（非 Linux 时不采样）"""
+
+    def __init__(self, pids: List[int], interval: float = 0.5):
+        self.pids = pids
+        self.interval = interval
+        self.samples: List[Dict] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _read(pid: int):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        # ) 之后第 12、13 个字段为 utime、stime，第 22 个为 rss（页）
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE
+
+    def _run(self):
+        last = {pid: (time.monotonic(), self._read(pid)) for pid in self.pids}
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            for pid in self.pids:
+                current = self._read(pid)
+                before, previous = last[pid]
+                if current is None or previous is None:
+                    continue
+                self.samples.append({
+                    "t": now,
+                    "pid": pid,
+                    "cpu": (current[0] - previous[0]) / (now - before) * 100,
+                    "rss": current[1]
+                })
+                last[pid] = (now, current)
+
+    def start(self) -> "ResourceSampler":
+        if os.path.isdir("/proc") and self.pids:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def window(self, start: float, end: float) -> Dict:
+        """[start, end] 内各 worker 的平均 / 最高 CPU% 与最高 RSS"""
+        workers = {}
+        for pid in self.pids:
+            samples = [s for s in self.samples if s["pid"] == pid and start <= s["t"] <= end]
+            if samples:
+                workers[str(pid)] = {
+                    "cpu_avg": round(sum(s["cpu"] for s in samples) / len(samples), 1),
+                    "cpu_max": round(max(s["cpu"] for s in samples), 1),
+                    "rss_max_mb": round(max(s["rss"] for s in samples) / 1024 / 1024, 1)
+                }
+        return workers
+
+
+# ============ 负载生成 ============
+
+class LoadGenerator:
+    def __init__(self, url: str, mix: Dict[str, float], timeout: float = 120.0, max_outstanding: int = 2000):
+        self.url = url
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.timeout = timeout
+        self.max_outstanding = max_outstanding
+        self.counter = 0
+
+    async def _send(self, http: httpx.AsyncClient, records: List, scheduled: float = None):
+        kind = random.choices(self.kinds, self.weights)[0]
+        self.counter += 1
+        path, body = _request(kind, self.counter)
+        start = scheduled or time.perf_counter()
+        status = None
+        try:
+            async with http.stream("POST", path, json=body) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+                status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        records.append((kind, status, time.perf_counter() - start))
+
+    async def closed(self, users: int, seconds: float, think: float = 0.0) -> List:
+        """closed-loop：users 个用户各自循环「请求 → 思考」"""
+        records: List = []
+        deadline = time.perf_counter() + seconds
+        async with self._client(users) as http:
+            async def user():
+                while time.perf_counter() < deadline:
+                    await self._send(http, records)
+                    if think:
+                        await asyncio.sleep(random.expovariate(1 / think))
+
+            await asyncio.gather(*(user() for _ in range(users)))
+        return records
+
+    async def open(self, rate: float, seconds: float) -> List:
+        """open-loop：按泊松过程以 rate 个/秒发出请求；在途超过 max_outstanding 时丢弃并记为 dropped"""
+        records: List = []
+        tasks = set()
+        async with self._client(self.max_outstanding) as http:
+            begin = time.perf_counter()
+            scheduled = begin
+            while True:
+                scheduled += random.expovariate(rate)
+                if scheduled - begin >= seconds:
+                    break
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                if len(tasks) >= self.max_outstanding:
+                    records.append(("-", "dropped", 0.0))
+                    continue
+                task = asyncio.ensure_future(self._send(http, records, scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        return records
+
+    def _client(self, connections: int) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        )
+
+
+def summarize(records: List, seconds: float) -> Dict:
+    ok = [latency for _, status, latency in records if status == 200]
+    statuses: Dict[str, int] = {}
+    for _, status, _ in records:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ordered = sorted(ok)
+    by_kind = {}
+    for kind in sorted({kind for kind, _, _ in records if kind != "-"}):
+        latencies = sorted(latency for k, status, latency in records if k == kind and status == 200)
+        by_kind[kind] = {
+            "requests": sum(1 for k, _, _ in records if k == kind),
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3)
+        }
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "throughput": round(len(ok) / seconds, 2),
+        "error_rate": round(1 - len(ok) / len(records), 4) if records else 0.0,
+        "p50": round(percentile(ordered, 0.50), 3),
+        "p95": round(percentile(ordered, 0.95), 3),
+        "p99": round(percentile(ordered, 0.99), 3),
+        "max": round(ordered[-1], 3) if ordered else 0.0,
+        "statuses": statuses,
+        "endpoints": by_kind
+    }
+
+
+def run(
+    url: str,
+    mode: str,
+    levels: List[float],
+    stage_seconds: float,
+    mix: Dict[str, float],
+    slo_p95: float,
+    max_error_rate: float,
+    think: float = 0.0,
+    sampler: ResourceSampler = None,
+    upstream_stats=None,
+    keep_going: bool = False
+) -> Dict:
+    """逐级加压，返回各级结果与饱和点"""
+    generator = LoadGenerator(url, mix)
+    asyncio.run(generator.closed(2, 2.0))  # 预热：建立连接池、初始化单例
+    stages = []
+    breached = 0
+    upstream_before = upstream_stats() if upstream_stats is not None else None
+    for level in levels:
+        start = time.monotonic()
+        if mode == "closed":
+            records = asyncio.run(generator.closed(int(level), stage_seconds, think))
+        else:
+            records = asyncio.run(generator.open(level, stage_seconds))
+        end = time.monotonic()
+        stage = {"level": level, **summarize(records, end - start)}
+        stage["within_slo"] = stage["p95"] <= slo_p95 and stage["error_rate"] <= max_error_rate and stage["ok"] > 0
+        if sampler is not None:
+            stage["workers"] = sampler.window(start, end)
+        if upstream_stats is not None:
+            # 计数为本级增量，peak_in_flight 为累计峰值
+            upstream = upstream_stats()
+            stage["upstream"] = {
+                key: value if key in ("in_flight", "peak_in_flight") else value - upstream_before.get(key, 0)
+                for key, value in upstream.items()
+            }
+            upstream_before = upstream
+        stages.append(stage)
+        print(_format(mode, stage), flush=True)
+        breached += not stage["within_slo"]
+        if breached >= 2 and not keep_going:
+            break
+
+    passing = [stage for stage in stages if stage["within_slo"]]
+    saturation = max(passing, key=lambda stage: stage["level"]) if passing else None
+    return {
+        "mode": mode,
+        "stage_seconds": stage_seconds,
+        "mix": mix,
+        "slo": {"p95": slo_p95, "max_error_rate": max_error_rate},
+        "stages": stages,
+        "saturation": {
+            "level": saturation["level"],
+            "throughput": saturation["throughput"],
+            "p95": saturation["p95"]
+        } if saturation else None
+    }
+
+
+def _format(mode: str, stage: Dict) -> str:
+    unit = "用户" if mode == "closed" else "个/秒"
+    workers = stage.get("workers") or {}
+    cpu = " ".join(f"{w['cpu_avg']:.0f}%" for w in workers.values())
+    rss = max((w["rss_max_mb"] for w in workers.values()), default=0)
+    flag = "" if stage["within_slo"] else "  ✗ 超出 SLO"
+    return (f"{stage['level']:8g}{unit}  吞吐 {stage['throughput']:7.2f}/s  p50 {stage['p50']:6.2f}s  "
+            f"p95 {stage['p95']:6.2f}s  p99 {stage['p99']:6.2f}s  错误率 {stage['error_rate']:6.1%}  "
+            f"CPU [{cpu}]  RSS {rss:.0f}MB{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FastAPI 服务压测与 SLO 报告")
+    parser.add_argument("--mode", choices=("open", "closed"), default="open")
+    parser.add_argument("--levels", default="2,4,8,16,32,64", help="逐级负载：open 为到达率（个/秒），closed 为并发用户数")
+    parser.add_argument("--stage-seconds", type=float, default=20.0)
+    parser.add_argument("--think", type=float, default=0.0, help="closed 模式下用户的平均思考时间（秒）")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="请求比例，可选 analyze / story / chapter / chapter_stream")
+    parser.add_argument("--slo-p95", type=float, default=2.0, help="p95 延迟 SLO（秒）")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--keep-going", action="store_true", help="超出 SLO 后仍跑完所有级别")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 数")
+    parser.add_argument("--url", help="压测已部署的服务，不启动本地服务")
+    parser.add_argument("--pids", default="", help="配合 --url：逗号分隔的 worker 进程号，用于采样 CPU / 内存")
+    parser.add_argument("--upstream-latency", type=float, default=0.3, help="假上游首 token 前耗时（秒）")
+    parser.add_argument("--upstream-jitter", type=float, default=0.5)
+    parser.add_argument("--upstream-tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--upstream-completion-tokens", type=int, default=100)
+    parser.add_argument("--upstream-capacity", type=int, default=0, help="假上游并发配额，0 为不限")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="报告写入 JSON 文件")
+    args = parser.parse_args()
+
+    options = dict(
+        mode=args.mode,
+        levels=[float(level) for level in args.levels.split(",") if level],
+        stage_seconds=args.stage_seconds,
+        mix=parse_mix(args.mix),
+        slo_p95=args.slo_p95,
+        max_error_rate=args.max_error_rate,
+        think=args.think,
+        keep_going=args.keep_going
+    )
+    service: Optional[Service] = None
+    if args.url:
+        url, pids = args.url, [int(pid) for pid in args.pids.split(",") if pid]
+    else:
+        service = Service(workers=args.workers, upstream={
+            "latency": args.upstream_latency,
+            "jitter": args.upstream_jitter,
+            "tokens_per_sec": args.upstream_tokens_per_sec,
+            "completion_tokens": args.upstream_completion_tokens,
+            "capacity": args.upstream_capacity,
+            "error_rate": args.upstream_error_rate
+        }).start()
+        url, pids = service.url, service.worker_pids()
+        options["upstream_stats"] = service.upstream_stats
+
+    sampler = ResourceSampler(pids).start()
+    try:
+        report = run(url, sampler=sampler, **options)
+    finally:
+        sampler.stop()
+        if service:
+            service.stop()
+    report["target"] = {"url": url, "workers": args.workers if service else len(pids), "pids": pids}
+    if service:
+        report["upstream"] = service.upstream
+
+    saturation = report["saturation"]
+    unit = "用户" if args.mode == "closed" else "个/秒"
+    if saturation:
+        print(f"饱和点：{saturation['level']:g}{unit}（吞吐 {saturation['throughput']}/s，p95 {saturation['p95']}s ≤ {args.slo_p95}s）")
+    else:
+        print(f"最低一级负载即超出 SLO（p95 ≤ {args.slo_p95}s，错误率 ≤ {args.max_error_rate:.1%}）")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
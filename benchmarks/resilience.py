@@ -0,0 +1,100 @@
+"""
+韧性层验证：在本地假 OpenAI 服务上注入故障，对比开启/关闭重试、自适应并发与熔断时的成功率
+
+场景：
+- capacity：上游并发配额小于客户端并发，触发 429（Retry-After）与 AIMD 降并发
+- flaky：按比例返回 500，验证退避重试
+- outage：首选模型持续 503，验证熔断后快速回退到下一个模型
+
+用法：python benchmarks/resilience.py [--requests 200] [--workers 32] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from src.api.minimax_client import MiniMaxClient  # noqa: E402
+from src.api.ratelimit import RateLimiter  # noqa: E402
+from src.api.resilience import AdaptiveLimiter, Resilience  # noqa: E402
+from src.api.router import ModelRouter  # noqa: E402
+
+SCENARIOS = {
+    "capacity": {"capacity": 4, "retry_after": 0.2},
+    "flaky": {"error_rate": 0.2},
+    "outage": {"fail_models": ["MiniMax-M2.5"]}
+}
+
+
+def make_client(url: str, retries: int, workers: int) -> MiniMaxClient:
+    resilience = Resilience(
+        max_retries=retries,
+        base_delay=0.05,
+        max_delay=2.0,
+        limiter=AdaptiveLimiter(initial=workers, minimum=1 if retries else workers, maximum=workers, cooldown=0.2),
+        breaker_threshold=5 if retries else 10 ** 6,
+        breaker_reset=5.0
+    )
+    client = MiniMaxClient(
+        api_key="fake",
+        base_url=url,
+        rate_limiter=RateLimiter(),
+        router=ModelRouter(MiniMaxClient.MODELS),
+        resilience=resilience
+    )
+    client.max_workers = workers
+    return client
+
+
+def run_scenario(server: FakeOpenAI, name: str, resilient: bool, requests: int, workers: int) -> dict:
+    server.reset(**SCENARIOS[name])
+    client = make_client(server.url, 3 if resilient else 0, workers)
+    tasks = [
+        {"messages": [{"role": "user", "content": f"第{i}个请求"}], "task": "chapter", "max_tokens": 100,
+         "use_cache": False}
+        for i in range(requests)
+    ]
+    start = time.perf_counter()
+    results = client.batch_run(tasks)
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for r in results if r["error"] is None)
+    return {
+        "ok": ok,
+        "success_rate": round(ok / requests, 4),
+        "seconds": round(elapsed, 3),
+        "upstream": server.stats(),
+        "client": client.resilience.stats()
+    }
+
+
+def run(requests: int = 200, workers: int = 32) -> dict:
+    report = {"requests": requests, "workers": workers, "scenarios": {}}
+    with FakeOpenAI(latency=0.02) as server:
+        for name in SCENARIOS:
+            report["scenarios"][name] = {
+                mode: run_scenario(server, name, mode == "resilient", requests, workers)
+                for mode in ("baseline", "resilient")
+            }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重试 / 自适应并发 / 熔断验证")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--json", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = run(args.requests, args.workers)
+    for name, modes in report["scenarios"].items():
+        for mode, item in modes.items():
+            upstream = item["upstream"]
+            print(f"{name:9s} {mode:9s} 成功率 {item['success_rate']:6.1%}  用时 {item['seconds']:6.2f}s  "
+                  f"上游请求 {upstream['requests']:4d}（429: {upstream['429']}, 5xx: {upstream['500'] + upstream['503']}）  "
+                  f"并发上限 {item['client']['concurrency_limit']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
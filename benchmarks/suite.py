@@ -0,0 +1,301 @@
+"""
+性能基准套件：在本地假 OpenAI 服务上测量生成器方法、MiniMaxClient.batch_process 与 FastAPI 接口的
+吞吐、p50/p95/p99 延迟与内存，结果写成 JSON 以便跨提交对比
+
+- 每个用例先预热一次，再跑一轮计时（不开 tracemalloc），最后用少量调用单独测内存峰值（peak_alloc_kb）
+- 每次调用的提示词都不同，避免被响应缓存或在途请求合并吸收
+- 运行期间关闭客户端限速（MINIMAX_RPM=0）与进程内任务工作线程（JOB_WORKERS=0）
+
+用法：
+  python benchmarks/suite.py [--iterations 40] [--concurrency 8] [--latency 0.05] [--tokens-per-sec 0]
+                             [--only generator,batch,api] [--json out.json] [--baseline old.json]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+
+GROUPS = ("generator", "batch", "api")
+CHAPTER = "林默推开门，院子里的老槐树落了一地叶子。\n\n" * 40
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def summarize(latencies: List[float], seconds: float, errors: int = 0, items: int = None) -> Dict:
+    ordered = sorted(latencies)
+    calls = len(latencies) + errors
+    return {
+        "calls": calls,
+        "errors": errors,
+        "seconds": round(seconds, 4),
+        "throughput": round((items or calls) / seconds, 2) if seconds else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2)
+    }
+
+
+def run_sync(call: Callable[[int], object], iterations: int, concurrency: int) -> Dict:
+    """call(i) 执行一次调用；concurrency > 1 时用线程池并发"""
+    def timed(i: int):
+        start = time.perf_counter()
+        try:
+            call(i)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, range(iterations)))
+    else:
+        results = [timed(i) for i in range(iterations)]
+    elapsed = time.perf_counter() - start
+    latencies = [r for r in results if r is not None]
+    return summarize(latencies, elapsed, errors=len(results) - len(latencies))
+
+
+async def run_async(call: Callable, iterations: int, concurrency: int) -> Dict:
+    """call(i) 返回协程；最多 concurrency 个同时在途"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception:
+                return None
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed(i) for i in range(iterations)))
+    elapsed = time.perf_counter() - start
+    latencies = [r for r in results if r is not None]
+    return summarize(latencies, elapsed, errors=len(results) - len(latencies))
+
+
+def peak_memory(run: Callable[[], object]) -> float:
+    """run() 期间 Python 堆分配峰值（KB）"""
+    tracemalloc.start()
+    try:
+        run()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+# ============ 用例 ============
+
+def make_client(url: str):
+    from src.api.minimax_client import MiniMaxClient
+    from src.api.ratelimit import RateLimiter
+    return MiniMaxClient(api_key="fake", base_url=url, rate_limiter=RateLimiter())
+
+
+def generator_cases(url: str) -> Dict[str, Callable[[int], object]]:
+    from src.generator.novel import NovelGenerator
+    generator = NovelGenerator(make_client(url))
+    return {
+        "generate_outline": lambda i: generator.generate_outline("玄幻", f"逆天改命{i}", "林默"),
+        "generate_beats": lambda i: generator.generate_beats(f"大纲{i}", i % 10 + 1, 10, "玄幻"),
+        "generate_chapter": lambda i: generator.generate_chapter(f"大纲{i}", CHAPTER, i % 10 + 1, "玄幻"),
+        "generate_dialogue": lambda i: generator.generate_dialogue("林默", "苏晴", f"第{i}次相遇", "tense"),
+        "generate_scene": lambda i: generator.generate_scene("青云山", f"第{i}日黄昏", "肃杀", ["对峙", "出手"]),
+        "polish_chapter": lambda i: generator.polish_chapter(f"第{i}章\n\n{CHAPTER}", chunk_chars=400)
+    }
+
+
+def bench_generator(url: str, iterations: int, concurrency: int) -> Dict:
+    results = {}
+    for name, call in generator_cases(url).items():
+        call(-1)  # 预热：建立连接、初始化单例
+        results[name] = run_sync(call, iterations, concurrency)
+        offset = iterations
+        results[name]["peak_alloc_kb"] = peak_memory(
+            lambda: [call(offset + i) for i in range(min(iterations, 10))]
+        )
+    return results
+
+
+def bench_batch(url: str, iterations: int, concurrency: int, batch_size: int = 64) -> Dict:
+    client = make_client(url)
+    client.max_workers = concurrency
+
+    def tasks(round_: int) -> List[Dict]:
+        return [
+            {"messages": [{"role": "user", "content": f"批次{round_}第{i}个任务"}], "task": "analysis",
+             "max_tokens": 200, "use_cache": False}
+            for i in range(batch_size)
+        ]
+
+    rounds = max(1, iterations // 10)
+    latencies = []
+    start = time.perf_counter()
+    for r in range(rounds):
+        begin = time.perf_counter()
+        client.batch_process(tasks(r))
+        latencies.append(time.perf_counter() - begin)
+    result = summarize(latencies, time.perf_counter() - start, items=rounds * batch_size)
+    result["batch_size"] = batch_size
+    result["peak_alloc_kb"] = peak_memory(lambda: client.batch_process(tasks(rounds)))
+    return {"batch_process": result}
+
+
+def bench_api(iterations: int, concurrency: int) -> Dict:
+    import httpx
+    from src.api.main import app
+    from src.api.transport import close_async_http_client
+
+    payloads = {
+        "POST /api/analyze": lambda i: ("/api/analyze", {"content": f"{i}{CHAPTER}", "genre": "玄幻"}),
+        "POST /api/generate/story": lambda i: (
+            "/api/generate/story", {"genre": "玄幻", "theme": f"逆天改命{i}", "main_char": "林默"}
+        ),
+        "POST /api/generate/chapter": lambda i: (
+            "/api/generate/chapter", {"outline": f"大纲{i}", "previous_content": CHAPTER}
+        ),
+        "POST /api/generate/chapter/stream": lambda i: (
+            "/api/generate/chapter/stream", {"outline": f"流式大纲{i}", "previous_content": CHAPTER}
+        )
+    }
+
+    async def run() -> Dict:
+        results = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for name, payload in payloads.items():
+                async def call(i: int, payload=payload):
+                    path, body = payload(i)
+                    response = await http.post(path, json=body)
+                    response.raise_for_status()
+                    return response.content
+
+                await call(-1)
+                results[name] = await run_async(call, iterations, concurrency)
+                tracemalloc.start()
+                try:
+                    await run_async(lambda i, call=call: call(iterations + i), min(iterations, 10), concurrency)
+                    results[name]["peak_alloc_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+                finally:
+                    tracemalloc.stop()
+        await close_async_http_client()
+        return results
+
+    return asyncio.run(run())
+
+
+# ============ 报告 ============
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    iterations: int = 40,
+    concurrency: int = 8,
+    groups=GROUPS,
+    **server_config
+) -> Dict:
+    server_config = {"latency": 0.05, **server_config}
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "upstream": server_config,
+        "results": {}
+    }
+    with FakeOpenAI(**server_config) as server:
+        os.environ["OPENAI_BASE_URL"] = server.url
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+        os.environ["MINIMAX_RPM"] = "0"
+        os.environ["JOB_WORKERS"] = "0"
+        if "generator" in groups:
+            report["results"]["generator"] = bench_generator(server.url, iterations, concurrency)
+        if "batch" in groups:
+            report["results"]["batch"] = bench_batch(server.url, iterations, concurrency)
+        if "api" in groups:
+            report["results"]["api"] = bench_api(iterations, concurrency)
+        report["upstream_stats"] = server.stats()
+    report["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+def compare(report: Dict, baseline: Dict) -> List[str]:
+    """与基线报告逐项对比 p95 与吞吐"""
+    lines = []
+    for group, cases in report["results"].items():
+        for name, item in cases.items():
+            old = baseline.get("results", {}).get(group, {}).get(name)
+            if not old:
+                continue
+            p95 = (item["p95_ms"] / old["p95_ms"] - 1) if old["p95_ms"] else 0.0
+            throughput = (item["throughput"] / old["throughput"] - 1) if old["throughput"] else 0.0
+            lines.append(f"{group:9s} {name:34s} p95 {p95:+7.1%}  吞吐 {throughput:+7.1%}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成器 / 批量调用 / API 性能基准")
+    parser.add_argument("--iterations", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="假上游首 token 前耗时（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--only", default=",".join(GROUPS), help="逗号分隔：generator,batch,api")
+    parser.add_argument("--json", help="结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前的 JSON 结果对比")
+    args = parser.parse_args()
+
+    report = run(
+        args.iterations,
+        args.concurrency,
+        groups=[g for g in args.only.split(",") if g],
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    print(f"提交 {report['commit']}  {args.iterations} 次 × 并发 {args.concurrency}  峰值 RSS {report['max_rss_mb']} MB")
+    for group, cases in report["results"].items():
+        for name, item in cases.items():
+            print(f"{group:9s} {name:34s} {item['throughput']:8.1f}/s  p50 {item['p50_ms']:8.1f}ms  "
+                  f"p95 {item['p95_ms']:8.1f}ms  p99 {item['p99_ms']:8.1f}ms  错误 {item['errors']:3d}  "
+                  f"内存峰值 {item['peak_alloc_kb']:8.1f}KB")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print("\n".join(["", f"对比基线 {args.baseline}："] + compare(report, json.load(f))))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
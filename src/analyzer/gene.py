@@ -1,71 +1,274 @@
 """
 小说基因分析器
 """
-from typing import Dict, List
+from typing import Dict, List, Optional
 import json
+import re
+import time
+
+from src.analyzer.genre_matcher import genre_matching_enabled, get_genre_matcher
+from src.api import tracing
+
+# 分析维度：任务说明、JSON 结构示例、结果类型与缺省值
+ASPECTS = {
+    "genre": {
+        "instruction": "判断其题材类型（玄幻/都市/悬疑/科幻/言情/历史等），给出 0-1 的置信度和理由",
+        "schema": '{"genre": "题材", "confidence": 0.8, "reason": "理由"}',
+        "type": dict,
+        "default": {"genre": "待分析", "confidence": 0}
+    },
+    "personality": {
+        "instruction": "分析主角人设：1. 性格特点 2. 能力/金手指 3. 成长线 4. 目标/动机",
+        "schema": '{"traits": ["性格特点"], "ability": "能力/金手指", "growth": "成长线", "motivation": "目标/动机"}',
+        "type": dict,
+        "default": {"personality": "待提取"}
+    },
+    "excitement_points": {
+        "instruction": "提取核心爽点，可能的类型：打脸、逆袭、甜宠、装逼、热血、悬疑、搞笑等",
+        "schema": '["爽点"]',
+        "type": list,
+        "default": []
+    },
+    "golden_sentences": {
+        "instruction": "提取3-5句经典金句（原文摘录）",
+        "schema": '["金句"]',
+        "type": list,
+        "default": []
+    },
+    "emotion_curve": {
+        "instruction": "分析情绪曲线，按情节推进列出各阶段的情绪与强度（0-10）",
+        "schema": '{"curve": [{"stage": "阶段", "emotion": "情绪", "intensity": 5}]}',
+        "type": dict,
+        "default": {"curve": "待分析"}
+    }
+}
+
+REPORT_MODES = ("single", "parallel", "sequential")
+
+SYSTEM_PROMPT = "你是一个资深网文分析师，擅长拆解热门小说的成功要素。只输出 JSON，不要输出其他内容。"
+
+
+def parse_json(text: str):
+    """从模型输出中解析 JSON（兼容 ```json 代码块和前后多余文字）"""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
 
 class GeneAnalyzer:
     """小说基因分析引擎"""
-    
-    def __init__(self, client):
+
+    def __init__(self, client, excerpt_chars: int = 2000):
         self.client = client
-    
+        self.excerpt_chars = excerpt_chars
+
+    # ============ 请求构建 ============
+
+    def _aspect_messages(self, aspect: str, content: str) -> List[Dict]:
+        """单维度请求：正文放在最前，各维度共享相同前缀以命中服务端前缀缓存"""
+        spec = ASPECTS[aspect]
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"""小说内容：
+{content[:self.excerpt_chars]}
+
+任务：{spec['instruction']}
+输出格式：{spec['schema']}"""}
+        ]
+
+    def _report_messages(self, content: str, full: bool = False) -> List[Dict]:
+        """多维度合并请求：一次返回全部维度；full=True 时使用完整正文（整书分析的分块已按大小切好）"""
+        tasks = "\n".join(
+            f'- "{name}"：{spec["instruction"]}，格式 {spec["schema"]}'
+            for name, spec in ASPECTS.items()
+        )
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"""小说内容：
+{content if full else content[:self.excerpt_chars]}
+
+请完成以下全部分析，输出一个 JSON 对象，键名如下：
+{tasks}"""}
+        ]
+
+    @staticmethod
+    def _validate(aspect: str, value):
+        """校验维度结果类型，不合法返回 None"""
+        spec = ASPECTS[aspect]
+        if isinstance(value, dict) and spec["type"] is list:
+            value = value.get(aspect)
+        return value if isinstance(value, spec["type"]) else None
+
+    def parse_report(self, text: Optional[str]) -> Dict:
+        """解析合并请求的输出，缺失或不合法的维度取缺省值"""
+        data = parse_json(text) if text else None
+        data = data if isinstance(data, dict) else {}
+        report = {}
+        for aspect, spec in ASPECTS.items():
+            value = self._validate(aspect, data.get(aspect))
+            report[aspect] = spec["default"] if value is None else value
+        return report
+
+    @tracing.traced("analyzer.aspect")
+    def _run_aspect(self, aspect: str, content: str):
+        response = self.client.chat(
+            messages=self._aspect_messages(aspect, content),
+            temperature=0.3,
+            max_tokens=800,
+            task="analysis"
+        )
+        with tracing.span("analyzer.postprocess", aspect=aspect):
+            value = self._validate(aspect, parse_json(response.choices[0].message.content))
+        return ASPECTS[aspect]["default"] if value is None else value
+
+    # ============ 单维度接口 ============
+
     def analyze_genre(self, content: str) -> Dict:
-        """分析题材类型"""
-        prompt = f"""请分析以下小说内容，判断其题材类型（玄幻/都市/悬疑/科幻/言情等），并给出理由：
-        
-        {content[:1500]}
-        """
-        # 调用 AI 分析
-        return {"genre": "待分析", "confidence": 0}
-    
+        """分析题材类型：本地关键词识别领先幅度足够时直接返回，否则调用 LLM"""
+        local = self._local_genre(content)
+        return local if local is not None else self._run_aspect("genre", content)
+
+    @staticmethod
+    def _local_genre(content: str) -> Optional[Dict]:
+        """本地题材识别（全文单次扫描），不可信时返回 None"""
+        if not genre_matching_enabled():
+            return None
+        with tracing.span("analyzer.genre_match") as span:
+            match = get_genre_matcher().classify(content)
+            span.set(genre=match["genre"], margin=match["margin"], confident=match["confident"])
+        if not match["confident"]:
+            return None
+        return {"genre": match["genre"], "confidence": match["confidence"], "reason": match["reason"], "source": "local"}
+
     def extract_personality(self, content: str) -> Dict:
         """提取人物设定"""
-        prompt = f"""请分析以下小说中的主角人设：
-        
-        {content[:1500]}
-        
-        请提取：
-        1. 性格特点
-        2. 能力/金手指
-        3. 成长线
-        4. 目标/动机
-        """
-        return {"personality": "待提取"}
-    
+        return self._run_aspect("personality", content)
+
     def extract_excitement_points(self, content: str) -> List[str]:
         """提取爽点"""
-        prompt = f"""请分析以下小说中的核心爽点：
-        
-        {content[:1500]}
-        
-        可能的爽点类型：打脸、逆袭、甜宠、装逼、热血、悬疑、搞笑等
-        """
-        return []
-    
+        return self._run_aspect("excitement_points", content)
+
     def extract_golden_sentences(self, content: str) -> List[str]:
         """提取金句"""
-        prompt = f"""请从以下小说内容中提取3-5句经典金句：
-        
-        {content[:2000]}
-        """
-        return []
-    
+        return self._run_aspect("golden_sentences", content)
+
     def analyze_emotion_curve(self, content: str) -> Dict:
         """分析情绪曲线"""
-        # TODO: 实现情绪曲线分析
-        return {"curve": "待分析"}
-    
-    def generate_gene_report(self, content: str) -> Dict:
-        """生成完整的基因报告"""
-        return {
-            "genre": self.analyze_genre(content),
-            "personality": self.extract_personality(content),
-            "excitement_points": self.extract_excitement_points(content),
-            "golden_sentences": self.extract_golden_sentences(content),
-            "emotion_curve": self.analyze_emotion_curve(content)
+        return self._run_aspect("emotion_curve", content)
+
+    # ============ 完整报告 ============
+
+    @tracing.traced("analyzer.gene_report")
+    def generate_gene_report(self, content: str, mode: str = "single") -> Dict:
+        """生成完整的基因报告
+
+        mode:
+        - single：所有维度合并为一次 JSON 请求，解析失败的维度再单独补发
+        - parallel：各维度并发请求，共享相同的正文前缀
+        - sequential：各维度依次请求
+        报告的 meta 字段记录每个维度的耗时与 token 用量
+        """
+        if mode not in REPORT_MODES:
+            raise ValueError(f"未知的报告模式: {mode}，可选 {REPORT_MODES}")
+        start = time.perf_counter()
+        report: Dict = {}
+        meta: Dict = {"mode": mode, "aspects": {}}
+
+        pending = list(ASPECTS)
+        if mode == "single":
+            pending = self._run_combined(content, report, meta)
+        if "genre" in pending:
+            # 题材需要单独请求时（独立请求模式或合并请求未给出），本地能确定就不再调用 LLM
+            genre_start = time.perf_counter()
+            local = self._local_genre(content)
+            if local is not None:
+                report["genre"] = local
+                meta["aspects"]["genre"] = {"latency": time.perf_counter() - genre_start, "usage": None, "local": True}
+                pending.remove("genre")
+        if pending:
+            self._run_fanout(content, pending, report, meta, max_workers=1 if mode == "sequential" else None)
+
+        meta["latency"] = time.perf_counter() - start
+        meta["usage"] = _sum_usage([item.get("usage") for item in meta["aspects"].values() if not item.get("shared")]
+                                   + [meta.get("combined", {}).get("usage")])
+        report = {aspect: report[aspect] for aspect in ASPECTS}
+        report["meta"] = meta
+        return report
+
+    @tracing.traced("analyzer.book")
+    def analyze_book(self, source, progress=None) -> Dict:
+        """整书分析：按章节切块 map-reduce，source 可为全文字符串或文本迭代器（如打开的文件）"""
+        from src.analyzer.mapreduce import MapReduceAnalyzer
+        return MapReduceAnalyzer(self).analyze(source, progress=progress)
+
+    def _run_combined(self, content: str, report: Dict, meta: Dict) -> List[str]:
+        """合并请求，返回需要补发的维度"""
+        start = time.perf_counter()
+        response = self.client.chat(
+            messages=self._report_messages(content),
+            temperature=0.3,
+            max_tokens=2000,
+            task="analysis"
+        )
+        latency = time.perf_counter() - start
+        usage = getattr(response, "usage", None)
+        usage = usage.model_dump() if usage else None
+        meta["combined"] = {"latency": latency, "usage": usage}
+
+        with tracing.span("analyzer.postprocess") as span:
+            data = parse_json(response.choices[0].message.content)
+            data = data if isinstance(data, dict) else {}
+            missing = []
+            for aspect in ASPECTS:
+                value = self._validate(aspect, data.get(aspect))
+                if value is None:
+                    missing.append(aspect)
+                    continue
+                report[aspect] = value
+                meta["aspects"][aspect] = {"latency": latency, "usage": usage, "shared": True}
+            span.set(missing=missing)
+        return missing
+
+    def _run_fanout(self, content: str, aspects: List[str], report: Dict, meta: Dict, max_workers: int = None):
+        """各维度独立请求（经 batch_run 并发与限速）"""
+        tasks = [
+            {"messages": self._aspect_messages(aspect, content), "task": "analysis", "temperature": 0.3, "max_tokens": 800}
+            for aspect in aspects
+        ]
+        results = self.client.batch_run(tasks, max_workers=max_workers)
+        with tracing.span("analyzer.postprocess", aspects=aspects):
+            for aspect, item in zip(aspects, results):
+                self._collect(aspect, item, report, meta)
+
+    def _collect(self, aspect: str, item: Dict, report: Dict, meta: Dict):
+        value = self._validate(aspect, parse_json(item["content"])) if item["content"] else None
+        report[aspect] = ASPECTS[aspect]["default"] if value is None else value
+        meta["aspects"][aspect] = {
+            "latency": item["latency"],
+            "usage": item["usage"],
+            "error": item["error"]
         }
 
+
+def _sum_usage(usages: List[Optional[Dict]]) -> Dict:
+    total = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    for usage in usages:
+        if usage:
+            for key in total:
+                total[key] += usage.get(key) or 0
+    return total
+
 # 基因模板
 GENE_TEMPLATES = {
     "fantasy": {
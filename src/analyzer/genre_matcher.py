@@ -0,0 +1,203 @@
+"""
+本地题材识别
+用基因库（GENRE_GENES / GENE_TEMPLATES）中各题材的关键词、元素、爽点词，加上常见的正文用词，构建一个 Aho-Corasick 自动机，
+一次扫描全文统计各题材的命中，按权重打分。领先幅度足够时直接给出结果，否则交给 LLM（GeneAnalyzer.analyze_genre）。
+
+- 多个题材共有的词（如「系统」「穿越」）权重在这些题材间均分
+- 同一个词重复出现按 log(1 + 次数) 计分，避免单个高频词决定结果
+- 自动机构建时把失败转移折叠进转移表；扫描时先用正则跳过字母表之外的字符，其余字符每个只查一次表
+
+用法：python -m src.analyzer.genre_matcher <文本文件> [--bench]
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+import argparse
+import math
+import os
+import re
+import time
+
+# 各字段的权重：关键词最能区分题材，爽点词多为泛用词
+FIELD_WEIGHTS = {"keywords": 3.0, "elements": 2.0, "excitement": 1.0, "lexicon": 1.0}
+
+# 正文中常见、基因库里没有的题材用词
+LEXICON = {
+    "玄幻": ["修炼", "境界", "灵气", "丹药", "宗门", "斗气", "武魂", "法宝", "渡劫", "真元", "妖兽", "筑基", "金丹", "元婴"],
+    "都市": ["公司", "老板", "别墅", "酒吧", "保镖", "集团", "董事长", "股份", "豪车", "会所"],
+    "悬疑": ["尸体", "凶手", "案件", "警察", "死者", "嫌疑人", "案发现场", "法医", "失踪", "监控"],
+    "科幻": ["飞船", "星球", "舰队", "外星", "机器人", "文明", "量子", "光年", "虫族", "空间站"],
+    "言情": ["心跳", "脸红", "喜欢你", "男朋友", "女朋友", "约会", "拥抱", "婚礼", "前任", "吃醋"],
+    "历史": ["皇上", "陛下", "朝廷", "将军", "殿下", "奏折", "太子", "丞相", "王爷", "县令"]
+}
+
+
+class AhoCorasick:
+    """多模式匹配自动机（DFA 形式）：count(text) 返回各模式的出现次数（允许重叠）"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = list(dict.fromkeys(p for p in patterns if p))
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(index)
+
+        # 按 BFS 顺序计算失败指针，同时把失败状态的转移与输出合并进来
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict() for _ in goto]
+        delta[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+                outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+                queue.append(nxt)
+        self.delta = delta
+        self.outputs = [tuple(out) or None for out in outputs]
+        # 模式字母表之外的字符不可能出现在任何匹配中：先用正则（C 实现）切出只含字母表字符的片段，只在片段上走自动机；
+        # 短于最短模式的片段不可能命中，可一并跳过
+        alphabet = "".join(sorted({ch for pattern in self.patterns for ch in pattern}))
+        shortest = min((len(p) for p in self.patterns), default=1)
+        self._runs = re.compile(f"[{re.escape(alphabet)}]{{{shortest},}}") if alphabet else None
+
+    def count(self, text: str) -> List[int]:
+        counts = [0] * len(self.patterns)
+        if self._runs is None:
+            return counts
+        delta, outputs = self.delta, self.outputs
+        for run in self._runs.findall(text):
+            state = 0
+            for ch in run:
+                state = delta[state].get(ch, 0)
+                if outputs[state]:
+                    for index in outputs[state]:
+                        counts[index] += 1
+        return counts
+
+
+def default_genes() -> Dict[str, Dict]:
+    """合并生成器与分析器两处的题材基因，并补充 LEXICON"""
+    from src.analyzer.gene import GENE_TEMPLATES
+    from src.generator.novel import GENRE_GENES
+    genes: Dict[str, Dict[str, List[str]]] = {}
+    sources = [GENRE_GENES, {data["name"]: data for data in GENE_TEMPLATES.values()},
+               {genre: {"lexicon": words} for genre, words in LEXICON.items()}]
+    for source in sources:
+        for genre, data in source.items():
+            merged = genes.setdefault(genre, {})
+            for field in FIELD_WEIGHTS:
+                merged.setdefault(field, [])
+                merged[field] += [term for term in data.get(field) or [] if term not in merged[field]]
+    return genes
+
+
+class GenreMatcher:
+    """基于关键词的题材打分器"""
+
+    def __init__(self, genes: Dict[str, Dict] = None, margin: float = 0.3, min_score: float = 4.0):
+        self.margin = margin
+        self.min_score = min_score
+        weights: Dict[str, Dict[str, float]] = {}
+        for genre, data in (genes or default_genes()).items():
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in data.get(field) or []:
+                    term = term.lower()
+                    by_genre = weights.setdefault(term, {})
+                    by_genre[genre] = max(by_genre.get(genre, 0.0), weight)
+        self.genres = sorted({genre for by_genre in weights.values() for genre in by_genre})
+        self.automaton = AhoCorasick(weights)
+        self.weights = [
+            {genre: weight / len(weights[term]) for genre, weight in weights[term].items()}
+            for term in self.automaton.patterns
+        ]
+        self.counts = {"local": 0, "escalated": 0}
+
+    def scores(self, text: str) -> Dict:
+        """返回 {"scores": {题材: 分数}, "hits": {题材: [(词, 次数)]}}"""
+        scores = {genre: 0.0 for genre in self.genres}
+        hits: Dict[str, List] = {genre: [] for genre in self.genres}
+        for index, count in enumerate(self.automaton.count(text.lower())):
+            if count:
+                term = self.automaton.patterns[index]
+                for genre, weight in self.weights[index].items():
+                    scores[genre] += weight * math.log1p(count)
+                    hits[genre].append((term, count))
+        return {"scores": scores, "hits": hits}
+
+    def classify(self, text: str) -> Dict:
+        """打分并判断是否可信：总分不低于 min_score 且第一名领先第二名至少 margin（按第一名分数的比例）"""
+        result = self.scores(text)
+        ranked = sorted(result["scores"].items(), key=lambda item: item[1], reverse=True)
+        (top, top_score), second = ranked[0], ranked[1][1] if len(ranked) > 1 else 0.0
+        total = sum(result["scores"].values())
+        margin = (top_score - second) / top_score if top_score else 0.0
+        confident = total >= self.min_score and margin >= self.margin
+        self.counts["local" if confident else "escalated"] += 1
+        terms = sorted(result["hits"][top], key=lambda hit: hit[1], reverse=True)[:5]
+        return {
+            "genre": top if top_score else None,
+            "confidence": round(top_score / total, 2) if total else 0.0,
+            "margin": round(margin, 2),
+            "score": round(total, 2),
+            "confident": confident,
+            "reason": "关键词命中：" + "、".join(f"{term}×{count}" for term, count in terms) if terms else "无关键词命中"
+        }
+
+    def stats(self) -> Dict:
+        decided = self.counts["local"] + self.counts["escalated"]
+        return {
+            **self.counts,
+            "local_rate": round(self.counts["local"] / decided, 4) if decided else 0.0,
+            "patterns": len(self.automaton.patterns),
+            "states": len(self.automaton.delta)
+        }
+
+
+def genre_matching_enabled() -> bool:
+    """analyze_genre 是否先走本地识别（GENRE_MATCH=0 时总是调用 LLM）"""
+    return os.getenv("GENRE_MATCH", "1") != "0"
+
+
+_matcher: Optional[GenreMatcher] = None
+
+
+def get_genre_matcher() -> GenreMatcher:
+    """进程内共享的题材识别器（GENRE_MATCH_MARGIN / GENRE_MATCH_MIN_SCORE 配置）"""
+    global _matcher
+    if _matcher is None:
+        _matcher = GenreMatcher(
+            margin=float(os.getenv("GENRE_MATCH_MARGIN", "0.3")),
+            min_score=float(os.getenv("GENRE_MATCH_MIN_SCORE", "4"))
+        )
+    return _matcher
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地题材识别")
+    parser.add_argument("path")
+    parser.add_argument("--bench", action="store_true", help="测量扫描速度")
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as f:
+        content = f.read()
+    matcher = get_genre_matcher()
+    print(matcher.classify(content))
+    if args.bench:
+        start = time.perf_counter()
+        rounds = 0
+        while time.perf_counter() - start < 2:
+            matcher.automaton.count(content.lower())
+            rounds += 1
+        elapsed = time.perf_counter() - start
+        size = len(content.encode("utf-8")) * rounds
+        print(f"{size / elapsed / 1e6:.1f} MB/s（{len(content) * rounds / elapsed / 1e6:.1f} M 字/秒）")
@@ -0,0 +1,237 @@
+"""
+整书 map-reduce 分析
+按章节边界切分全文 → 分块并发分析（经限速器）→ 分层合并为一份基因报告
+输入按迭代器处理，内存占用与全书长度无关
+"""
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Union
+import io
+import math
+import re
+import time
+
+from src.analyzer.gene import GeneAnalyzer
+
+CHAPTER_HEADING = re.compile(r"^\s*第[零〇一二两三四五六七八九十百千万\d]+[章节回卷]")
+
+
+def iter_chapters(
+    source: Union[str, Iterable[str]],
+    max_chars: int = 6000,
+    min_chars: int = 1500
+) -> Iterator[str]:
+    """把文本流切成分析分块
+
+    优先在章节标题处断开（过短的章节与后文合并到 min_chars 以上），
+    超长章节在 max_chars 处按行断开。source 可以是字符串、文件对象或任意文本片段迭代器。
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    buffer: List[str] = []
+    size = 0
+    pending = ""
+
+    def feed(line: str):
+        nonlocal buffer, size
+        if buffer and (
+            (size >= min_chars and CHAPTER_HEADING.match(line)) or size + len(line) > max_chars
+        ):
+            yield "\n".join(buffer)
+            buffer, size = [], 0
+        buffer.append(line)
+        size += len(line) + 1
+
+    for piece in source:
+        pending += piece
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield from feed(line)
+    if pending:
+        yield from feed(pending)
+    if buffer:
+        yield "\n".join(buffer)
+
+
+def _number(value, default: float = None) -> float:
+    """LLM 返回的数值字段可能是「高」「0.8分」之类，无法解析时返回 default"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if math.isfinite(number) else default
+
+
+class _Partial:
+    """可合并的部分报告（只保留计数与有界列表）"""
+
+    TOP_N = 200
+    MAX_SENTENCES = 50
+    MAX_CURVE = 200
+
+    def __init__(self):
+        self.chars = 0
+        self.chunks = 0
+        self.genres: Counter = Counter()
+        self.traits: Counter = Counter()
+        self.profile: Dict[str, Counter] = {"ability": Counter(), "growth": Counter(), "motivation": Counter()}
+        self.excitement: Counter = Counter()
+        self.sentences: List[str] = []
+        self.curve: List[Dict] = []
+
+    @classmethod
+    def from_report(cls, report: Dict, index: int, chars: int) -> "_Partial":
+        part = cls()
+        part.chars = chars
+        part.chunks = 1
+        genre = report["genre"]
+        if isinstance(genre.get("genre"), str) and genre["genre"] not in ("", "待分析"):
+            part.genres[genre["genre"]] += chars * _number(genre.get("confidence"), 0.5)
+        personality = report["personality"]
+        part.traits.update(t for t in personality.get("traits") or [] if isinstance(t, str))
+        for key, counter in part.profile.items():
+            if isinstance(personality.get(key), str) and personality[key]:
+                counter[personality[key]] += 1
+        part.excitement.update(p for p in report["excitement_points"] if isinstance(p, str))
+        part.sentences = [s for s in report["golden_sentences"] if isinstance(s, str)][:5]
+        stages = report["emotion_curve"].get("curve")
+        # 跳过强度缺失或无法解析的阶段
+        points = [
+            (s.get("emotion"), _number(s.get("intensity")))
+            for s in stages if isinstance(s, dict)
+        ] if isinstance(stages, list) else []
+        points = [(emotion, intensity) for emotion, intensity in points if intensity is not None]
+        if points:
+            part.curve = [{
+                "start": index,
+                "end": index,
+                "emotion": max(points, key=lambda p: p[1])[0],
+                "intensity": sum(intensity for _, intensity in points) / len(points)
+            }]
+        return part
+
+    def merge(self, other: "_Partial") -> "_Partial":
+        self.chars += other.chars
+        self.chunks += other.chunks
+        self.genres.update(other.genres)
+        self.traits = Counter(dict((self.traits + other.traits).most_common(self.TOP_N)))
+        for key in self.profile:
+            self.profile[key] = Counter(dict((self.profile[key] + other.profile[key]).most_common(self.TOP_N)))
+        self.excitement = Counter(dict((self.excitement + other.excitement).most_common(self.TOP_N)))
+        seen = set(self.sentences)
+        self.sentences += [s for s in other.sentences if s not in seen]
+        self.sentences = self.sentences[:self.MAX_SENTENCES]
+        self.curve = sorted(self.curve + other.curve, key=lambda p: p["start"])
+        while len(self.curve) > self.MAX_CURVE:
+            self.curve = [self._join(self.curve[i:i + 2]) for i in range(0, len(self.curve), 2)]
+        return self
+
+    @staticmethod
+    def _join(points: List[Dict]) -> Dict:
+        peak = max(points, key=lambda p: p["intensity"])
+        return {
+            "start": points[0]["start"],
+            "end": points[-1]["end"],
+            "emotion": peak["emotion"],
+            "intensity": sum(p["intensity"] for p in points) / len(points)
+        }
+
+    def to_report(self) -> Dict:
+        total = sum(self.genres.values())
+        genre, weight = self.genres.most_common(1)[0] if self.genres else ("待分析", 0)
+        return {
+            "genre": {
+                "genre": genre,
+                "confidence": round(weight / total, 3) if total else 0,
+                "distribution": {g: round(w / total, 3) for g, w in self.genres.most_common(5)} if total else {}
+            },
+            "personality": {
+                "traits": [t for t, _ in self.traits.most_common(10)],
+                **{key: [v for v, _ in counter.most_common(3)] for key, counter in self.profile.items()}
+            },
+            "excitement_points": [p for p, _ in self.excitement.most_common(20)],
+            "golden_sentences": self.sentences[:10],
+            "emotion_curve": {"curve": self.curve}
+        }
+
+
+class MapReduceAnalyzer:
+    """整书基因分析"""
+
+    def __init__(self, analyzer: GeneAnalyzer, window: int = None, fan_in: int = 8, max_chars: int = 6000):
+        self.analyzer = analyzer
+        self.client = analyzer.client
+        self.window = window or getattr(self.client, "max_workers", 8) * 2
+        self.fan_in = fan_in
+        self.max_chars = max_chars
+
+    def iter_analyze(self, source: Union[str, Iterable[str]]) -> Iterator[Dict]:
+        """逐窗口分析并产出进度事件，最后产出 {"event": "done", "report": ...}"""
+        start = time.perf_counter()
+        levels: List[List[_Partial]] = [[]]
+        done = chars = errors = 0
+        usage = Counter()
+
+        def add(part: _Partial, level: int = 0):
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(part)
+            if len(levels[level]) >= self.fan_in:
+                merged = levels[level][0]
+                for other in levels[level][1:]:
+                    merged.merge(other)
+                levels[level] = []
+                add(merged, level + 1)
+
+        window: List[str] = []
+        for chunk in self._chunks_with_tail(source):
+            if chunk is not None:
+                window.append(chunk)
+                if len(window) < self.window:
+                    continue
+            if not window:
+                continue
+            tasks = [
+                {"messages": self.analyzer._report_messages(text, full=True), "task": "analysis", "temperature": 0.3,
+                 "max_tokens": 2000}
+                for text in window
+            ]
+            for text, item in zip(window, self.client.batch_run(tasks)):
+                if item["error"]:
+                    errors += 1
+                else:
+                    add(_Partial.from_report(self.analyzer.parse_report(item["content"]), done, len(text)))
+                    usage.update({k: v for k, v in (item["usage"] or {}).items() if isinstance(v, int)})
+                done += 1
+                chars += len(text)
+            window = []
+            yield {"event": "progress", "chunks": done, "chars": chars, "errors": errors,
+                   "elapsed": round(time.perf_counter() - start, 3)}
+
+        result = _Partial()
+        for level in levels:
+            for part in level:
+                result.merge(part)
+        report = result.to_report()
+        report["meta"] = {
+            "mode": "mapreduce",
+            "chunks": done,
+            "chars": chars,
+            "errors": errors,
+            "usage": dict(usage),
+            "latency": time.perf_counter() - start
+        }
+        yield {"event": "done", "report": report}
+
+    def _chunks_with_tail(self, source) -> Iterator:
+        """分块迭代，末尾追加 None 以冲刷最后一个不满的窗口"""
+        yield from iter_chapters(source, max_chars=self.max_chars)
+        yield None
+
+    def analyze(self, source: Union[str, Iterable[str]], progress: Callable[[Dict], None] = None) -> Dict:
+        """整书分析，返回合并后的基因报告"""
+        for event in self.iter_analyze(source):
+            if event["event"] == "done":
+                return event["report"]
+            if progress:
+                progress(event)
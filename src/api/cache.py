@@ -0,0 +1,218 @@
+"""
+LLM 响应缓存
+以 (model, messages, temperature, max_tokens, 其他参数) 的哈希为键，SQLite 持久化
+支持条目数/字节数上限（LRU 淘汰）、TTL、按请求跳过缓存，以及命中统计
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from openai.types.chat import ChatCompletion
+
+# 不参与缓存键的传输层参数
+_NON_KEY_PARAMS = {"timeout", "extra_headers", "extra_query", "stream"}
+
+
+def make_cache_key(**params) -> str:
+    """计算请求的内容地址（规范化 JSON 的 sha256）"""
+    payload = {k: v for k, v in params.items() if k not in _NON_KEY_PARAMS and v is not None}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """基于 SQLite 的响应缓存"""
+
+    def __init__(
+        self,
+        path: str = "./data/response_cache.db",
+        max_entries: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl: float = 7 * 24 * 3600,
+        max_temperature: Optional[float] = 0.3
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self.conn.commit()
+        self._entries, self._bytes = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期视为未命中"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT value, size, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl and now - row[2] > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                self._entries -= 1
+                self._bytes -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        """写入缓存，超出上限时按最近访问时间淘汰"""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            if old:
+                self._bytes += size - old[0]
+            else:
+                self._entries += 1
+                self._bytes += size
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        while self._entries > self.max_entries or self._bytes > self.max_bytes:
+            batch = max(1, self._entries // 20)
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", [(r[0],) for r in rows])
+            self._entries -= len(rows)
+            self._bytes -= sum(r[1] for r in rows)
+            self.evictions += len(rows)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self._entries, self._bytes = 0, 0
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "evictions": self.evictions
+        }
+
+    # ============ ChatCompletion 读写 ============
+
+    def cacheable(self, params: Dict) -> bool:
+        """流式、多候选以及超过温度阈值（默认 0.3，None 为不限）的采样不缓存"""
+        if params.get("stream") or (params.get("n") or 1) > 1:
+            return False
+        temperature = params.get("temperature")
+        if self.max_temperature is not None and temperature is not None and temperature > self.max_temperature:
+            return False
+        return True
+
+    def get_response(self, params: Dict) -> Optional[ChatCompletion]:
+        value = self.get(make_cache_key(**params))
+        return ChatCompletion.model_validate_json(value) if value is not None else None
+
+    def put_response(self, params: Dict, response: Any):
+        if isinstance(response, ChatCompletion):
+            self.set(make_cache_key(**params), response.model_dump_json())
+
+
+class CachedCompletions:
+    """包装 client.chat.completions，使 create() 经过缓存；use_cache=False 跳过"""
+
+    def __init__(self, completions, cache: Optional[ResponseCache]):
+        self._completions = completions
+        self.cache = cache
+
+    def create(self, use_cache: bool = True, **params):
+        if not (self.cache and use_cache and self.cache.cacheable(params)):
+            return self._completions.create(**params)
+        response = self.cache.get_response(params)
+        if response is None:
+            response = self._completions.create(**params)
+            self.cache.put_response(params, response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _CachedChat:
+    def __init__(self, chat, cache):
+        self._chat = chat
+        self.completions = CachedCompletions(chat.completions, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class CachedClient:
+    """OpenAI 客户端代理：chat.completions.create 走缓存，其余属性原样转发"""
+
+    def __init__(self, client, cache: Optional[ResponseCache]):
+        self._client = client
+        self.chat = _CachedChat(client.chat, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def cached_client(client, cache: Optional[ResponseCache] = None):
+    """为 OpenAI 客户端挂上响应缓存（未启用缓存时原样返回）"""
+    cache = cache or get_response_cache()
+    return CachedClient(client, cache) if cache else client
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取共享缓存实例，需设置 RESPONSE_CACHE=1 启用；RESPONSE_CACHE_MAX_TEMPERATURE 默认 0.3，置空则不限温度"""
+    global _cache
+    if _cache is None and os.getenv("RESPONSE_CACHE", "0").lower() in ("1", "true", "yes"):
+        max_temperature = os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0.3")
+        _cache = ResponseCache(
+            path=os.getenv("RESPONSE_CACHE_PATH", "./data/response_cache.db"),
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600))),
+            max_temperature=float(max_temperature) if max_temperature else None
+        )
+    return _cache
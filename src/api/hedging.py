@@ -0,0 +1,348 @@
+"""
+对冲请求（hedging）
+首个请求在「近期首 token 延迟（TTFT）的 p 分位」内还没有吐出首个 token 时，再发一个备份请求（同模型或回退链中的下一个模型），
+谁先出首 token 就用谁，另一个立即关闭。对冲次数受预算约束：每个请求存入 budget 个令牌，对冲一次花费 1 个，
+长期对冲比例不超过 budget（默认 5%），不会让调用量翻倍。
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+
+def hedging_enabled() -> bool:
+    """交互式接口是否启用对冲（HEDGE=1）"""
+    return os.getenv("HEDGE", "0") == "1"
+
+
+class TTFTTracker:
+    """最近 window 次首 token 延迟的滑动窗口"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class HedgeBudget:
+    """对冲令牌桶：每个请求存入 ratio 个令牌（上限 burst），每次对冲花费 1 个"""
+
+    def __init__(self, ratio: float = 0.05, burst: float = 5):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def _has_content(chunk) -> bool:
+    return any(choice.delta and choice.delta.content for choice in getattr(chunk, "choices", None) or [])
+
+
+def _close(stream):
+    close = getattr(stream, "close", None)
+    if close:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _discard(attempt, stream=None):
+    """关闭落败请求的流，并调用其归还回调（attempt 的第三项，用于退还限速器预占）"""
+    if stream is not None:
+        _close(stream)
+    if len(attempt) > 2 and attempt[2]:
+        attempt[2]()
+
+
+async def _aclose(stream):
+    close = getattr(stream, "close", None)
+    if close:
+        try:
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
+        except Exception:
+            pass
+
+
+class ReplayStream:
+    """先回放已读取的分块，再继续读上游；close() 关闭上游"""
+
+    def __init__(self, stream, buffered: List):
+        self.stream = stream
+        self.buffered = deque(buffered)
+        self._iter = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.buffered:
+            return self.buffered.popleft()
+        return next(self._iter)
+
+    def close(self):
+        _close(self.stream)
+
+
+class AsyncReplayStream:
+    """ReplayStream 的异步版本"""
+
+    def __init__(self, stream, buffered: List):
+        self.stream = stream
+        self.buffered = deque(buffered)
+        self._iter = stream.__aiter__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.buffered:
+            return self.buffered.popleft()
+        return await self._iter.__anext__()
+
+    async def close(self):
+        await _aclose(self.stream)
+
+
+class Hedger:
+    """按模型维护 TTFT 分布，决定何时发出备份请求"""
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_delay: float = 0.2,
+        min_samples: int = 20,
+        budget: HedgeBudget = None
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget or HedgeBudget()
+        self.trackers: Dict[str, TTFTTracker] = {}
+        self.counts = {"requests": 0, "hedged": 0, "backup_wins": 0, "denied": 0}
+        self._lock = threading.Lock()
+
+    def tracker(self, model: str) -> TTFTTracker:
+        with self._lock:
+            return self.trackers.setdefault(model, TTFTTracker())
+
+    def delay(self, model: str) -> Optional[float]:
+        """发出备份请求前的等待秒数；样本不足时返回 None（不对冲）"""
+        tracker = self.tracker(model)
+        if len(tracker.samples) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _first_token(self, model: str, opener: Callable):
+        """打开流并读到首个含内容的分块，返回 (流, 已读分块)"""
+        start = time.perf_counter()
+        stream = opener()
+        buffered = []
+        try:
+            for chunk in stream:
+                buffered.append(chunk)
+                if _has_content(chunk):
+                    break
+        except BaseException:
+            _close(stream)
+            raise
+        self.tracker(model).observe(time.perf_counter() - start)
+        return stream, buffered
+
+    async def _first_token_async(self, model: str, opener: Callable):
+        start = time.perf_counter()
+        stream = None
+        buffered = []
+        try:
+            stream = await opener()
+            async for chunk in stream:
+                buffered.append(chunk)
+                if _has_content(chunk):
+                    break
+        except asyncio.CancelledError:
+            # 落败被取消的慢请求按已等待时间记一个样本，避免分位数只统计到快请求
+            self.tracker(model).observe(time.perf_counter() - start)
+            if stream is not None:
+                await _aclose(stream)
+            raise
+        except BaseException:
+            if stream is not None:
+                await _aclose(stream)
+            raise
+        self.tracker(model).observe(time.perf_counter() - start)
+        return stream, buffered
+
+    def race(self, attempts: List) -> ReplayStream:
+        """attempts 为 [(模型, 打开流的函数[, 落败回调])]，第一个为主请求，第二个为备份
+
+        落败的一方关闭后调用其落败回调；请求在工作线程中带着调用方的 contextvars（追踪上下文等）执行
+        """
+        self._count("requests")
+        self.budget.deposit()
+        model, opener = attempts[0][:2]
+        delay = self.delay(model)
+        if delay is None or len(attempts) < 2:
+            return ReplayStream(*self._first_token(model, opener))
+
+        pool = ThreadPoolExecutor(max_workers=2)
+        primary = pool.submit(contextvars.copy_context().run, self._first_token, model, opener)
+        try:
+            done, _ = wait([primary], timeout=delay)
+            if done or not self.budget.spend():
+                if not done:
+                    self._count("denied")
+                return ReplayStream(*primary.result())
+            self._count("hedged")
+            backup = pool.submit(contextvars.copy_context().run, self._first_token, *attempts[1][:2])
+            futures = {primary: attempts[0], backup: attempts[1]}
+            pending = {primary, backup}
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winners = [f for f in (primary, backup) if f in done and f.exception() is None]
+                error = error or next((f.exception() for f in done if f.exception() is not None), None)
+                if not winners:
+                    continue
+                # 胜者确定后，落败的一方（已返回的立即、未返回的在打开后）关闭
+                for loser in winners[1:]:
+                    _discard(futures[loser], loser.result()[0])
+                for loser in pending:
+                    loser.add_done_callback(
+                        lambda f: f.exception() is None and _discard(futures[f], f.result()[0])
+                    )
+                if winners[0] is backup:
+                    self._count("backup_wins")
+                return ReplayStream(*winners[0].result())
+            raise error
+        finally:
+            pool.shutdown(wait=False)
+
+    async def race_async(self, attempts: List) -> AsyncReplayStream:
+        """race 的异步版本，打开流的函数返回协程；落败的请求被取消"""
+        self._count("requests")
+        self.budget.deposit()
+        model, opener = attempts[0][:2]
+        delay = self.delay(model)
+        if delay is None or len(attempts) < 2:
+            return AsyncReplayStream(*await self._first_token_async(model, opener))
+
+        primary = asyncio.ensure_future(self._first_token_async(model, opener))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done or not self.budget.spend():
+            if not done:
+                self._count("denied")
+            return AsyncReplayStream(*await primary)
+        self._count("hedged")
+        backup = asyncio.ensure_future(self._first_token_async(*attempts[1][:2]))
+        tasks = {primary: attempts[0], backup: attempts[1]}
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [t for t in (primary, backup) if t in done and t.exception() is None]
+                error = error or next((t.exception() for t in done if t.exception() is not None), None)
+                if not winners:
+                    continue
+                for loser in winners[1:]:
+                    await _aclose(loser.result()[0])
+                    _discard(tasks[loser])
+                if winners[0] is backup:
+                    self._count("backup_wins")
+                return AsyncReplayStream(*winners[0].result())
+            raise error
+        finally:
+            # 备份任务在首次 wait 时已开始执行（已预占限速），被取消的一方同样需要归还
+            for task in pending:
+                task.cancel()
+                _discard(tasks[task])
+
+    def stats(self) -> Dict:
+        return {
+            **self.counts,
+            "hedge_rate": round(self.counts["hedged"] / self.counts["requests"], 4) if self.counts["requests"] else 0.0,
+            "budget_tokens": round(self.budget.tokens, 2),
+            "delay": {model: self.delay(model) for model in self.trackers}
+        }
+
+
+def collect(stream, model: str = None):
+    """把流式分块拼成一个 ChatCompletion（供非流式调用方使用）"""
+    from openai.types.chat import ChatCompletion
+    return _completion(ChatCompletion, list(stream), model)
+
+
+async def collect_async(stream, model: str = None):
+    from openai.types.chat import ChatCompletion
+    return _completion(ChatCompletion, [chunk async for chunk in stream], model)
+
+
+def _completion(cls, chunks: List, model: str = None):
+    text, finish_reason, usage = [], None, None
+    for chunk in chunks:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage.model_dump()
+        for choice in chunk.choices:
+            if choice.delta and choice.delta.content:
+                text.append(choice.delta.content)
+            finish_reason = choice.finish_reason or finish_reason
+    first = chunks[0] if chunks else None
+    return cls.model_validate({
+        "id": getattr(first, "id", "hedged"),
+        "object": "chat.completion",
+        "created": getattr(first, "created", int(time.time())),
+        "model": getattr(first, "model", None) or model or "",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(text)},
+            "finish_reason": finish_reason or "stop"
+        }],
+        "usage": usage
+    })
+
+
+_hedger: Optional[Hedger] = None
+
+
+def get_hedger() -> Hedger:
+    """进程内共享的对冲器（HEDGE_PERCENTILE / HEDGE_MIN_DELAY / HEDGE_MIN_SAMPLES / HEDGE_BUDGET 配置）"""
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger(
+            percentile=float(os.getenv("HEDGE_PERCENTILE", "0.95")),
+            min_delay=float(os.getenv("HEDGE_MIN_DELAY", "0.2")),
+            min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+            budget=HedgeBudget(ratio=float(os.getenv("HEDGE_BUDGET", "0.05")))
+        )
+    return _hedger
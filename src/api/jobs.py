@@ -0,0 +1,438 @@
+"""
+后台任务队列
+SQLite 持久化队列 + 工作线程池：长时间生成（整书、大纲、章节、润色）脱离 HTTP 请求执行，
+客户端轮询或订阅事件获取进度与阶段结果；支持优先级、取消与失败重试（整书任务按检查点续跑）
+
+独立运行工作进程：python -m src.api.jobs --workers 4
+"""
+from typing import Callable, Dict, List, Optional
+import argparse
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """任务被取消（由进度回调抛出，中断生成）"""
+
+
+class LeaseLost(Exception):
+    """续租失败：任务已被其他工作进程重新领取（由进度回调抛出，中断生成且不写回结果）"""
+
+
+class JobQueue:
+    """SQLite 任务队列（多进程安全：领取任务用 BEGIN IMMEDIATE 串行化）"""
+
+    def __init__(self, path: str = None, lease: float = 60.0):
+        self.path = path or os.getenv("JOBS_DB_PATH", "./data/jobs.db")
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lease = lease
+        self._local = threading.local()
+        conn = self.conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                available_at REAL NOT NULL,
+                lease_until REAL,
+                worker TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority DESC, created);
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_events ON job_events(job_id, id);
+        """)
+        conn.commit()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    # ============ 提交与查询 ============
+
+    def submit(self, kind: str, params: Dict, priority: int = 0, max_attempts: int = 3) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO jobs (id, kind, params, priority, status, max_attempts, available_at, created) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(params, ensure_ascii=False), priority, max_attempts, now, now)
+        )
+        self.add_event(job_id, "queued", {"priority": priority})
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def events(self, job_id: str, after: int = 0, limit: int = 100) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT id, event, data, created FROM job_events WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (job_id, after, limit)
+        ).fetchall()
+        return [{"id": r["id"], "event": r["event"], "data": json.loads(r["data"]), "created": r["created"]}
+                for r in rows]
+
+    def add_event(self, job_id: str, event: str, data: Dict = None):
+        self.conn.execute(
+            "INSERT INTO job_events (job_id, event, data, created) VALUES (?, ?, ?, ?)",
+            (job_id, event, json.dumps(data or {}, ensure_ascii=False), time.time())
+        )
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in STATUSES} | {r[0]: r[1] for r in rows}
+
+    # ============ 工作进程 ============
+
+    def claim(self, worker: str, kinds: List[str] = None) -> Optional[Dict]:
+        """领取优先级最高的可执行任务（租约过期的运行中任务视为工作进程已退出，重新领取）"""
+        now = time.time()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 工作进程退出前已请求取消的任务直接结束
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ?, lease_until = NULL "
+                "WHERE status = 'running' AND lease_until < ? AND cancel_requested = 1",
+                (now, now)
+            )
+            # 租约过期且已用完重试次数（例如每次都让工作进程崩溃）的任务标记失败，不再无限重领
+            exhausted = conn.execute(
+                "SELECT id, attempts FROM jobs WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (now,)
+            ).fetchall()
+            for job_id, attempts in exhausted:
+                error = f"租约过期（工作进程退出），已尝试 {attempts} 次"
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished = ?, lease_until = NULL WHERE id = ?",
+                    (error, now, job_id)
+                )
+                self.add_event(job_id, "failed", {"error": error})
+            sql = ("SELECT * FROM jobs WHERE ((status = 'queued' AND available_at <= ?) "
+                   "OR (status = 'running' AND lease_until < ?)) AND cancel_requested = 0")
+            params: List = [now, now]
+            if kinds:
+                sql += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+                params += list(kinds)
+            row = conn.execute(sql + " ORDER BY priority DESC, created LIMIT 1", params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?) WHERE id = ?",
+                (worker, now + self.lease, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        job = self.get(row["id"])
+        self.add_event(job["id"], "started", {"worker": worker, "attempt": job["attempts"]})
+        return job
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """续租，返回 False 表示任务已不属于该工作进程"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease, job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def _owned(self, worker: Optional[str]):
+        """结束任务的条件：仍在运行，且（指定 worker 时）租约仍属于该工作进程"""
+        if worker is None:
+            return " AND status = 'running'", []
+        return " AND status = 'running' AND worker = ? AND lease_until >= ?", [worker, time.time()]
+
+    def complete(self, job_id: str, result, worker: str = None) -> bool:
+        """标记成功；返回 False 表示任务已不属于该工作进程（租约过期被重新领取），结果未写入"""
+        guard, params = self._owned(worker)
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, finished = ?, lease_until = NULL "
+            "WHERE id = ?" + guard,
+            [json.dumps(result, ensure_ascii=False), time.time(), job_id] + params
+        )
+        if cursor.rowcount:
+            self.add_event(job_id, "succeeded", {})
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, error: str, backoff: float = 5.0, retry: bool = True, worker: str = None) -> bool:
+        """失败：未达最大次数则按指数退避重新排队，否则标记失败；retry=False 时直接标记失败
+
+        返回 False 表示任务已不属于该工作进程，状态未改动
+        """
+        job = self.get(job_id)
+        guard, params = self._owned(worker)
+        if retry and job["attempts"] < job["max_attempts"]:
+            delay = backoff * 2 ** (job["attempts"] - 1)
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, lease_until = NULL WHERE id = ?" + guard,
+                [error, time.time() + delay, job_id] + params
+            )
+            if cursor.rowcount:
+                self.add_event(job_id, "retrying", {"error": error, "attempt": job["attempts"], "delay": delay})
+        else:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ?, lease_until = NULL WHERE id = ?" + guard,
+                [error, time.time(), job_id] + params
+            )
+            if cursor.rowcount:
+                self.add_event(job_id, "failed", {"error": error})
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """取消任务：排队中的直接取消，运行中的标记后由工作进程在下一个进度点中断；返回取消后的状态"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job["status"] in FINAL_STATUSES:
+            return job["status"]
+        self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        )
+        if cursor.rowcount:
+            self.add_event(job_id, "cancelled", {})
+            return "cancelled"
+        return "cancelling"
+
+    def mark_cancelled(self, job_id: str, worker: str = None) -> bool:
+        guard, params = self._owned(worker)
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished = ?, lease_until = NULL WHERE id = ?" + guard,
+            [time.time(), job_id] + params
+        )
+        if cursor.rowcount:
+            self.add_event(job_id, "cancelled", {})
+        return cursor.rowcount == 1
+
+    def cancel_requested(self, job_id: str) -> bool:
+        row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+
+# ============ 任务处理函数 ============
+
+class JobContext:
+    """传给处理函数：上报进度/阶段结果，并在取消时中断"""
+
+    def __init__(self, queue: JobQueue, job: Dict, lost: threading.Event = None):
+        self.queue = queue
+        self.job = job
+        self.lost = lost or threading.Event()
+
+    def emit(self, event: str, data: Dict = None):
+        if self.lost.is_set():
+            raise LeaseLost()
+        if self.queue.cancel_requested(self.job["id"]):
+            raise JobCancelled()
+        self.queue.add_event(self.job["id"], event, data)
+
+
+def _generator():
+    from src.api.minimax_client import get_client
+    from src.generator.novel import NovelGenerator
+    return NovelGenerator(get_client())
+
+
+def run_book(params: Dict, ctx: JobContext) -> Dict:
+    """整书生成：run_id 取任务 ID，重试时从检查点续跑，只重做失败的步骤"""
+    from src.generator.pipeline import CheckpointStore
+
+    store = CheckpointStore()
+    run_id = ctx.job["id"]
+
+    def progress(stage: str, num: int, status: str):
+        data = {"stage": stage, "num": num, "status": status}
+        if status == "done" and stage in ("outline", "beats", "chapter", "polish"):
+            data["content"] = store.get(run_id, stage, "" if stage == "outline" else num)
+        ctx.emit("progress", data)
+
+    return _generator().generate_book(**params, run_id=run_id, store=store, progress=progress)
+
+
+def run_outline(params: Dict, ctx: JobContext) -> Dict:
+    return _generator().generate_outline(**params)
+
+
+def run_chapter(params: Dict, ctx: JobContext) -> Dict:
+    return {"content": _generator().generate_chapter(**params)}
+
+
+def run_polish(params: Dict, ctx: JobContext) -> Dict:
+    return {"content": _generator().polish_chapter(**params)}
+
+
+# 各任务类型的参数对应的 NovelGenerator 方法，以及由处理函数提供、不接受客户端传入的参数
+TARGETS = {
+    "book": ("generate_book", ("run_id", "store", "progress")),
+    "outline": ("generate_outline", ()),
+    "chapter": ("generate_chapter", ("memory",)),
+    "polish": ("polish_chapter", ())
+}
+
+
+def validate_params(kind: str, params: Dict):
+    """按处理函数调用的生成器方法签名检查参数（提交时调用），不匹配时抛出 ValueError"""
+    if kind not in TARGETS:
+        return
+    from src.generator.novel import NovelGenerator
+
+    method, reserved = TARGETS[kind]
+    fixed = [name for name in params if name in reserved]
+    if fixed:
+        raise ValueError(f"参数 {fixed} 由任务自动提供，不能指定")
+    try:
+        inspect.signature(getattr(NovelGenerator, method)).bind(None, **params)
+    except TypeError as e:
+        raise ValueError(f"{kind} 任务参数无效: {e}") from None
+
+
+HANDLERS: Dict[str, Callable[[Dict, JobContext], Dict]] = {
+    "book": run_book,
+    "outline": run_outline,
+    "chapter": run_chapter,
+    "polish": run_polish
+}
+
+
+class Worker:
+    """工作线程池：领取 → 执行 → 完成/重试，运行期间定时续租"""
+
+    def __init__(self, queue: JobQueue = None, concurrency: int = 1, poll: float = 1.0,
+                 handlers: Dict[str, Callable] = None):
+        self.queue = queue or JobQueue()
+        self.concurrency = concurrency
+        self.poll = poll
+        self.handlers = handlers or HANDLERS
+        self.name = f"{os.uname().nodename if hasattr(os, 'uname') else 'worker'}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(f"{self.name}:{i}",), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _loop(self, worker: str):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(worker, list(self.handlers))
+            except sqlite3.OperationalError as e:  # 数据库繁忙，稍后再试
+                logger.warning("领取任务失败: %s", e)
+                job = None
+            if job is None:
+                self._stop.wait(self.poll)
+                continue
+            self.run_job(job, worker)
+
+    def run_job(self, job: Dict, worker: str):
+        done = threading.Event()
+        lost = threading.Event()
+
+        def keep_alive():
+            while not done.wait(self.queue.lease / 3):
+                if not self.queue.renew(job["id"], worker):
+                    # 租约已失效：在下一个进度点中断，结果交给新的领取者
+                    lost.set()
+                    return
+
+        threading.Thread(target=keep_alive, daemon=True).start()
+        try:
+            result = self.handlers[job["kind"]](job["params"], JobContext(self.queue, job, lost))
+            if not self.queue.complete(job["id"], result, worker=worker):
+                logger.warning("任务 %s 的租约已失效，结果未写入", job["id"])
+        except LeaseLost:
+            logger.warning("任务 %s 的租约已失效，已中断", job["id"])
+        except JobCancelled:
+            self.queue.mark_cancelled(job["id"], worker=worker)
+        except Exception as e:
+            logger.exception("任务 %s 失败", job["id"])
+            if self.queue.cancel_requested(job["id"]):
+                self.queue.mark_cancelled(job["id"], worker=worker)
+            else:
+                # 参数与处理函数不匹配（TypeError）重试也不会成功
+                self.queue.fail(job["id"], f"{type(e).__name__}: {e}", retry=not isinstance(e, TypeError),
+                                worker=worker)
+        finally:
+            done.set()
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+    return _queue
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后台任务工作进程")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS", "2")))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    pool = Worker(get_job_queue(), concurrency=args.workers)
+    pool.start()
+    print(f"工作进程已启动（{args.workers} 线程），Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -1,20 +1,55 @@
 """
 zhilinainovel - AI小说创作助手
 """
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Dict
+import asyncio
 import os
-from openai import OpenAI
+import time
+from src.api import metrics
+from src.api.cache import get_response_cache
+from src.api.jobs import FINAL_STATUSES, HANDLERS, Worker, get_job_queue, validate_params
+from src.api.hedging import hedging_enabled
+from src.api.minimax_client import AsyncMiniMaxClient, get_client
+from src.api.resilience import CircuitOpenError
+from src.api.streaming import sse, stream_events
+from src.analyzer.gene import GeneAnalyzer
+from src.analyzer.mapreduce import MapReduceAnalyzer
+from src.database.db import GENE_TYPES, get_database
+from src.database.rankings import get_ranking_store
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from src.api.transport import close_async_http_client
 
-# 配置
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL", "https://api.minimax.chat/v1")
-)
-MODEL = os.getenv("MODEL", "MiniMax-M2.5")
+# 共享的异步 LLM 客户端（连接池由 src.api.transport 管理）
+llm: Optional[AsyncMiniMaxClient] = None
 
-app = FastAPI(title="zhilinainovel", description="AI小说创作助手")
+def get_llm() -> AsyncMiniMaxClient:
+    global llm
+    if llm is None:
+        llm = AsyncMiniMaxClient()
+    return llm
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时建立共享连接池与进程内任务工作线程（JOB_WORKERS=0 时只接收任务，由独立工作进程执行），关闭时释放"""
+    global llm
+    get_llm()
+    workers = int(os.getenv("JOB_WORKERS", "1"))
+    worker = Worker(get_job_queue(), concurrency=workers) if workers > 0 else None
+    if worker:
+        worker.start()
+    yield
+    if worker:
+        worker.stop(timeout=5)
+    llm = None
+    await close_async_http_client()
+    metrics.mark_process_dead()
+
+app = FastAPI(title="zhilinainovel", description="AI小说创作助手", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # ============ 数据模型 ============
 
@@ -33,14 +68,20 @@ class GenerateChapterRequest(BaseModel):
     previous_content: str
     style_genes: Optional[dict] = None
 
+class JobRequest(BaseModel):
+    kind: str  # book/outline/chapter/polish，params 为对应 NovelGenerator 方法的参数
+    params: Dict = {}
+    priority: int = 0
+    max_attempts: int = 3
+
 # ============ API 接口 ============
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "zhilinainovel API", "version": "0.1.0"}
 
 @app.post("/api/analyze")
-def analyze_novel(req: AnalyzeRequest):
+async def analyze_novel(req: AnalyzeRequest):
     """分析小说内容，提取基因"""
     prompt = f"""请分析以下小说内容，提取其"成功基因"：
     
@@ -54,8 +95,8 @@ def analyze_novel(req: AnalyzeRequest):
     {req.content[:2000]}
     """
     
-    response = client.chat.completions.create(
-        model=MODEL,
+    response = await get_llm().chat(
+        task="analysis",
         messages=[
             {"role": "system", "content": "你是一个资深网文分析师，擅长拆解热门小说的成功要素。"},
             {"role": "user", "content": prompt}
@@ -68,9 +109,18 @@ def analyze_novel(req: AnalyzeRequest):
         "genre": req.genre
     }
 
-@app.post("/api/generate/story")
-def generate_story(req: GenerateStoryRequest):
-    """生成小说大纲"""
+@app.post("/api/analyze/full")
+async def analyze_novel_full(req: AnalyzeRequest):
+    """整书 map-reduce 分析（SSE：progress 事件若干，最后 done 事件携带基因报告）"""
+    analyzer = MapReduceAnalyzer(GeneAnalyzer(get_client()))
+    
+    async def events():
+        async for event in iterate_in_threadpool(analyzer.iter_analyze(req.content)):
+            yield sse(event.pop("event"), event)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _story_messages(req: GenerateStoryRequest) -> List[Dict]:
     prompt = f"""请为以下设定生成一个小说大纲：
     
     - 题材：{req.genre}
@@ -84,25 +134,12 @@ def generate_story(req: GenerateStoryRequest):
     3. 关键转折点
     4. 预计章节数
     """
-    
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": "你是一个专业的小说大纲师，擅长构思吸引人的故事。"},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1500
-    )
-    
-    return {
-        "outline": response.choices[0].message.content,
-        "genre": req.genre,
-        "length": req.length
-    }
+    return [
+        {"role": "system", "content": "你是一个专业的小说大纲师，擅长构思吸引人的故事。"},
+        {"role": "user", "content": prompt}
+    ]
 
-@app.post("/api/generate/chapter")
-def generate_chapter(req: GenerateChapterRequest):
-    """续写章节"""
+def _chapter_messages(req: GenerateChapterRequest) -> List[Dict]:
     prompt = f"""请根据以下大纲和前文，续写下一章内容：
     
     大纲：{req.outline}
@@ -114,28 +151,228 @@ def generate_chapter(req: GenerateChapterRequest):
     - 节奏明快
     - 爽点清晰
     """
+    return [
+        {"role": "system", "content": "你是一个网文写手，擅长写吸引人的章节。"},
+        {"role": "user", "content": prompt}
+    ]
+
+async def _stream_response(
+    request: Request,
+    messages: List[Dict],
+    max_tokens: int,
+    task: str,
+    hedge: bool = False
+) -> StreamingResponse:
+    """以 SSE 形式返回流式生成结果"""
+    start = time.perf_counter()
+    stream = await get_llm().chat(
+        task=task,
+        messages=messages,
+        max_tokens=max_tokens,
+        hedge=hedge,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    return StreamingResponse(
+        stream_events(stream, request, start),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/generate/story")
+async def generate_story(req: GenerateStoryRequest):
+    """生成小说大纲"""
+    response = await get_llm().chat(
+        task="outline",
+        messages=_story_messages(req),
+        max_tokens=1500
+    )
     
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": "你是一个网文写手，擅长写吸引人的章节。"},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=2000
+    return {
+        "outline": response.choices[0].message.content,
+        "genre": req.genre,
+        "length": req.length
+    }
+
+@app.post("/api/generate/story/stream")
+async def generate_story_stream(req: GenerateStoryRequest, request: Request):
+    """生成小说大纲（SSE 流式）"""
+    return await _stream_response(request, _story_messages(req), max_tokens=1500, task="outline")
+
+@app.post("/api/generate/chapter")
+async def generate_chapter(req: GenerateChapterRequest):
+    """续写章节"""
+    response = await get_llm().chat(
+        task="chapter",
+        messages=_chapter_messages(req),
+        max_tokens=2000,
+        hedge=hedging_enabled()
     )
     
     return {
         "chapter": response.choices[0].message.content
     }
 
+@app.post("/api/generate/chapter/stream")
+async def generate_chapter_stream(req: GenerateChapterRequest, request: Request):
+    """续写章节（SSE 流式）"""
+    return await _stream_response(
+        request, _chapter_messages(req), max_tokens=2000, task="chapter", hedge=hedging_enabled()
+    )
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """响应缓存命中统计"""
+    cache = get_response_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+@app.get("/api/singleflight/stats")
+async def singleflight_stats():
+    """在途请求合并统计（saved 为合并掉的上游调用数）"""
+    from src.api.singleflight import get_async_singleflight, get_singleflight
+    return {"async": get_async_singleflight().stats(), "sync": get_singleflight().stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus 指标（需安装 prometheus_client；多 worker 时设置 PROMETHEUS_MULTIPROC_DIR）"""
+    if not metrics.enabled():
+        raise HTTPException(status_code=503, detail="未安装 prometheus_client")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/api/resilience/stats")
+async def resilience_stats():
+    """重试次数、自适应并发上限与各模型熔断状态"""
+    return get_llm().resilience.stats()
+
+@app.get("/api/hedging/stats")
+async def hedging_stats():
+    """对冲请求：触发次数、备份胜出次数、剩余预算与各模型当前对冲阈值"""
+    return get_llm().hedger.stats()
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """候选模型全部熔断时快速失败，提示客户端稍后重试"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(int(exc.retry_in) + 1)})
+
+@app.get("/api/router/stats")
+async def router_stats():
+    """模型路由：各模型上下文、成本与观测延迟（EWMA）"""
+    return get_llm().router.stats()
+
+# 基因库、排行榜与任务队列的查询都是同步的 SQLite / 文件读取，用普通 def 定义，由 FastAPI 放到线程池执行
+
 @app.get("/api/genes")
-def get_genes(genre: Optional[str] = None):
-    """获取基因库"""
-    # TODO: 连接数据库获取
-    return {
-        "message": "基因库功能开发中",
-        "genre": genre
-    }
+def get_genes(
+    genre: Optional[str] = None,
+    source: Optional[str] = None,
+    cursor: int = 0,
+    limit: int = 50
+):
+    """获取基因库（游标分页：把返回的 next_cursor 作为下一页的 cursor）"""
+    return get_database().list_genes(genre=genre, source=source, cursor=cursor, limit=limit)
+
+@app.get("/api/genes/search")
+def search_genes(q: str, type: Optional[str] = None, genre: Optional[str] = None, limit: int = 20):
+    """在金句与爽点中全文检索"""
+    return {"items": get_database().search_text(q, gene_type=type, genre=genre, limit=limit)}
+
+@app.get("/api/genes/{gene_type}")
+def get_genes_by_type(
+    gene_type: str,
+    genre: Optional[str] = None,
+    cursor: int = 0,
+    limit: int = 50
+):
+    """获取特定类型基因（genre/knowledge/report/excitement/sentence）"""
+    if gene_type not in GENE_TYPES:
+        raise HTTPException(status_code=404, detail=f"未知的基因类型: {gene_type}")
+    return get_database().list_genes(gene_type=gene_type, genre=genre, cursor=cursor, limit=limit)
+
+@app.get("/api/rankings/risers")
+def ranking_risers(
+    category: Optional[str] = None,
+    days: float = 7,
+    limit: int = 50,
+    site: Optional[str] = None,
+    list_name: Optional[str] = None
+):
+    """近 days 天名次上升最多的作品（category 可用中文题材名，如 玄幻）"""
+    limit = max(1, min(limit, 500))
+    return {"items": get_ranking_store().risers(category, days=days, limit=limit, site=site, list_name=list_name)}
+
+@app.get("/api/rankings/titles")
+def ranking_titles(q: str, limit: int = 20):
+    """按书名查找榜单作品"""
+    return {"items": get_ranking_store().find_titles(q, limit=limit)}
+
+@app.get("/api/rankings/titles/{title_id}")
+def ranking_history(title_id: int, days: Optional[float] = None):
+    """作品的名次历史"""
+    history = get_ranking_store().history(title_id, days=days)
+    if not history:
+        raise HTTPException(status_code=404, detail=f"未知的作品: {title_id}")
+    return history
+
+@app.post("/api/jobs")
+def submit_job(req: JobRequest):
+    """提交后台任务，立即返回 job_id"""
+    if req.kind not in HANDLERS:
+        raise HTTPException(status_code=400, detail=f"未知的任务类型: {req.kind}，可选 {list(HANDLERS)}")
+    try:
+        validate_params(req.kind, req.params)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    job_id = get_job_queue().submit(req.kind, req.params, priority=req.priority, max_attempts=req.max_attempts)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/api/jobs")
+def job_counts():
+    """各状态任务数"""
+    return get_job_queue().counts()
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """任务状态与结果"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"未知的任务: {job_id}")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+def get_job_events(job_id: str, after: int = 0, limit: int = 100):
+    """轮询任务事件（进度与阶段结果），把返回的 next 作为下一次的 after"""
+    items = get_job_queue().events(job_id, after=after, limit=max(1, min(limit, 1000)))
+    return {"items": items, "next": items[-1]["id"] if items else after}
+
+@app.get("/api/jobs/{job_id}/stream")
+async def stream_job(job_id: str, request: Request, after: int = 0):
+    """订阅任务事件（SSE），任务结束后关闭"""
+    queue = get_job_queue()
+    if await run_in_threadpool(queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"未知的任务: {job_id}")
+
+    async def events():
+        cursor = after
+        while not await request.is_disconnected():
+            items = await run_in_threadpool(queue.events, job_id, after=cursor)
+            for item in items:
+                cursor = item["id"]
+                yield sse(item["event"], {"id": item["id"], **item["data"]})
+            if not items:
+                if (await run_in_threadpool(queue.get, job_id))["status"] in FINAL_STATUSES:
+                    return
+                await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """取消任务"""
+    status = get_job_queue().cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"未知的任务: {job_id}")
+    return {"job_id": job_id, "status": status}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,234 @@
+"""
+Prometheus 指标
+- HTTP：各路由请求耗时（按路由模板聚合，不按实际路径）
+- LLM：各模型首 token 延迟、总耗时、排队等待、token 用量、finish_reason、缓存命中、重试、429、请求合并
+- 生成器：提示词组装耗时
+
+prometheus_client 为可选依赖，未安装时所有记录函数为空操作、/metrics 返回 503。
+多 worker 部署（uvicorn --workers N）时设置 PROMETHEUS_MULTIPROC_DIR 为一个启动前清空的目录，各进程写入共享的 mmap 文件，
+/metrics 汇总所有进程。
+"""
+from typing import Callable, Optional, Tuple
+import functools
+import os
+import time
+
+try:
+    import prometheus_client
+except ImportError:  # 可选依赖
+    prometheus_client = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30)
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+
+class _Noop:
+    """未安装 prometheus_client 时的占位指标"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+
+_NOOP = _Noop()
+
+
+def _metric(kind: str, name: str, documentation: str, labels=(), **kwargs):
+    if prometheus_client is None:
+        return _NOOP
+    return getattr(prometheus_client, kind)(name, documentation, labels, **kwargs)
+
+
+HTTP_DURATION = _metric("Histogram", "http_request_duration_seconds", "HTTP 请求耗时（流式接口为到响应头的时间）",
+                        ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+LLM_TTFT = _metric("Histogram", "llm_ttft_seconds", "LLM 首 token 延迟", ["model"], buckets=TTFT_BUCKETS)
+LLM_DURATION = _metric("Histogram", "llm_request_duration_seconds", "LLM 请求总耗时", ["model", "stream"],
+                       buckets=LATENCY_BUCKETS)
+LLM_QUEUE = _metric("Histogram", "llm_queue_seconds", "发出请求前在限速器上的等待", buckets=LATENCY_BUCKETS)
+LLM_TOKENS = _metric("Counter", "llm_tokens_total", "LLM token 用量", ["model", "kind"])
+LLM_FINISH = _metric("Counter", "llm_finish_reason_total", "LLM 结束原因", ["model", "reason"])
+LLM_CACHE = _metric("Counter", "llm_cache_requests_total", "响应缓存查询", ["result"])
+LLM_RETRIES = _metric("Counter", "llm_retries_total", "LLM 重试次数", ["model", "status"])
+LLM_RATE_LIMITED = _metric("Counter", "llm_rate_limited_total", "上游返回 429 的次数", ["model"])
+LLM_COALESCED = _metric("Counter", "llm_coalesced_total", "被合并到在途请求的调用数", ["stream"])
+PROMPT_BUILD = _metric("Histogram", "generator_prompt_build_seconds", "生成器组装提示词耗时", ["task"],
+                       buckets=FAST_BUCKETS)
+
+
+# ============ 记录 ============
+
+def observe_http(method: str, route: str, status: int, seconds: float):
+    HTTP_DURATION.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_usage(model: str, usage, finish_reason: Optional[str]):
+    if usage is not None:
+        LLM_TOKENS.labels(model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+        LLM_TOKENS.labels(model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+    if finish_reason:
+        LLM_FINISH.labels(model, finish_reason).inc()
+
+
+def observe_completion(model: str, response, start: float):
+    """非流式响应：总耗时、token 用量与 finish_reason"""
+    LLM_DURATION.labels(model, "false").observe(time.perf_counter() - start)
+    choices = getattr(response, "choices", None) or [None]
+    observe_usage(model, getattr(response, "usage", None), getattr(choices[0], "finish_reason", None))
+
+
+class _StreamObserver:
+    """流式响应逐块观察：首个含内容分块记 TTFT，结束时记总耗时、用量与 finish_reason"""
+
+    def __init__(self, model: str, start: float):
+        self.model = model
+        self.start = start
+        self.first = True
+        self.usage = None
+        self.finish_reason = None
+        self.done = False
+
+    def chunk(self, chunk):
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        for choice in chunk.choices:
+            if self.first and choice.delta and choice.delta.content:
+                self.first = False
+                LLM_TTFT.labels(self.model).observe(time.perf_counter() - self.start)
+            if choice.finish_reason:
+                self.finish_reason = choice.finish_reason
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            LLM_DURATION.labels(self.model, "true").observe(time.perf_counter() - self.start)
+            observe_usage(self.model, self.usage, self.finish_reason)
+
+
+class MeteredStream:
+    def __init__(self, stream, model: str, start: float):
+        self.stream = stream
+        self._iter = iter(stream)
+        self.observer = _StreamObserver(model, start)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._iter)
+        except StopIteration:
+            self.observer.finish()
+            raise
+        self.observer.chunk(chunk)
+        return chunk
+
+    def close(self):
+        self.observer.finish()
+        close = getattr(self.stream, "close", None)
+        if close:
+            close()
+
+
+class AsyncMeteredStream:
+    def __init__(self, stream, model: str, start: float):
+        self.stream = stream
+        self._iter = stream.__aiter__()
+        self.observer = _StreamObserver(model, start)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._iter.__anext__()
+        except StopAsyncIteration:
+            self.observer.finish()
+            raise
+        self.observer.chunk(chunk)
+        return chunk
+
+    async def close(self):
+        self.observer.finish()
+        close = getattr(self.stream, "close", None)
+        if close:
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
+
+
+def meter_stream(stream, model: str, start: float):
+    """包装流式响应以记录 TTFT 等指标；未安装 prometheus_client 时原样返回"""
+    if prometheus_client is None:
+        return stream
+    if hasattr(stream, "__aiter__"):
+        return AsyncMeteredStream(stream, model, start)
+    return MeteredStream(stream, model, start)
+
+
+def timed_prompt(task: str) -> Callable:
+    """装饰提示词组装函数，记录其耗时"""
+    def decorate(fn: Callable) -> Callable:
+        if prometheus_client is None:
+            return fn
+        histogram = PROMPT_BUILD.labels(task)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class MetricsMiddleware:
+    """ASGI 中间件：按路由模板记录请求耗时（到响应头发出为止）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or prometheus_client is None:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                route = getattr(scope.get("route"), "path", "unmatched")
+                observe_http(scope["method"], route, message["status"], time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, send_with_metrics)
+
+
+# ============ 导出 ============
+
+def enabled() -> bool:
+    return prometheus_client is not None
+
+
+def render() -> Tuple[bytes, str]:
+    """生成 /metrics 响应体（多进程模式下汇总所有 worker）"""
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int = None):
+    """worker 退出时清理其多进程指标文件"""
+    if prometheus_client is not None and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
+
@@ -2,13 +2,24 @@
 MiniMax 优化客户端
 充分利用 Coding Plus 套餐
 """
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import time
 
-class MiniMaxClient:
-    """MiniMax API 优化客户端"""
+from src.api import metrics, tracing
+from src.api.cache import ResponseCache, get_response_cache, make_cache_key
+from src.api.hedging import Hedger, collect, collect_async, get_hedger
+from src.api.ratelimit import RateLimiter, estimate_tokens, get_rate_limiter
+from src.api.resilience import Resilience, get_resilience, hold_stream
+from src.api.router import ModelRouter, fallback_worthy, get_router
+from src.api.singleflight import coalescible, get_async_singleflight, get_singleflight
+from src.api.transport import get_http_client, get_async_http_client
+
+class _BaseMiniMaxClient:
+    """同步/异步客户端共用的配置与请求构建"""
     
     # 推荐模型配置
     MODELS = {
@@ -19,13 +30,187 @@ class MiniMaxClient:
         "default": "MiniMax-M2.5"                # 默认
     }
     
-    def __init__(self, api_key: str = None, base_url: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        rate_limiter: RateLimiter = None,
+        response_cache: ResponseCache = None,
+        router: ModelRouter = None,
+        resilience: Resilience = None,
+        hedger: Hedger = None
+    ):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL", "https://api.minimax.chat/v1")
+        self.default_model = os.getenv("MODEL", self.MODELS["default"])
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.cache = response_cache or get_response_cache()
+        self.router = router or get_router(self.MODELS)
+        self.resilience = resilience or get_resilience()
+        self.hedger = hedger or get_hedger()
+        self.max_workers = int(os.getenv("MINIMAX_CONCURRENCY", "8"))
+    
+    def _prepare(
+        self,
+        messages: List[Dict],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stream: bool,
+        use_cache: bool,
+        task: Optional[str],
+        kwargs: Dict
+    ) -> Dict:
+        """构建请求参数，返回 {"params", "caching", "estimated", "flight", "models"}
+        
+        未指定 model 时按 task 路由，models 为首选模型 + 回退链；flight 为合并键，不可合并时为 None
+        """
+        estimated = estimate_tokens(messages, max_tokens)
+        models = [model] if model else self.router.route(task or "default", estimated, max_tokens)
+        params = dict(
+            model=models[0],
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=stream,
+            **kwargs
+        )
+        flight = None
+        if use_cache and coalescible(params):
+            flight = make_cache_key(**params) + (":stream" if stream else "")
+        return {
+            "params": params,
+            "caching": bool(self.cache and use_cache and self.cache.cacheable(params)),
+            "estimated": estimated,
+            "flight": flight,
+            "models": models
+        }
+    
+    def _hedge_attempts(self, plan: Dict, create: Callable) -> List:
+        """对冲请求列表 [(模型, 打开流的函数, 落败回调)]"""
+        return [(p["models"][0], lambda p=p: create(p), lambda p=p: self._discard(p)) for p in self._hedge_plans(plan)]
+
+    def _discard(self, plan: Dict):
+        """对冲落败的请求在首 token 前后即被关闭，输出几乎未生成：按 max_tokens 归还 TPM 预占（提示部分已实际发送，不退）
+
+        已打开的流在关闭时已按读到的分块结算，这里只处理未打开就被取消的请求
+        """
+        self._settle(plan, plan["estimated"] - (plan["params"]["max_tokens"] or 0))
+
+    def _settle(self, plan: Dict, actual: Optional[int]):
+        """结算本次请求的 TPM 预占（每个 plan 只结算一次）"""
+        if plan.get("settled"):
+            return
+        plan["settled"] = True
+        self.rate_limiter.settle(plan["estimated"], actual)
+
+    def _stream_done(self, plan: Dict, held) -> Callable:
+        """流结束（读完、出错或关闭）时归还在途名额，并按末尾用量分块或已读分块数结算 TPM"""
+        def done(error: Exception = None):
+            self.rate_limiter.leave(error)
+            usage = held[0].usage
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self._settle(plan, usage.total_tokens)
+            else:
+                # 没有用量分块时按每个分块约 1 个 token 估算输出
+                self._settle(plan, plan["estimated"] - (plan["params"]["max_tokens"] or 0) + held[0].chunks)
+        return done
+
+    def _hedge_plans(self, plan: Dict) -> List[Dict]:
+        """对冲的主请求与备份请求（内部总是流式、不合并）；备份默认同模型，HEDGE_BACKUP=alternate 时用回退链的下一个模型"""
+        models = plan["models"]
+        backup = models[1] if len(models) > 1 and os.getenv("HEDGE_BACKUP", "same") == "alternate" else models[0]
+        params = {**plan["params"], "stream": True}
+        params.setdefault("stream_options", {"include_usage": True})
+        return [
+            {**plan, "params": {**params, "model": model}, "caching": False,
+             "models": [model] + [m for m in models if m != model]}
+            for model in (models[0], backup)
+        ]
+    
+    def _fallback(self, plan: Dict, model: str, start: float, error: Exception) -> bool:
+        """记录失败并判断是否换下一个模型重试"""
+        self.router.observe(model, time.perf_counter() - start, plan["params"]["max_tokens"], error=True)
+        return model != plan["models"][-1] and fallback_worthy(error)
+    
+    def _observe(self, plan: Dict, model: str, start: float):
+        """记录成功调用的耗时（流式请求只到响应头，不计入延迟统计）"""
+        if not plan["params"]["stream"]:
+            self.router.observe(model, time.perf_counter() - start, plan["params"]["max_tokens"])
+    
+    def _finish(self, plan: Dict, response):
+        """请求完成后结算 TPM 预占并写入缓存（流式请求在流结束时由 _stream_done 结算）"""
+        if plan["params"]["stream"]:
+            return
+        usage = getattr(response, "usage", None)
+        self._settle(plan, usage.total_tokens if usage else None)
+        if plan["caching"]:
+            self.cache.put_response(plan["params"], response)
+    
+    @staticmethod
+    def _code_review_messages(code: str, language: str) -> List[Dict]:
+        return [
+            {"role": "system", "content": "你是一个资深代码审查专家。"},
+            {"role": "user", "content": f"请审查以下{language}代码，指出问题并给出优化建议：\n\n```{language}\n{code}\n```"}
+        ]
+    
+    @staticmethod
+    def _story_messages(genre: str, theme: str, chapters: int, style_genes: Dict) -> List[Dict]:
+        gene_context = ""
+        if style_genes:
+            gene_context = f"\n\n参考基因：{style_genes}"
+        
+        return [
+            {"role": "system", "content": f"你是一个专业的小说作家，擅长写{genre}题材。"},
+            {"role": "user", "content": f"请创作一个关于“{theme}”的{genre}小说，要求：\n1. {chapters}章以上\n2. 人物丰满、情节曲折{gene_context}"}
+        ]
+    
+    @staticmethod
+    def _analyze_messages(content: str, analysis_type: str) -> List[Dict]:
+        prompts = {
+            "gene": "分析以下内容，提取成功基因（人设、爽点、金句）",
+            "summary": "为以下内容生成简洁摘要",
+            "outline": "为以下内容生成大纲"
+        }
+        
+        return [
+            {"role": "system", "content": "你是一个专业的的内容分析师。"},
+            {"role": "user", "content": f"{prompts.get(analysis_type, '分析')}：\n\n{content[:5000]}"}
+        ]
+    
+    @staticmethod
+    def _merge_messages(partials: str, analysis_type: str) -> List[Dict]:
+        return [
+            {"role": "system", "content": "你是一个专业的的内容分析师。"},
+            {"role": "user", "content": f"以下是同一部作品按顺序分段的{analysis_type}分析结果，请合并为一份完整、去重的结果：\n\n{partials}"}
+        ]
+    
+    @staticmethod
+    def _batch_item(index: int, start: float, response=None, error: Exception = None) -> Dict:
+        usage = getattr(response, "usage", None) if response is not None else None
+        return {
+            "index": index,
+            "content": response.choices[0].message.content if response is not None else None,
+            "usage": usage.model_dump() if usage else None,
+            "latency": time.perf_counter() - start,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None
+        }
+
+
+class MiniMaxClient(_BaseMiniMaxClient):
+    """MiniMax API 优化客户端"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.client = OpenAI(
-            api_key=api_key or os.getenv("OPENAI_API_KEY"),
-            base_url=base_url or os.getenv("OPENAI_BASE_URL", "https://api.minimax.chat/v1")
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=get_http_client(),
+            max_retries=0  # 重试由 self.resilience 负责
         )
-        self.default_model = os.getenv("MODEL", self.MODELS["default"])
+        self.flights = get_singleflight()
     
+    @tracing.traced("llm.chat", cat="llm")
     def chat(
         self, 
         messages: List[Dict], 
@@ -33,31 +218,83 @@ class MiniMaxClient:
         temperature: float = 0.7,
         max_tokens: int = 4096,
         stream: bool = False,
+        use_cache: bool = True,
+        task: str = None,
+        hedge: bool = False,
         **kwargs
     ):
-        """优化的对话接口"""
-        model = model or self.default_model
+        """优化的对话接口
         
-        # 自动选择最优模型
-        if "代码" in str(messages) or "code" in str(messages).lower():
-            model = self.MODELS["code"]
+        task 为任务类型（见 src.api.router.ROUTES），未指定 model 时据此选择模型，失败时沿回退链换模型；
+        hedge=True 时首 token 迟迟不到会发出备份请求（见 src.api.hedging），用于交互式接口；
+        启用缓存时相同请求直接返回缓存结果；相同的确定性请求在途时合并为一次上游调用
+        （流式请求共享同一上游流）。use_cache=False 两者都跳过
+        """
+        plan = self._prepare(messages, model, temperature, max_tokens, stream, use_cache, task, kwargs)
+        tracing.annotate(task=task, model=plan["models"][0], estimated_tokens=plan["estimated"], stream=stream)
+        if plan["caching"]:
+            with tracing.span("llm.cache_lookup", cat="llm") as span:
+                cached = self.cache.get_response(plan["params"])
+                span.set(hit=cached is not None)
+            metrics.LLM_CACHE.labels("miss" if cached is None else "hit").inc()
+            if cached is not None:
+                return cached
         
-        return self.client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=stream,
-            **kwargs
-        )
+        if hedge:
+            return self._hedged(plan)
+        if plan["flight"] is None:
+            return self._create(plan)
+        if stream:
+            return self.flights.stream(plan["flight"], lambda: self._create(plan))
+        return self.flights.do(plan["flight"], lambda: self._create(plan))
+    
+    def _create(self, plan: Dict):
+        with tracing.span("llm.rate_limit_wait", cat="llm"):
+            metrics.LLM_QUEUE.observe(self.rate_limiter.acquire(plan["estimated"]))
+        for model in plan["models"]:
+            start = time.perf_counter()
+            try:
+                with tracing.span("llm.upstream", cat="llm", model=model):
+                    response = self.resilience.call(model, lambda: self._send(plan, model), stream=plan["params"]["stream"])
+            except Exception as e:
+                if self._fallback(plan, model, start, e):
+                    continue
+                raise
+            self._observe(plan, model, start)
+            if plan["params"]["stream"]:
+                return tracing.trace_stream(metrics.meter_stream(response, model, start), model, start)
+            metrics.observe_completion(model, response, start)
+            self._finish(plan, response)
+            return response
+    
+    def _send(self, plan: Dict, model: str):
+        """发出请求；流式请求的在途名额保持到流结束"""
+        self.rate_limiter.enter()
+        try:
+            response = self.client.chat.completions.create(**{**plan["params"], "model": model})
+        except BaseException:
+            self.rate_limiter.leave()
+            raise
+        if plan["params"]["stream"]:
+            held = []
+            held.append(hold_stream(response, self._stream_done(plan, held)))
+            return held[0]
+        self.rate_limiter.leave()
+        return response
+    
+    def _hedged(self, plan: Dict):
+        stream = self.hedger.race(self._hedge_attempts(plan, self._create))
+        if plan["params"]["stream"]:
+            return stream
+        response = collect(stream, plan["params"]["model"])
+        plan["settled"] = True  # 预占与结算都在各对冲请求上，这里只写缓存
+        self._finish(plan, response)
+        return response
     
     def code_review(self, code: str, language: str = "python") -> str:
         """代码审查"""
-        messages = [
-            {"role": "system", "content": "你是一个资深代码审查专家。"},
-            {"role": "user", "content": f"请审查以下{language}代码，指出问题并给出优化建议：\n\n```{language}\n{code}\n```"}
-        ]
-        return self.chat(messages, model=self.MODELS["code"]).choices[0].message.content
+        messages = self._code_review_messages(code, language)
+        return self.chat(messages, task="code").choices[0].message.content
     
     def generate_story(
         self, 
@@ -67,42 +304,206 @@ class MiniMaxClient:
         style_genes: Dict = None
     ) -> str:
         """小说生成（zhilinainovel核心功能）"""
-        gene_context = ""
-        if style_genes:
-            gene_context = f"\n\n参考基因：{style_genes}"
+        messages = self._story_messages(genre, theme, chapters, style_genes)
+        return self.chat(messages, task="story", max_tokens=8192).choices[0].message.content
+    
+    def analyze_content(self, content: str, analysis_type: str = "gene", full: bool = False) -> str:
+        """内容分析
         
-        messages = [
-            {"role": "system", "content": f"你是一个专业的小说作家，擅长写{genre}题材。"},
-            {"role": "user", "content": f"请创作一个关于"{theme}"的{genre}小说，要求：\n1. {chapters}章以上\n2. 人物丰满、情节曲折{gene_context}"}
+        默认只分析前 5000 字；full=True 时按章节切块并发分析，再分层合并各块结果。
+        有分块分析失败时在结果末尾注明失败的分块，不把不完整的结果当作完整结果返回
+        """
+        if not full or len(content) <= 5000:
+            messages = self._analyze_messages(content, analysis_type)
+            return self.chat(messages, task="analysis").choices[0].message.content
+        
+        from src.analyzer.mapreduce import iter_chapters
+        chunks = list(iter_chapters(content, max_chars=5000))
+        tasks = [
+            {"messages": self._analyze_messages(chunk, analysis_type), "task": "analysis"}
+            for chunk in chunks
         ]
-        return self.chat(messages, model=self.MODELS["fast"], max_tokens=8192).choices[0].message.content
+        outputs = self.batch_process(tasks)
+        failed = [i + 1 for i, r in enumerate(outputs) if not r]
+        results = [r for r in outputs if r]
+        while len(results) > 1:
+            groups = ["\n\n".join(results[i:i + 8]) for i in range(0, len(results), 8)]
+            tasks = [
+                {"messages": self._merge_messages(group, analysis_type), "task": "analysis"}
+                for group in groups
+            ]
+            # 合并失败的组保留未合并的分段结果，不丢内容
+            results = [r or group for r, group in zip(self.batch_process(tasks), groups)]
+        report = results[0] if results else ""
+        if failed:
+            report += f"\n\n[不完整] 共 {len(chunks)} 个分块，第 {', '.join(map(str, failed))} 块分析失败，上述结果未覆盖这些内容"
+        return report
+    
+    def batch_run(self, tasks: List[Dict], max_workers: int = None) -> List[Dict]:
+        """并发批量执行，结果按输入顺序返回，单个任务失败不影响整批
+        
+        每个任务支持 messages / task / model / temperature / max_tokens 及其他 chat 参数，
+        返回 {"index", "content", "usage", "latency", "error"}
+        """
+        def run(index: int, task: Dict) -> Dict:
+            params = dict(task)
+            messages = params.pop("messages", [])
+            start = time.perf_counter()
+            try:
+                return self._batch_item(index, start, response=self.chat(messages=messages, **params))
+            except Exception as e:
+                return self._batch_item(index, start, error=e)
+        
+        if not tasks:
+            return []
+        workers = max(1, min(max_workers or self.max_workers, len(tasks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(tracing.wrap(run), range(len(tasks)), tasks))
+    
+    def batch_process(self, tasks: List[Dict], delay: float = 0.0, max_workers: int = None) -> List[Optional[str]]:
+        """批量处理任务（并发 + 令牌桶限速），失败的任务对应位置为 None
+        
+        delay 已废弃，仅为兼容旧调用保留；速率由 rate_limiter 统一控制
+        """
+        return [item["content"] for item in self.batch_run(tasks, max_workers=max_workers)]
+
+
+class AsyncMiniMaxClient(_BaseMiniMaxClient):
+    """MiniMax API 异步客户端（AsyncOpenAI + 共享连接池）"""
     
-    def analyze_content(self, content: str, analysis_type: str = "gene") -> str:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=get_async_http_client(),
+            max_retries=0
+        )
+        self.flights = get_async_singleflight()
+    
+    @tracing.traced("llm.chat", cat="llm")
+    async def chat(
+        self,
+        messages: List[Dict],
+        model: str = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4096,
+        stream: bool = False,
+        use_cache: bool = True,
+        task: str = None,
+        hedge: bool = False,
+        **kwargs
+    ):
+        """异步对话接口，语义与 MiniMaxClient.chat 相同；stream=True 时返回 AsyncStream"""
+        plan = self._prepare(messages, model, temperature, max_tokens, stream, use_cache, task, kwargs)
+        tracing.annotate(task=task, model=plan["models"][0], estimated_tokens=plan["estimated"], stream=stream)
+        if plan["caching"]:
+            with tracing.span("llm.cache_lookup", cat="llm") as span:
+                cached = await asyncio.to_thread(self.cache.get_response, plan["params"])  # SQLite 读写不占用事件循环
+                span.set(hit=cached is not None)
+            metrics.LLM_CACHE.labels("miss" if cached is None else "hit").inc()
+            if cached is not None:
+                return cached
+        
+        if hedge:
+            return await self._hedged(plan)
+        if plan["flight"] is None:
+            return await self._create(plan)
+        if stream:
+            return self.flights.stream(plan["flight"], lambda: self._create(plan))
+        return await self.flights.do(plan["flight"], lambda: self._create(plan))
+    
+    async def _create(self, plan: Dict):
+        with tracing.span("llm.rate_limit_wait", cat="llm"):
+            metrics.LLM_QUEUE.observe(await self.rate_limiter.acquire_async(plan["estimated"]))
+        for model in plan["models"]:
+            start = time.perf_counter()
+            try:
+                with tracing.span("llm.upstream", cat="llm", model=model):
+                    response = await self.resilience.call_async(
+                        model, lambda: self._send(plan, model), stream=plan["params"]["stream"]
+                    )
+            except Exception as e:
+                if self._fallback(plan, model, start, e):
+                    continue
+                raise
+            self._observe(plan, model, start)
+            if plan["params"]["stream"]:
+                return tracing.trace_stream(metrics.meter_stream(response, model, start), model, start)
+            metrics.observe_completion(model, response, start)
+            await self._finish_async(plan, response)
+            return response
+    
+    async def _send(self, plan: Dict, model: str):
+        await self.rate_limiter.enter_async()
+        try:
+            response = await self.client.chat.completions.create(**{**plan["params"], "model": model})
+        except BaseException:
+            self.rate_limiter.leave()
+            raise
+        if plan["params"]["stream"]:
+            held = []
+            held.append(hold_stream(response, self._stream_done(plan, held)))
+            return held[0]
+        self.rate_limiter.leave()
+        return response
+    
+    async def _hedged(self, plan: Dict):
+        stream = await self.hedger.race_async(self._hedge_attempts(plan, self._create))
+        if plan["params"]["stream"]:
+            return stream
+        response = await collect_async(stream, plan["params"]["model"])
+        plan["settled"] = True  # 预占与结算都在各对冲请求上，这里只写缓存
+        await self._finish_async(plan, response)
+        return response
+    
+    async def _finish_async(self, plan: Dict, response):
+        """_finish 的异步版本：需要写缓存时放到工作线程执行"""
+        if plan["caching"]:
+            await asyncio.to_thread(self._finish, plan, response)
+        else:
+            self._finish(plan, response)
+    
+    async def code_review(self, code: str, language: str = "python") -> str:
+        """代码审查"""
+        messages = self._code_review_messages(code, language)
+        return (await self.chat(messages, task="code")).choices[0].message.content
+    
+    async def generate_story(
+        self,
+        genre: str,
+        theme: str,
+        chapters: int = 3,
+        style_genes: Dict = None
+    ) -> str:
+        """小说生成"""
+        messages = self._story_messages(genre, theme, chapters, style_genes)
+        return (await self.chat(messages, task="story", max_tokens=8192)).choices[0].message.content
+    
+    async def analyze_content(self, content: str, analysis_type: str = "gene") -> str:
         """内容分析"""
-        prompts = {
-            "gene": "分析以下内容，提取成功基因（人设、爽点、金句）",
-            "summary": "为以下内容生成简洁摘要",
-            "outline": "为以下内容生成大纲"
-        }
+        messages = self._analyze_messages(content, analysis_type)
+        return (await self.chat(messages, task="analysis")).choices[0].message.content
+    
+    async def batch_run(self, tasks: List[Dict], max_workers: int = None) -> List[Dict]:
+        """并发批量执行（asyncio.Semaphore 限制在途请求数），结果按输入顺序返回"""
+        semaphore = asyncio.Semaphore(max(1, max_workers or self.max_workers))
         
-        messages = [
-            {"role": "system", "content": "你是一个专业的的内容分析师。"},
-            {"role": "user", "content": f"{prompts.get(analysis_type, '分析')}：\n\n{content[:5000]}"}
-        ]
+        async def run(index: int, task: Dict) -> Dict:
+            params = dict(task)
+            messages = params.pop("messages", [])
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    return self._batch_item(index, start, response=await self.chat(messages=messages, **params))
+                except Exception as e:
+                    return self._batch_item(index, start, error=e)
         
-        return self.chat(messages, model=self.MODELS["fast"]).choices[0].message.content
+        return list(await asyncio.gather(*(run(i, task) for i, task in enumerate(tasks))))
     
-    def batch_process(self, tasks: List[Dict], delay: float = 0.5) -> List[str]:
-        """批量处理任务"""
-        results = []
-        for task in tasks:
-            result = self.chat(
-                messages=task.get("messages", []),
-                model=task.get("model", self.default_model)
-            ).choices[0].message.content
-            results.append(result)
-            time.sleep(delay)  # 避免触发速率限制
-        return results
+    async def batch_process(self, tasks: List[Dict], max_workers: int = None) -> List[Optional[str]]:
+        """批量处理任务，失败的任务对应位置为 None"""
+        return [item["content"] for item in await self.batch_run(tasks, max_workers=max_workers)]
 
 
 # 便捷函数
@@ -111,6 +512,11 @@ def get_client() -> MiniMaxClient:
     return MiniMaxClient()
 
 
+def get_async_client() -> AsyncMiniMaxClient:
+    """获取异步客户端"""
+    return AsyncMiniMaxClient()
+
+
 if __name__ == "__main__":
     client = get_client()
     print("MiniMax 优化客户端就绪")
@@ -0,0 +1,291 @@
+"""
+速率限制器
+令牌桶实现，同时约束每分钟请求数（RPM）与每分钟 token 数（TPM），并可限制在途请求数
+配置 LLM_LIMITER_DB 时令牌桶余额与在途名额存放在 SQLite 中，API 服务、调度器与任务工作进程共用同一份配额
+"""
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class TokenBucket:
+    """令牌桶（预占式：先扣减，余额为负时按欠额计算等待时间）"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """预占令牌，返回需要等待的秒数"""
+        amount = min(amount, self.capacity)  # 超大请求最多等满一整桶，避免永久阻塞
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        """归还多预占的令牌"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class SharedState:
+    """跨进程共享的限速状态（SQLite）：各令牌桶余额 + 各进程占用的在途名额
+
+    每次预占/归还都在 BEGIN IMMEDIATE 事务中完成；在途名额按进程号记账，
+    进程退出（崩溃）后其名额在下次名额不足时回收。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connect()
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS inflight (
+                    pid INTEGER PRIMARY KEY,
+                    held INTEGER NOT NULL
+                )
+            """)
+            # 进程号可能被复用：清掉同号旧进程遗留的名额
+            conn.execute("DELETE FROM inflight WHERE pid = ?", (self._pid,))
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            if self._pid != os.getpid():  # fork 后的子进程不能沿用父进程的连接
+                self._connect()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    @staticmethod
+    def _balance(conn: sqlite3.Connection, name: str, rate: float, capacity: float, now: float) -> float:
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+
+    def reserve(self, name: str, rate: float, capacity: float, amount: float) -> float:
+        """预占令牌，返回需要等待的秒数（与 TokenBucket.reserve 相同的欠额算法）"""
+        now = time.time()
+        with self._transaction() as conn:
+            tokens = self._balance(conn, name, rate, capacity, now) - amount
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+    def refund(self, name: str, rate: float, capacity: float, amount: float):
+        now = time.time()
+        with self._transaction() as conn:
+            tokens = min(capacity, self._balance(conn, name, rate, capacity, now) + amount)
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+
+    def try_enter(self, limit: int) -> bool:
+        """所有进程的在途请求数未达 limit 时占用一个名额"""
+        with self._transaction() as conn:
+            if self._held(conn) >= limit:
+                for (pid,) in conn.execute("SELECT pid FROM inflight WHERE pid != ?", (self._pid,)).fetchall():
+                    if not _alive(pid):
+                        conn.execute("DELETE FROM inflight WHERE pid = ?", (pid,))
+                if self._held(conn) >= limit:
+                    return False
+            conn.execute(
+                "INSERT INTO inflight (pid, held) VALUES (?, 1) ON CONFLICT(pid) DO UPDATE SET held = held + 1",
+                (self._pid,)
+            )
+        return True
+
+    def leave(self):
+        with self._transaction() as conn:
+            conn.execute("UPDATE inflight SET held = MAX(held - 1, 0) WHERE pid = ?", (self._pid,))
+
+    @staticmethod
+    def _held(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(SUM(held), 0) FROM inflight").fetchone()[0]
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # 进程存在但属于其他用户
+        return True
+    return True
+
+
+class SharedTokenBucket(TokenBucket):
+    """余额存放在 SharedState 中的令牌桶（多个进程共用同一个桶）"""
+
+    def __init__(self, rate_per_minute: float, state: SharedState, name: str, capacity: float = None):
+        super().__init__(rate_per_minute, capacity)
+        self.state = state
+        self.name = name
+
+    def reserve(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        return self.state.reserve(self.name, self.rate, self.capacity, amount)
+
+    def refund(self, amount: float):
+        self.state.refund(self.name, self.rate, self.capacity, amount)
+
+
+class RateLimiter:
+    """RPM + TPM 双令牌桶限速器 + 在途请求上限，rpm/tpm/concurrency 为 0 表示不限制
+
+    传入 state 时配额由所有使用同一 SharedState 数据库的进程共享，否则只在本进程内生效
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, concurrency: int = 0, state: SharedState = None):
+        self.state = state
+        if state:
+            self.requests = SharedTokenBucket(rpm, state, "rpm") if rpm else None
+            self.tokens = SharedTokenBucket(tpm, state, "tpm") if tpm else None
+        else:
+            self.requests = TokenBucket(rpm) if rpm else None
+            self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency and not state else None
+
+    def _reserve(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """阻塞直到允许发出请求，返回实际等待秒数"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """acquire 的异步版本"""
+        wait = await asyncio.to_thread(self._reserve, tokens) if self.state else self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def enter(self):
+        """占用一个在途请求名额（线程、批处理、调度任务共用同一上限）"""
+        if self._slots:
+            self._slots.acquire()
+        elif self.state and self.concurrency:
+            delay = 0.005
+            while not self.state.try_enter(self.concurrency):
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    async def enter_async(self):
+        """enter 的异步版本（与同步调用共享名额，等待时不阻塞事件循环）"""
+        if self._slots:
+            delay = 0.005
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+        elif self.state and self.concurrency:
+            delay = 0.005
+            while not await self._try_enter_async():
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    async def _try_enter_async(self) -> bool:
+        attempt = asyncio.ensure_future(asyncio.to_thread(self.state.try_enter, self.concurrency))
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            # 调用方已取消，但线程里的占用可能已经成功：完成后立即归还
+            attempt.add_done_callback(
+                lambda done: done.cancelled() or done.exception() or not done.result() or self.state.leave()
+            )
+            raise
+
+    def leave(self, error: Exception = None):
+        """归还名额（流式请求在流结束时归还，可直接作为 hold_stream 的回调）"""
+        if self._slots:
+            self._slots.release()
+        elif self.state and self.concurrency:
+            self.state.leave()
+
+    @contextmanager
+    def slot(self):
+        self.enter()
+        try:
+            yield
+        finally:
+            self.leave()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        await self.enter_async()
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """请求完成后按实际 token 用量归还多预占的部分"""
+        if self.tokens and actual is not None and estimated > actual:
+            self.tokens.refund(estimated - actual)
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int = 0) -> int:
+    """粗略估算请求 token 数（中文约 1 字 1 token，只取长度不扫描内容）"""
+    return sum(len(m.get("content") or "") for m in messages) + (max_tokens or 0)
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取共享限速器（MINIMAX_RPM / MINIMAX_TPM / MINIMAX_MAX_INFLIGHT 配置）
+
+    LLM_LIMITER_DB（默认 ./data/limiter.db）指向的数据库由各进程共用，置空则只在本进程内限速
+    """
+    global _limiter
+    if _limiter is None:
+        path = os.getenv("LLM_LIMITER_DB", "./data/limiter.db")
+        _limiter = RateLimiter(
+            rpm=float(os.getenv("MINIMAX_RPM", "0")),
+            tpm=float(os.getenv("MINIMAX_TPM", "0")),
+            concurrency=int(os.getenv("MINIMAX_MAX_INFLIGHT", "32")),
+            state=SharedState(path) if path else None
+        )
+    return _limiter
@@ -0,0 +1,425 @@
+"""
+调用韧性
+- 可重试错误（连接/超时、429、5xx）按指数退避 + 全抖动重试，服务端给出 Retry-After 时以其为准
+- AIMD 自适应并发：从配置的在途上限起步，遇到 429/503/超时减半（冷却期内只减一次），成功时缓慢加一回升
+- 按模型熔断：连续失败（连接错误、5xx；429 只降并发不计入）达到阈值后熔断，冷却后放一个探测请求，成功即恢复；熔断中直接失败，由路由回退到下一个模型
+"""
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+import asyncio
+import os
+import random
+import threading
+import time
+
+from src.api import metrics
+
+
+class CircuitOpenError(Exception):
+    """模型处于熔断状态"""
+
+    def __init__(self, model: str, retry_in: float):
+        super().__init__(f"模型 {model} 熔断中，{retry_in:.1f}s 后重试")
+        self.model = model
+        self.retry_in = retry_in
+
+
+def status_of(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def retryable(error: Exception) -> bool:
+    """连接错误、超时、408/409/429 与 5xx 可重试"""
+    import openai
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = status_of(error)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+
+def overloaded(error: Exception) -> bool:
+    """上游过载信号（触发并发减半）：429、503 与请求超时"""
+    import openai
+    return isinstance(error, openai.APITimeoutError) or status_of(error) in (429, 503)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """从响应头读取 Retry-After（秒或 HTTP 日期）/ retry-after-ms"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class AdaptiveLimiter:
+    """AIMD 并发上限（与 RateLimiter 的固定在途上限叠加，取两者较小者）
+
+    默认从 maximum 起步：冷启动不限流，只在上游发出过载信号后才收缩
+    """
+
+    def __init__(self, initial: float = None, minimum: float = 1, maximum: float = 64, cooldown: float = 2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(maximum if initial is None else initial, maximum)))
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _try_enter(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait(0.1)
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        delay = 0.005
+        while not self._try_enter():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self):
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        """加性增：约每完成 limit 个请求上限加一"""
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_overload(self):
+        """乘性减"""
+        now = time.monotonic()
+        with self._cond:
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+                self.decreases += 1
+
+
+class _Held:
+    """流式响应包装：create() 在收到响应头时就返回，在途名额要保持到流读完、出错或被关闭才释放
+
+    done(error) 只调用一次；调用方既不读完也不关闭时在回收时调用，避免名额泄漏。
+    chunks / usage 记录已读分块数与末尾的用量分块，供 done 回调结算 TPM
+    """
+
+    def __init__(self, stream, done: Callable[[Optional[Exception]], None]):
+        self.stream = stream
+        self._done = done
+        self.chunks = 0
+        self.usage = None
+
+    def _seen(self, chunk):
+        self.chunks += 1
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        return chunk
+
+    def _finish(self, error: Exception = None):
+        done, self._done = self._done, None
+        if done:
+            done(error)
+
+    def __del__(self):
+        self._finish()
+
+
+class HeldStream(_Held):
+    def __init__(self, stream, done: Callable[[Optional[Exception]], None]):
+        super().__init__(stream, done)
+        self._iter = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self._seen(next(self._iter))
+        except StopIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self.stream, "close", None)
+            if close:
+                close()
+        finally:
+            self._finish()
+
+
+class AsyncHeldStream(_Held):
+    def __init__(self, stream, done: Callable[[Optional[Exception]], None]):
+        super().__init__(stream, done)
+        self._iter = stream.__aiter__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return self._seen(await self._iter.__anext__())
+        except StopAsyncIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+
+    async def close(self):
+        try:
+            close = getattr(self.stream, "close", None)
+            if close:
+                result = close()
+                if hasattr(result, "__await__"):
+                    await result
+        finally:
+            self._finish()
+
+
+def hold_stream(stream, done: Callable[[Optional[Exception]], None]):
+    """按同步/异步流选择包装"""
+    if hasattr(stream, "__aiter__"):
+        return AsyncHeldStream(stream, done)
+    return HeldStream(stream, done)
+
+
+class CircuitBreaker:
+    """closed → （连续失败 threshold 次）open → （reset_timeout 后）half_open 放一个探测 → 成功 closed / 失败 open"""
+
+    def __init__(self, model: str, threshold: int = 5, reset_timeout: float = 30.0):
+        self.model = model
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        """请求前调用；熔断中抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(self.model, max(remaining, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._probing = "closed", 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state, self.opened_at, self._probing = "open", time.monotonic(), False
+
+    def release(self):
+        """不计成败的结束（如 400 参数错误），放开探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+class Resilience:
+    """重试策略 + 自适应并发 + 各模型熔断器"""
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        limiter: AdaptiveLimiter = None,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self.breakers:
+                self.breakers[model] = CircuitBreaker(model, self.breaker_threshold, self.breaker_reset)
+            return self.breakers[model]
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        """第 attempt 次失败后的等待：Retry-After 优先（不超过 max_delay），否则全抖动指数退避"""
+        hinted = retry_after(error)
+        if hinted is not None:
+            return min(hinted, self.max_delay) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _failed(self, breaker: CircuitBreaker, error: Exception, attempt: int) -> Optional[float]:
+        """记录失败，返回重试前的等待秒数；不再重试时返回 None"""
+        if overloaded(error):
+            self.limiter.on_overload()
+        if status_of(error) == 429:
+            metrics.LLM_RATE_LIMITED.labels(breaker.model).inc()
+        if retryable(error) and status_of(error) != 429:
+            breaker.record_failure()
+        else:
+            breaker.release()
+        if not retryable(error) or attempt >= self.max_retries or breaker.state == "open":
+            return None
+        with self._lock:
+            self.retries += 1
+        metrics.LLM_RETRIES.labels(breaker.model, str(status_of(error) or "connection")).inc()
+        return self.delay(attempt, error)
+
+    def _succeeded(self, breaker: CircuitBreaker, result, stream: bool):
+        """成功返回：非流式立即释放并发名额；流式在流结束时释放，并以是否完整读完作为 AIMD 的成败信号"""
+        breaker.record_success()
+        if not stream:
+            self.limiter.release()
+            self.limiter.on_success()
+            return result
+
+        def done(error: Optional[Exception]):
+            self.limiter.release()
+            if error is None:
+                self.limiter.on_success()
+            elif overloaded(error):
+                self.limiter.on_overload()
+        return hold_stream(result, done)
+
+    def call(self, model: str, fn: Callable, stream: bool = False):
+        """在熔断器与自适应并发保护下调用 fn，可重试错误退避后重试
+
+        stream=True 时 fn 返回流式响应，并发名额保持到流读完或关闭
+        """
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            breaker.check()
+            self.limiter.acquire()
+            try:
+                result = fn()
+            except BaseException as e:
+                self.limiter.release()
+                if not isinstance(e, Exception):
+                    raise
+                wait = self._failed(breaker, e, attempt)
+                if wait is None:
+                    raise
+            else:
+                return self._succeeded(breaker, result, stream)
+            time.sleep(wait)
+            attempt += 1
+
+    async def call_async(self, model: str, fn: Callable, stream: bool = False):
+        """call 的异步版本，fn 返回协程"""
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            breaker.check()
+            await self.limiter.acquire_async()
+            try:
+                result = await fn()
+            except BaseException as e:
+                self.limiter.release()
+                if not isinstance(e, Exception):
+                    raise
+                wait = self._failed(breaker, e, attempt)
+                if wait is None:
+                    raise
+            else:
+                return self._succeeded(breaker, result, stream)
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    def stats(self) -> Dict:
+        return {
+            "retries": self.retries,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "decreases": self.limiter.decreases,
+            "breakers": {
+                model: {"state": b.state, "failures": b.failures, "trips": b.trips}
+                for model, b in self.breakers.items()
+            }
+        }
+
+
+_resilience: Optional[Resilience] = None
+
+
+def get_resilience() -> Resilience:
+    """进程内共享的韧性层（LLM_RETRIES / LLM_RETRY_BASE / LLM_RETRY_MAX_DELAY / LLM_AIMD_* / LLM_BREAKER_* 配置）"""
+    global _resilience
+    if _resilience is None:
+        maximum = float(os.getenv("LLM_AIMD_MAX", os.getenv("MINIMAX_MAX_INFLIGHT", "32")) or 0) or 1024
+        _resilience = Resilience(
+            max_retries=int(os.getenv("LLM_RETRIES", "3")),
+            base_delay=float(os.getenv("LLM_RETRY_BASE", "0.5")),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "30")),
+            limiter=AdaptiveLimiter(
+                initial=float(os.getenv("LLM_AIMD_INITIAL") or maximum),
+                minimum=float(os.getenv("LLM_AIMD_MIN", "1")),
+                maximum=maximum,
+                cooldown=float(os.getenv("LLM_AIMD_COOLDOWN", "2"))
+            ),
+            breaker_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            breaker_reset=float(os.getenv("LLM_BREAKER_RESET", "30"))
+        )
+    return _resilience
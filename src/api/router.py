@@ -0,0 +1,138 @@
+"""
+模型路由
+调用方声明任务类型（task），按路由表在候选模型中选择：
+放不下上下文的模型先排除，其余按 观测延迟（EWMA）+ 成本 排序，得到首选模型与回退链。
+只用消息长度估算上下文，不扫描正文内容。
+"""
+from typing import Dict, List, Optional
+import json
+import os
+import threading
+
+# 模型参数：context 为上下文窗口（token），cost 为每千 token 的相对成本，
+# latency 为每千输出 token 的先验耗时（秒），有观测数据后由 EWMA 取代；可用 ROUTER_MODEL_SPECS（JSON）覆盖
+MODEL_SPECS = {
+    "MiniMax-M2.5": {"context": 32768, "cost": 1.0, "latency": 15.0},
+    "MiniMax-Text-01": {"context": 200000, "cost": 2.0, "latency": 25.0},
+    "kimi-code/kimi-for-codi": {"context": 131072, "cost": 2.0, "latency": 20.0}
+}
+
+DEFAULT_SPEC = {"context": 32768, "cost": 1.0, "latency": 20.0}
+
+# 任务 -> 候选模型（MiniMaxClient.MODELS 的别名），未列出的任务按 default 处理；可用 ROUTER_ROUTES（JSON）覆盖
+ROUTES = {
+    "default": ["default", "long"],
+    "code": ["code", "reason"],
+    "reason": ["reason", "fast"],
+    "story": ["fast", "long"],
+    "outline": ["fast", "long"],
+    "beats": ["fast", "long"],
+    "chapter": ["fast", "long"],
+    "dialogue": ["fast", "long"],
+    "scene": ["fast", "long"],
+    "polish": ["fast", "long"],
+    "summary": ["fast", "long"],
+    "analysis": ["fast", "long"],
+    "long": ["long"]
+}
+
+
+def fallback_worthy(error: Exception) -> bool:
+    """换一个模型可能成功的错误：熔断、连接/超时、限流、5xx、模型不存在"""
+    import openai
+    from src.api.resilience import CircuitOpenError
+    return isinstance(error, (
+        CircuitOpenError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.NotFoundError
+    ))
+
+
+class ModelRouter:
+    """按任务选择模型并维护各模型的延迟 EWMA"""
+
+    def __init__(
+        self,
+        models: Dict[str, str],
+        specs: Dict[str, Dict] = None,
+        routes: Dict[str, List[str]] = None,
+        cost_weight: float = None,
+        alpha: float = 0.2,
+        error_penalty: float = 30.0
+    ):
+        self.models = models
+        self.specs = {**MODEL_SPECS, **json.loads(os.getenv("ROUTER_MODEL_SPECS") or "{}"), **(specs or {})}
+        self.routes = routes or {**ROUTES, **json.loads(os.getenv("ROUTER_ROUTES") or "{}")}
+        self.cost_weight = cost_weight if cost_weight is not None else float(os.getenv("ROUTER_COST_WEIGHT", "5"))
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.latency: Dict[str, float] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def spec(self, model: str) -> Dict:
+        return {**DEFAULT_SPEC, **self.specs.get(model, {})}
+
+    def candidates(self, task: str) -> List[str]:
+        """任务的候选模型（去重，保持路由表顺序）"""
+        chain = []
+        for alias in self.routes.get(task) or self.routes["default"]:
+            model = self.models.get(alias, alias)
+            if model not in chain:
+                chain.append(model)
+        return chain
+
+    def score(self, model: str, tokens: int, max_tokens: int) -> float:
+        spec = self.spec(model)
+        latency = self.latency.get(model, spec["latency"])
+        return latency * max(max_tokens, 1) / 1000 + self.cost_weight * spec["cost"] * tokens / 1000
+
+    def route(self, task: str, tokens: int, max_tokens: int = 0) -> List[str]:
+        """返回模型链：首个为首选，其余为回退；都放不下时只返回上下文最大的模型"""
+        chain = self.candidates(task)
+        fits = [m for m in chain if self.spec(m)["context"] >= tokens]
+        if not fits:
+            return [max(chain, key=lambda m: self.spec(m)["context"])]
+        return sorted(fits, key=lambda m: self.score(m, tokens, max_tokens))
+
+    def observe(self, model: str, seconds: float, max_tokens: int = 0, error: bool = False):
+        """记录一次调用（按每千输出 token 归一化）；失败计入惩罚耗时"""
+        per_1k = (self.error_penalty if error else seconds) * 1000 / max(max_tokens, 1000)
+        with self._lock:
+            previous = self.latency.get(model, self.spec(model)["latency"])
+            self.latency[model] = previous + self.alpha * (per_1k - previous)
+            counts = self.counts.setdefault(model, {"calls": 0, "errors": 0})
+            counts["calls"] += 1
+            counts["errors"] += error
+
+    def stats(self) -> Dict:
+        return {
+            model: {**self.spec(model), "latency_ewma": round(self.latency.get(model, self.spec(model)["latency"]), 3),
+                    **self.counts.get(model, {"calls": 0, "errors": 0})}
+            for model in dict.fromkeys(list(self.specs) + list(self.latency))
+        }
+
+
+def configured_models(models: Dict[str, str]) -> Dict[str, str]:
+    """按环境变量解析模型别名：MODEL 同时决定 default 与 fast（常规任务的首选），MODEL_<别名> 可单独覆盖"""
+    models = dict(models)
+    model = os.getenv("MODEL")
+    if model:
+        models["default"] = models["fast"] = model
+    for alias in models:
+        models[alias] = os.getenv(f"MODEL_{alias.upper()}") or models[alias]
+    return models
+
+
+_router: Optional[ModelRouter] = None
+
+
+def get_router(models: Dict[str, str] = None) -> ModelRouter:
+    """进程内共享的路由器（延迟观测在同步/异步客户端之间共享）"""
+    global _router
+    if _router is None:
+        from src.api.minimax_client import _BaseMiniMaxClient
+        _router = ModelRouter(configured_models(models or _BaseMiniMaxClient.MODELS))
+    return _router
@@ -0,0 +1,361 @@
+"""
+请求合并（single-flight）
+相同的确定性请求在途时只发一次上游调用，其余调用方等待并共享结果；
+流式请求由首个订阅者拉取上游，分块广播给所有订阅者（后加入者从头回放已收到的分块）
+"""
+from typing import Callable, Dict, Iterator, List, Optional
+import asyncio
+import os
+import threading
+
+from src.api import metrics
+
+
+class FlightStats:
+    """合并统计：calls 为可合并的调用次数，upstream 为实际上游调用次数，saved 为节省的调用"""
+
+    def __init__(self):
+        self.calls = 0
+        self.upstream = 0
+        self.stream_calls = 0
+        self.stream_upstream = 0
+        self._lock = threading.Lock()
+
+    def record(self, leader: bool, stream: bool = False):
+        if not leader:
+            metrics.LLM_COALESCED.labels("true" if stream else "false").inc()
+        with self._lock:
+            if stream:
+                self.stream_calls += 1
+                self.stream_upstream += leader
+            else:
+                self.calls += 1
+                self.upstream += leader
+
+    def stats(self) -> Dict:
+        calls = self.calls + self.stream_calls
+        saved = calls - self.upstream - self.stream_upstream
+        return {
+            "calls": self.calls,
+            "upstream": self.upstream,
+            "stream_calls": self.stream_calls,
+            "stream_upstream": self.stream_upstream,
+            "saved": saved,
+            "saved_rate": round(saved / calls, 4) if calls else 0.0
+        }
+
+
+# ============ 同步 ============
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SharedStream:
+    """一个上游流 + 多个订阅者；没有专门的泵线程，由当前最快的订阅者负责拉取下一块"""
+
+    def __init__(self, opener: Callable, on_finish: Callable[[], None] = None):
+        self.opener = opener
+        self.on_finish = on_finish
+        self.source = None  # opener 返回的流对象（关闭它才会断开上游连接）
+        self.upstream = None
+        self.chunks: List = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._pulling = False
+        self._cond = threading.Condition()
+
+    def subscribe(self) -> "StreamView":
+        with self._cond:
+            self.subscribers += 1
+        return StreamView(self)
+
+    def _pull(self):
+        try:
+            if self.upstream is None:
+                self.source = self.opener()
+                self.upstream = iter(self.source)
+            chunk, finished, error = next(self.upstream), False, None
+        except StopIteration:
+            chunk, finished, error = None, True, None
+        except BaseException as e:
+            chunk, finished, error = None, True, e
+        with self._cond:
+            if finished:
+                self.done, self.error = True, error
+            else:
+                self.chunks.append(chunk)
+            self._pulling = False
+            self._cond.notify_all()
+        if finished:
+            self._finish()
+
+    def get(self, index: int):
+        """第 index 块；流结束返回 StopIteration 哨兵"""
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done and self._pulling:
+                    self._cond.wait()
+                if index < len(self.chunks):
+                    return self.chunks[index]
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return StopIteration
+                self._pulling = True
+            self._pull()
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+            abandon = self.subscribers == 0 and not self.done
+            if abandon:
+                self.done = True
+                self._cond.notify_all()
+        if abandon:
+            close = getattr(self.source, "close", None)
+            if close:
+                close()
+            self._finish()
+
+    def _finish(self):
+        if self.on_finish:
+            self.on_finish()
+            self.on_finish = None
+
+
+class StreamView:
+    """订阅者视图：可迭代，close() 退订（最后一个订阅者退订时关闭上游）"""
+
+    def __init__(self, shared: SharedStream):
+        self.shared = shared
+        self.index = 0
+        self.closed = False
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        chunk = self.shared.get(self.index)
+        if chunk is StopIteration:
+            self.close()
+            raise StopIteration
+        self.index += 1
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.shared.unsubscribe()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SingleFlight:
+    """线程版请求合并"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, SharedStream] = {}
+        self._lock = threading.Lock()
+        self.metrics = FlightStats()
+
+    def do(self, key: str, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self.metrics.record(leader)
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stream(self, key: str, opener: Callable) -> StreamView:
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._streams[key] = SharedStream(opener, lambda: self._drop_stream(key, shared))
+            view = shared.subscribe()
+        self.metrics.record(leader, stream=True)
+        return view
+
+    def _drop_stream(self, key: str, shared: SharedStream):
+        with self._lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def stats(self) -> Dict:
+        return {**self.metrics.stats(), "in_flight": len(self._calls) + len(self._streams)}
+
+
+# ============ 异步 ============
+
+class AsyncSharedStream:
+    """SharedStream 的异步版本"""
+
+    def __init__(self, opener: Callable, on_finish: Callable[[], None] = None):
+        self.opener = opener
+        self.on_finish = on_finish
+        self.source = None  # opener 返回的流对象（关闭它才会断开上游连接）
+        self.upstream = None
+        self.chunks: List = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._lock = asyncio.Lock()
+
+    def subscribe(self) -> "AsyncStreamView":
+        self.subscribers += 1
+        return AsyncStreamView(self)
+
+    async def get(self, index: int):
+        # 持锁拉取：同一时刻只有一个订阅者在读上游，其余等锁后直接读缓冲
+        async with self._lock:
+            if index < len(self.chunks):
+                return self.chunks[index]
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return StopAsyncIteration
+            try:
+                if self.upstream is None:
+                    self.source = await self.opener()
+                    self.upstream = self.source.__aiter__()
+                self.chunks.append(await self.upstream.__anext__())
+                return self.chunks[index]
+            except StopAsyncIteration:
+                self.done = True
+            except BaseException as e:
+                self.done, self.error = True, e
+        self._finish()
+        if self.error is not None:
+            raise self.error
+        return StopAsyncIteration
+
+    async def unsubscribe(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            self.done = True
+            close = getattr(self.source, "close", None)
+            if close:
+                await close()
+            self._finish()
+
+    def _finish(self):
+        if self.on_finish:
+            self.on_finish()
+            self.on_finish = None
+
+
+class AsyncStreamView:
+    def __init__(self, shared: AsyncSharedStream):
+        self.shared = shared
+        self.index = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        chunk = await self.shared.get(self.index)
+        if chunk is StopAsyncIteration:
+            await self.close()
+            raise StopAsyncIteration
+        self.index += 1
+        return chunk
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            await self.shared.unsubscribe()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncSingleFlight:
+    """协程版请求合并（上游调用放在独立 Task 中，个别调用方被取消不影响其他等待者）"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, AsyncSharedStream] = {}
+        self.metrics = FlightStats()
+
+    async def do(self, key: str, fn: Callable):
+        task = self._calls.get(key)
+        leader = task is None or task.get_loop() is not asyncio.get_running_loop()
+        if leader:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._calls.pop(key, None) if self._calls.get(key) is t else None)
+        self.metrics.record(leader)
+        return await asyncio.shield(task)
+
+    def stream(self, key: str, opener: Callable) -> AsyncStreamView:
+        shared = self._streams.get(key)
+        leader = shared is None
+        if leader:
+            shared = self._streams[key] = AsyncSharedStream(opener, lambda: self._drop_stream(key, shared))
+        self.metrics.record(leader, stream=True)
+        return shared.subscribe()
+
+    def _drop_stream(self, key: str, shared: AsyncSharedStream):
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+
+    def stats(self) -> Dict:
+        return {**self.metrics.stats(), "in_flight": len(self._calls) + len(self._streams)}
+
+
+def coalescible(params: Dict) -> bool:
+    """只合并确定性请求：单候选且温度不超过 SINGLEFLIGHT_MAX_TEMPERATURE（默认 0.3）；SINGLEFLIGHT=0 关闭"""
+    if os.getenv("SINGLEFLIGHT", "1") == "0" or (params.get("n") or 1) > 1:
+        return False
+    temperature = params.get("temperature")
+    return temperature is None or temperature <= float(os.getenv("SINGLEFLIGHT_MAX_TEMPERATURE", "0.3"))
+
+
+_flights: Optional[SingleFlight] = None
+_async_flights: Optional[AsyncSingleFlight] = None
+
+
+def get_singleflight() -> SingleFlight:
+    global _flights
+    if _flights is None:
+        _flights = SingleFlight()
+    return _flights
+
+
+def get_async_singleflight() -> AsyncSingleFlight:
+    global _async_flights
+    if _async_flights is None:
+        _async_flights = AsyncSingleFlight()
+    return _async_flights
@@ -0,0 +1,59 @@
+"""
+流式输出工具
+把 OpenAI 兼容的流式响应转换为 Server-Sent Events
+"""
+import json
+import time
+from typing import AsyncIterator, Dict, Optional
+
+from starlette.concurrency import iterate_in_threadpool
+
+
+def sse(event: str, data: Dict) -> str:
+    """格式化一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_events(stream, request=None, start: float = None) -> AsyncIterator[str]:
+    """逐 token 转发上游流式响应
+
+    事件顺序：ttft（首 token 延迟）→ token* → done（usage、finish_reason、总耗时）；
+    上游报错时发送 error 事件。客户端断开或生成器被关闭时立即关闭上游连接。
+    """
+    start = start or time.perf_counter()
+    chunks = stream if hasattr(stream, "__aiter__") else iterate_in_threadpool(stream)
+    ttft: Optional[float] = None
+    finish_reason = None
+    usage = None
+    text_length = 0
+    try:
+        async for chunk in chunks:
+            if request is not None and await request.is_disconnected():
+                return
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage.model_dump()
+            for choice in chunk.choices:
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        yield sse("ttft", {"ttft": round(ttft, 4)})
+                    text_length += len(delta)
+                    yield sse("token", {"text": delta})
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        yield sse("done", {
+            "finish_reason": finish_reason,
+            "usage": usage,
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "duration": round(time.perf_counter() - start, 4),
+            "characters": text_length
+        })
+    except Exception as e:
+        yield sse("error", {"error": f"{type(e).__name__}: {e}"})
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
@@ -0,0 +1,370 @@
+"""
+分阶段追踪（Chrome trace / Perfetto JSON）
+一次顶层调用（如 generate_outline、generate_gene_report、抓取排行榜）为一条 trace，内部各阶段为 span：
+提示词组装、缓存查询、限速等待、上游请求、首 token、流式接收、后处理……
+trace 结束时写入 TRACE_DIR 下的 JSON 文件，可直接拖进 chrome://tracing 或 ui.perfetto.dev 查看。
+
+默认关闭（TRACE_SAMPLE_RATE=0）：此时 trace()/span() 只做一次判断并返回共享的空对象。
+采样在顶层调用处决定，未被采样的调用其内部各阶段也不记录。
+线程池中的任务需用 wrap() 包装才能继承当前 trace（asyncio 任务自动继承）。
+
+用法：python -m src.api.tracing [--dir ./data/traces] [--limit 20]   列出最近的 trace 文件
+"""
+from contextvars import ContextVar, copy_context
+from typing import Callable, Dict, List, Optional
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+_directory = os.getenv("TRACE_DIR", "./data/traces")
+
+# None：不在任何 trace 中；False：所在顶层调用未被采样
+_trace: ContextVar = ContextVar("trace", default=None)
+_span: ContextVar = ContextVar("span", default=None)
+
+
+def configure(rate: float = None, directory: str = None):
+    """运行时调整采样率与输出目录"""
+    global _rate, _directory
+    if rate is not None:
+        _rate = rate
+    if directory is not None:
+        _directory = directory
+
+
+class Trace:
+    """一条 trace 的事件集合"""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.pid = os.getpid()
+        self.events: List[Dict] = []
+        self.lanes: Dict[int, int] = {}
+        self.open_streams = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def lane(self) -> int:
+        """并发的 asyncio 任务 / 线程各占一条泳道"""
+        try:
+            key = id(asyncio.current_task())
+        except RuntimeError:
+            key = threading.get_ident()
+        with self._lock:
+            if key not in self.lanes:
+                self.lanes[key] = len(self.lanes) + 1
+                self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": self.lanes[key],
+                                    "args": {"name": f"lane {self.lanes[key]}"}})
+            return self.lanes[key]
+
+    def add(self, name: str, start: float, end: float, cat: str = "stage", args: Dict = None, lane: int = None):
+        """记录一个完整事件（时间为 time.perf_counter() 秒）"""
+        event = {"name": name, "cat": cat, "ph": "X", "ts": start * 1e6, "dur": (end - start) * 1e6,
+                 "pid": self.pid, "tid": lane or self.lane(), "args": args or {}}
+        with self._lock:
+            self.events.append(event)
+
+    def instant(self, name: str, args: Dict = None):
+        event = {"name": name, "ph": "i", "s": "t", "ts": time.perf_counter() * 1e6,
+                 "pid": self.pid, "tid": self.lane(), "args": args or {}}
+        with self._lock:
+            self.events.append(event)
+
+    def hold(self):
+        """有流式响应尚未读完时推迟写文件"""
+        with self._lock:
+            self.open_streams += 1
+
+    def release(self):
+        with self._lock:
+            self.open_streams -= 1
+            ready = self.closed and self.open_streams == 0
+        if ready:
+            self.flush()
+
+    def close(self):
+        """顶层 span 结束：没有未读完的流式响应时立即写文件，否则等最后一个流结束"""
+        with self._lock:
+            self.closed = True
+            ready = self.open_streams == 0
+        if ready:
+            self.flush()
+
+    def flush(self):
+        try:
+            self.dump(_directory)
+        except OSError:
+            pass
+
+    def dump(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{self.name}_{self.id}.json")
+        with self._lock:
+            payload = {
+                "traceEvents": list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"trace_id": self.id, "root": self.name}
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, default=str)
+        return path
+
+
+class _NoopSpan:
+    """未追踪时的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    def __init__(self, trace: Trace, name: str, cat: str, args: Dict):
+        self.trace = trace
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.lane = self.trace.lane()
+        self.start = time.perf_counter()
+        self._token = _span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _span.reset(self._token)
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.trace.add(self.name, self.start, end, self.cat, self.args, self.lane)
+        return False
+
+    def set(self, **args):
+        """补充 span 参数（如路由后确定的模型、token 用量）"""
+        self.args.update(args)
+
+
+class _Root(Span):
+    """顶层 span：进入时开启 trace，退出时写文件（返回的流式响应读完后才写）"""
+
+    def __init__(self, name: str, cat: str, args: Dict):
+        super().__init__(Trace(name), name, cat, args)
+
+    def __enter__(self):
+        self._trace_token = _trace.set(self.trace)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        _trace.reset(self._trace_token)
+        self.trace.close()
+        return False
+
+
+class _Unsampled(_NoopSpan):
+    """未被采样的顶层调用：内部各阶段也不再尝试开启 trace"""
+
+    def __enter__(self):
+        self._token = _trace.set(False)
+        return self
+
+    def __exit__(self, *exc):
+        _trace.reset(self._token)
+        return False
+
+
+def trace(name: str, cat: str = "stage", **args):
+    """顶层调用处使用：已在 trace 中时等同 span()，否则按采样率决定是否开启新 trace"""
+    current = _trace.get()
+    if current:
+        return Span(current, name, cat, args)
+    if current is False or _rate <= 0:
+        return NOOP
+    if _rate < 1 and random.random() >= _rate:
+        return _Unsampled()
+    return _Root(name, cat, args)
+
+
+def span(name: str, cat: str = "stage", **args):
+    """阶段 span；不在 trace 中时返回空对象"""
+    current = _trace.get()
+    if not current:
+        return NOOP
+    return Span(current, name, cat, args)
+
+
+def annotate(**args):
+    """给当前 span 补充参数"""
+    current = _span.get()
+    if current is not None:
+        current.set(**args)
+
+
+def mark(name: str, **args):
+    """记录一个瞬时事件（如首 token 到达）"""
+    current = _trace.get()
+    if current:
+        current.instant(name, args)
+
+
+def active() -> bool:
+    return bool(_trace.get())
+
+
+def traced(name: str = None, cat: str = "stage", root: bool = True) -> Callable:
+    """装饰器：函数调用作为一个 span，支持协程函数
+
+    root=True 时无上层 trace 则按采样率开启新 trace；root=False 只在已有 trace 中记录（如提示词组装）
+    """
+    def decorate(fn: Callable) -> Callable:
+        label = name or fn.__qualname__
+        opener = trace if root else span
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with opener(label, cat):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with opener(label, cat):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def wrap(fn: Callable) -> Callable:
+    """让提交到线程池的函数继承当前 trace；未追踪时原样返回"""
+    if not _trace.get():
+        return fn
+    context = copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+# ============ 流式响应 ============
+
+class _StreamTimer:
+    """记录首 token 与流式接收两个阶段"""
+
+    def __init__(self, trace: Trace, model: str, start: float):
+        self.trace = trace
+        self.model = model
+        self.start = start
+        self.first: Optional[float] = None
+        self.chunks = 0
+        self.done = False
+        self.lane = trace.lane()
+        trace.hold()
+
+    def chunk(self, chunk):
+        self.chunks += 1
+        if self.first is None and any(c.delta and c.delta.content for c in chunk.choices):
+            self.first = time.perf_counter()
+            self.trace.add("llm.ttft", self.start, self.first, "llm", {"model": self.model}, self.lane)
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            begin = self.first or self.start
+            self.trace.add("llm.streaming", begin, time.perf_counter(), "llm",
+                           {"model": self.model, "chunks": self.chunks}, self.lane)
+            self.trace.release()
+
+
+class TracedStream:
+    def __init__(self, stream, timer: _StreamTimer):
+        self.stream = stream
+        self._iter = iter(stream)
+        self.timer = timer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._iter)
+        except StopIteration:
+            self.timer.finish()
+            raise
+        self.timer.chunk(chunk)
+        return chunk
+
+    def close(self):
+        self.timer.finish()
+        close = getattr(self.stream, "close", None)
+        if close:
+            close()
+
+
+class AsyncTracedStream:
+    def __init__(self, stream, timer: _StreamTimer):
+        self.stream = stream
+        self._iter = stream.__aiter__()
+        self.timer = timer
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._iter.__anext__()
+        except StopAsyncIteration:
+            self.timer.finish()
+            raise
+        self.timer.chunk(chunk)
+        return chunk
+
+    async def close(self):
+        self.timer.finish()
+        close = getattr(self.stream, "close", None)
+        if close:
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
+
+
+def trace_stream(stream, model: str, start: float):
+    """在 trace 中时包装流式响应，记录 llm.ttft 与 llm.streaming"""
+    current = _trace.get()
+    if not current:
+        return stream
+    timer = _StreamTimer(current, model, start)
+    if hasattr(stream, "__aiter__"):
+        return AsyncTracedStream(stream, timer)
+    return TracedStream(stream, timer)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="列出最近的 trace 文件")
+    parser.add_argument("--dir", default=_directory)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    files = sorted(
+        (os.path.join(args.dir, name) for name in os.listdir(args.dir) if name.endswith(".json")),
+        key=os.path.getmtime,
+        reverse=True
+    ) if os.path.isdir(args.dir) else []
+    for path in files[:args.limit]:
+        with open(path, encoding="utf-8") as f:
+            events = [e for e in json.load(f)["traceEvents"] if e.get("ph") == "X"]
+        root = max(events, key=lambda e: e["dur"]) if events else None
+        if root:
+            print(f"{root['dur'] / 1e6:8.2f}s  {len(events):4d} spans  {path}")
@@ -0,0 +1,53 @@
+"""
+LLM HTTP 传输层
+进程内共享的 httpx 连接池（keep-alive），池大小由环境变量配置
+"""
+import os
+from typing import Optional
+
+import httpx
+
+
+def pool_limits() -> httpx.Limits:
+    """连接池配置：LLM_MAX_CONNECTIONS / LLM_MAX_KEEPALIVE / LLM_KEEPALIVE_EXPIRY"""
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    )
+
+
+def pool_timeout() -> httpx.Timeout:
+    """请求超时：LLM_TIMEOUT（总读超时）/ LLM_CONNECT_TIMEOUT"""
+    return httpx.Timeout(
+        float(os.getenv("LLM_TIMEOUT", "300")),
+        connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    )
+
+
+_sync_http: Optional[httpx.Client] = None
+_async_http: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.Client:
+    """共享的同步连接池"""
+    global _sync_http
+    if _sync_http is None or _sync_http.is_closed:
+        _sync_http = httpx.Client(limits=pool_limits(), timeout=pool_timeout())
+    return _sync_http
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """共享的异步连接池"""
+    global _async_http
+    if _async_http is None or _async_http.is_closed:
+        _async_http = httpx.AsyncClient(limits=pool_limits(), timeout=pool_timeout())
+    return _async_http
+
+
+async def close_async_http_client():
+    """关闭异步连接池（应用关闭时调用）"""
+    global _async_http
+    if _async_http is not None and not _async_http.is_closed:
+        await _async_http.aclose()
+    _async_http = None
@@ -0,0 +1,342 @@
+"""
+异步抓取引擎
+按主机限制并发与请求间隔、缓存 robots.txt、ETag/Last-Modified 条件请求、失败退避重试
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import asyncio
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+
+import httpx
+
+from src.api import tracing
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (compatible; zhilinainovel-crawler/0.1)"
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HostThrottle:
+    """单个主机的并发上限与最小请求间隔"""
+
+    def __init__(self, concurrency: int, delay: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.delay
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+    def penalize(self, seconds: float):
+        """收到 429/Retry-After 时推迟该主机的后续请求"""
+        self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+class ValidatorStore:
+    """条件请求缓存：URL -> ETag / Last-Modified / 压缩正文（SQLite）"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("CRAWL_CACHE_PATH", "./data/crawl_cache.db")
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB,
+                encoding TEXT,
+                fetched REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, body, encoding FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "body": row[2], "encoding": row[3]}
+
+    def text(self, entry: Dict) -> str:
+        return zlib.decompress(entry["body"]).decode(entry["encoding"] or "utf-8", errors="replace")
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], content: bytes, encoding: str):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, body, encoding, fetched) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, zlib.compress(content), encoding, time.time())
+            )
+            self.conn.commit()
+
+
+class CrawlEngine:
+    """礼貌的异步抓取引擎
+
+    fetch() 返回 {"url", "status", "text", "not_modified", "error", "attempts", "elapsed"}；
+    304 时 text 取自本地缓存，not_modified=True 供下游跳过解析。
+    """
+
+    def __init__(
+        self,
+        user_agent: str = None,
+        per_host_concurrency: int = None,
+        per_host_delay: float = None,
+        max_connections: int = None,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        respect_robots: bool = True,
+        robots_ttl: float = 24 * 3600,
+        validators: ValidatorStore = None,
+        timeout: float = 30.0,
+        transport: httpx.AsyncBaseTransport = None
+    ):
+        self.user_agent = user_agent or os.getenv("CRAWL_USER_AGENT", DEFAULT_USER_AGENT)
+        self.per_host_concurrency = per_host_concurrency or int(os.getenv("CRAWL_HOST_CONCURRENCY", "2"))
+        self.per_host_delay = per_host_delay if per_host_delay is not None else float(os.getenv("CRAWL_HOST_DELAY", "1.0"))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.respect_robots = respect_robots
+        self.robots_ttl = robots_ttl
+        self.validators = validators if validators is not None else ValidatorStore()
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": self.user_agent},
+            limits=httpx.Limits(
+                max_connections=max_connections or int(os.getenv("CRAWL_MAX_CONNECTIONS", "64")),
+                max_keepalive_connections=max_connections or int(os.getenv("CRAWL_MAX_CONNECTIONS", "64"))
+            ),
+            timeout=timeout,
+            follow_redirects=True,
+            transport=transport
+        )
+        self._hosts: Dict[str, HostThrottle] = {}
+        self._robots: Dict[str, tuple] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self.stats = {"requests": 0, "not_modified": 0, "retries": 0, "disallowed": 0, "errors": 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _throttle(self, host: str) -> HostThrottle:
+        throttle = self._hosts.get(host)
+        if throttle is None:
+            throttle = self._hosts[host] = HostThrottle(self.per_host_concurrency, self.per_host_delay)
+        return throttle
+
+    # ============ robots.txt ============
+
+    async def allowed(self, url: str) -> bool:
+        """检查 robots.txt（每个主机缓存 robots_ttl 秒）"""
+        if not self.respect_robots:
+            return True
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        lock = self._robots_locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            cached = self._robots.get(origin)
+            if cached is None or time.monotonic() - cached[1] > self.robots_ttl:
+                parser = RobotFileParser()
+                try:
+                    async with self._throttle(parts.netloc):
+                        response = await self.client.get(f"{origin}/robots.txt")
+                    if response.status_code >= 400:
+                        parser.parse([])  # 无 robots.txt 视为全部允许
+                    else:
+                        parser.parse(response.text.splitlines())
+                except httpx.HTTPError:
+                    parser.parse([])
+                cached = self._robots[origin] = (parser, time.monotonic())
+        parser = cached[0]
+        delay = parser.crawl_delay(self.user_agent)
+        if delay:
+            throttle = self._throttle(parts.netloc)
+            throttle.delay = max(throttle.delay, float(delay))
+        return parser.can_fetch(self.user_agent, url)
+
+    # ============ 抓取 ============
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        if value.isdigit():
+            return float(value)
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+    @tracing.traced("crawler.fetch", root=False)
+    async def fetch(self, url: str) -> Dict:
+        start = time.perf_counter()
+        tracing.annotate(url=url)
+        result = {"url": url, "status": None, "text": None, "not_modified": False, "error": None, "attempts": 0}
+        with tracing.span("crawler.robots"):
+            allowed = await self.allowed(url)
+        if not allowed:
+            self.stats["disallowed"] += 1
+            result["error"] = "disallowed by robots.txt"
+            result["elapsed"] = time.perf_counter() - start
+            return result
+
+        # SQLite 读写与解压放到工作线程，不阻塞事件循环
+        cached = await asyncio.to_thread(self.validators.get, url) if self.validators else None
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        throttle = self._throttle(urlsplit(url).netloc)
+        for attempt in range(self.max_retries + 1):
+            result["attempts"] = attempt + 1
+            wait = None
+            try:
+                with tracing.span("crawler.request", attempt=attempt + 1) as span:
+                    async with throttle:
+                        self.stats["requests"] += 1
+                        response = await self.client.get(url, headers=headers)
+                    span.set(status=response.status_code)
+                result["status"] = response.status_code
+                if response.status_code == 304 and cached:
+                    self.stats["not_modified"] += 1
+                    result["not_modified"] = True
+                    result["text"] = await asyncio.to_thread(self.validators.text, cached)
+                    break
+                if response.status_code in RETRY_STATUS:
+                    wait = self._retry_after(response)
+                    if wait:
+                        throttle.penalize(wait)
+                    result["error"] = f"HTTP {response.status_code}"
+                else:
+                    response.raise_for_status()
+                    result["text"] = response.text
+                    result["error"] = None
+                    if self.validators is not None and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+                        await asyncio.to_thread(
+                            self.validators.put,
+                            url,
+                            response.headers.get("ETag"),
+                            response.headers.get("Last-Modified"),
+                            response.content,
+                            response.encoding or "utf-8"
+                        )
+                    break
+            except httpx.HTTPStatusError as e:
+                result["error"] = f"HTTP {e.response.status_code}"
+                break
+            except httpx.HTTPError as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(wait if wait is not None else self.backoff * (2 ** attempt) * (0.5 + random.random()))
+        if result["error"]:
+            self.stats["errors"] += 1
+        result["elapsed"] = time.perf_counter() - start
+        return result
+
+    async def iter_fetch(self, urls: Iterable[str], concurrency: int = 32) -> AsyncIterator[Dict]:
+        """流式批量抓取，按完成顺序产出结果；在途任务不超过 concurrency，内存与 URL 总数无关"""
+        iterator = iter(urls)
+        pending = set()
+        while True:
+            while len(pending) < concurrency:
+                url = next(iterator, None)
+                if url is None:
+                    break
+                pending.add(asyncio.ensure_future(self.fetch(url)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+    async def fetch_many(self, urls: Iterable[str], concurrency: int = 32) -> List[Dict]:
+        """批量抓取，结果按输入顺序返回"""
+        urls = list(urls)
+        results: Dict[str, Dict] = {}
+        async for result in self.iter_fetch(dict.fromkeys(urls), concurrency):
+            results[result["url"]] = result
+        return [results[url] for url in urls]
+
+
+class SharedEngine:
+    """一个采集器（NovelCrawler / ChapterIngestor）在多次调用间共用的 CrawlEngine
+
+    asyncio.run 每次新建事件循环，连接池与 asyncio 原语无法跨循环复用；同步接口经 run() 在同一个常驻循环上执行，
+    robots 缓存、主机节流状态与连接池因此在调用之间保留。传入 engine 时直接使用（由调用方负责关闭）。
+    """
+
+    def __init__(self, engine: CrawlEngine = None, **options):
+        self.options = options
+        self._engine = engine
+        self._owned = engine is None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[asyncio.Runner] = None
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[CrawlEngine]:
+        """取得当前事件循环可用的引擎：首次使用时创建；在另一个事件循环中调用异步接口时使用临时引擎"""
+        loop = asyncio.get_running_loop()
+        if self._engine is None:
+            self._engine, self._loop = CrawlEngine(**self.options), loop
+        if not self._owned or self._loop is loop:
+            yield self._engine
+            return
+        engine = CrawlEngine(**self.options)
+        try:
+            yield engine
+        finally:
+            await engine.close()
+
+    def run(self, factory: Callable[[], Awaitable]):
+        """同步执行 factory() 返回的协程（各次调用共用同一个事件循环）"""
+        with self._lock:
+            if self._runner is None:
+                self._runner = asyncio.Runner()
+            return self._runner.run(factory())
+
+    def close(self):
+        with self._lock:
+            if self._owned and self._engine is not None:
+                if self._runner is not None and self._loop is self._runner.get_loop():
+                    self._runner.run(self._engine.close())
+                self._engine = self._loop = None
+            if self._runner is not None:
+                self._runner.close()
+                self._runner = None
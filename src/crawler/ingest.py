@@ -0,0 +1,285 @@
+"""
+章节增量入库
+正文规范化 → 内容指纹 → 未变化的章节跳过解析、存储与基因分析；按书记录抓取水位，只抓新章节
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Union
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+
+from src.api import tracing
+from src.crawler.engine import CrawlEngine, SharedEngine
+from src.crawler.ranking import extract_chapter_text
+
+# 零宽字符与 BOM（常见的防盗版干扰字符）
+_INVISIBLE = re.compile("[\u200b-\u200f\u2060\ufeff]")
+_SPACES = re.compile(r"[ \t\u3000\xa0]+")
+
+
+def normalize_text(text: str) -> str:
+    """正文规范化：NFKC、去零宽字符、折叠空白、去空行，排版差异不影响指纹"""
+    text = _INVISIBLE.sub("", unicodedata.normalize("NFKC", text))
+    lines = (_SPACES.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ChapterStore:
+    """章节库（SQLite）：正文按指纹去重存储，记录每本书的抓取水位与分析进度"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("CHAPTER_DB_PATH", "./data/chapters.db")
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chapters (
+                book TEXT NOT NULL,
+                num INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                raw_hash TEXT,
+                fingerprint TEXT NOT NULL,
+                chars INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                analyzed TEXT,
+                fetched REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (book, num)
+            );
+            CREATE INDEX IF NOT EXISTS idx_chapters_url ON chapters(url);
+            CREATE TABLE IF NOT EXISTS watermarks (
+                book TEXT PRIMARY KEY,
+                last_num INTEGER NOT NULL,
+                last_url TEXT,
+                updated REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    # ============ 水位 ============
+
+    def watermark(self, book: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT last_num, last_url, updated FROM watermarks WHERE book = ?", (book,)
+            ).fetchone()
+        return {"last_num": row[0], "last_url": row[1], "updated": row[2]} if row else None
+
+    def set_watermark(self, book: str, last_num: int, last_url: str = None):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO watermarks (book, last_num, last_url, updated) VALUES (?, ?, ?, ?)",
+                (book, last_num, last_url, time.time())
+            )
+            self.conn.commit()
+
+    # ============ 章节 ============
+
+    def known(self, book: str) -> Dict[int, Dict]:
+        """num -> {"url", "raw_hash", "fingerprint"}（不含正文）"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT num, url, raw_hash, fingerprint FROM chapters WHERE book = ?", (book,)
+            ).fetchall()
+        return {num: {"url": url, "raw_hash": raw, "fingerprint": fp} for num, url, raw, fp in rows}
+
+    def put(self, book: str, num: int, url: str, raw_hash: str, text: str, digest: str, fetched: float = None):
+        """写入章节；指纹未变时只更新 raw_hash 与抓取时间，保留分析进度"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("""
+                INSERT INTO chapters (book, num, url, raw_hash, fingerprint, chars, body, analyzed, fetched, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)
+                ON CONFLICT(book, num) DO UPDATE SET
+                    url = excluded.url,
+                    raw_hash = excluded.raw_hash,
+                    fetched = excluded.fetched,
+                    fingerprint = excluded.fingerprint,
+                    chars = excluded.chars,
+                    body = CASE WHEN chapters.fingerprint = excluded.fingerprint THEN chapters.body ELSE excluded.body END,
+                    updated = CASE WHEN chapters.fingerprint = excluded.fingerprint THEN chapters.updated ELSE excluded.updated END
+            """, (book, num, url, raw_hash, digest, len(text), zlib.compress(text.encode("utf-8")),
+                  fetched or now, now))
+            self.conn.commit()
+
+    def touch(self, book: str, num: int, raw_hash: str = None):
+        """页面未变（304 或原始 HTML 哈希相同）：只更新抓取时间"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE chapters SET fetched = ?, raw_hash = COALESCE(?, raw_hash) WHERE book = ? AND num = ?",
+                (time.time(), raw_hash, book, num)
+            )
+            self.conn.commit()
+
+    def text(self, book: str, num: int) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT body FROM chapters WHERE book = ? AND num = ?", (book, num)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def pending_analysis(self, book: str = None, limit: int = 100) -> List[Dict]:
+        """指纹与上次分析时不同的章节（新章节或内容有修改）"""
+        sql = "SELECT book, num, fingerprint, body FROM chapters WHERE (analyzed IS NULL OR analyzed != fingerprint)"
+        params: List = []
+        if book is not None:
+            sql += " AND book = ?"
+            params.append(book)
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY book, num LIMIT ?", params + [limit]).fetchall()
+        return [
+            {"book": b, "num": n, "fingerprint": fp, "text": zlib.decompress(body).decode("utf-8")}
+            for b, n, fp, body in rows
+        ]
+
+    def mark_analyzed(self, items: Iterable[Dict]):
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE chapters SET analyzed = ? WHERE book = ? AND num = ?",
+                [(item["fingerprint"], item["book"], item["num"]) for item in items]
+            )
+            self.conn.commit()
+
+
+class ChapterIngestor:
+    """增量抓取章节并入库
+
+    chapter_urls 为目录页给出的按章节顺序排列的 URL 列表（第 i 个即第 i+1 章）。
+    只抓取水位之后的章节（外加最近 recheck 章，作者常回头修改），
+    对每个抓到的页面依次判断：304 → 原始 HTML 哈希 → 规范化正文指纹，任一未变即跳过后续工作。
+    """
+
+    def __init__(
+        self,
+        store: ChapterStore = None,
+        engine: Union[CrawlEngine, SharedEngine] = None,
+        extract: Callable[[str, str], str] = None,
+        concurrency: int = 32
+    ):
+        self.store = store or ChapterStore()
+        # 各本书共用一个引擎；传入 NovelCrawler.engines 时与采集器共用同一个
+        self.engines = engine if isinstance(engine, SharedEngine) else SharedEngine(engine)
+        self.extract = extract or extract_chapter_text
+        self.concurrency = concurrency
+
+    def plan(self, book: str, chapter_urls: List[str], recheck: int = 0) -> List[int]:
+        """返回需要抓取的章节序号（从 1 开始）"""
+        mark = self.store.watermark(book)
+        last = mark["last_num"] if mark else 0
+        if last and (last > len(chapter_urls) or chapter_urls[last - 1] != mark["last_url"]):
+            # 目录有变动（删章/重排），退回按 URL 比对
+            known = {info["url"] for info in self.store.known(book).values()}
+            nums = [i + 1 for i, url in enumerate(chapter_urls) if url not in known]
+            last = 0
+            while last < len(chapter_urls) and chapter_urls[last] in known:
+                last += 1
+        else:
+            nums = list(range(last + 1, len(chapter_urls) + 1))
+        recent = range(max(1, last - recheck + 1), last + 1)
+        return sorted(set(nums) | set(recent))
+
+    @tracing.traced("crawler.ingest")
+    async def ingest_async(self, book: str, chapter_urls: List[str], recheck: int = 0) -> Dict:
+        """抓取并入库，返回统计与内容有变化的章节序号"""
+        start = time.perf_counter()
+        # 章节库的 SQLite 读写、正文解析与压缩都放到工作线程，不阻塞抓取所在的事件循环
+        nums = await asyncio.to_thread(self.plan, book, chapter_urls, recheck)
+        known = await asyncio.to_thread(self.store.known, book) if nums else {}
+        stats = {"planned": len(nums), "new": 0, "changed": 0, "unchanged": 0, "not_modified": 0, "errors": 0}
+        changed: List[int] = []
+        failed = set()
+        by_url = {}
+        for num in nums:
+            by_url.setdefault(chapter_urls[num - 1], []).append(num)
+
+        async with self.engines.session() as engine:
+            async for page in engine.iter_fetch(by_url, self.concurrency):
+                for num in by_url[page["url"]]:
+                    with tracing.span("crawler.store", chapter=num) as span:
+                        status = await asyncio.to_thread(self._ingest_page, book, num, page, known.get(num))
+                        span.set(result=status)
+                    stats[status] += 1
+                    if status in ("new", "changed"):
+                        changed.append(num)
+                    elif status == "errors":
+                        failed.add(num)
+
+        # 水位推进到第一个失败章节之前，失败章节下次重抓
+        last = len(chapter_urls)
+        if failed:
+            last = min(failed) - 1
+        if last > 0:
+            await asyncio.to_thread(self.store.set_watermark, book, last, chapter_urls[last - 1])
+        stats["watermark"] = last
+        stats["changed_chapters"] = sorted(changed)
+        stats["elapsed"] = time.perf_counter() - start
+        return stats
+
+    def ingest(self, book: str, chapter_urls: List[str], recheck: int = 0) -> Dict:
+        """同步接口"""
+        return self.engines.run(lambda: self.ingest_async(book, chapter_urls, recheck))
+
+    def _ingest_page(self, book: str, num: int, page: Dict, previous: Optional[Dict]) -> str:
+        if page["error"] or page["text"] is None:
+            return "errors"
+        if page["not_modified"] and previous:
+            self.store.touch(book, num)
+            return "not_modified"
+        raw_hash = fingerprint(page["text"])
+        if previous and previous["raw_hash"] == raw_hash and previous["url"] == page["url"]:
+            self.store.touch(book, num)
+            return "unchanged"
+        try:
+            text = normalize_text(self.extract(page["text"], page["url"]))
+        except Exception as e:
+            # 单页解析失败计为错误（水位停在该章之前），不中断整本入库
+            page["error"] = f"parse: {type(e).__name__}: {e}"
+            return "errors"
+        digest = fingerprint(text)
+        self.store.put(book, num, page["url"], raw_hash, text, digest)
+        if previous is None:
+            return "new"
+        return "unchanged" if previous["fingerprint"] == digest else "changed"
+
+    # ============ 下游分析 ============
+
+    def analyze_pending(self, analyzer, database=None, book: str = None, batch: int = 32) -> int:
+        """只对新增或修改过的章节做基因分析，结果写入基因库（来源 book#章节号），返回分析章节数"""
+        if database is None:
+            from src.database.db import get_database
+            database = get_database()
+        total = 0
+        while True:
+            items = self.store.pending_analysis(book, limit=batch)
+            if not items:
+                return total
+            tasks = [
+                {"messages": analyzer._report_messages(item["text"]), "task": "analysis", "temperature": 0.3,
+                 "max_tokens": 2000}
+                for item in items
+            ]
+            done = []
+            for item, result in zip(items, analyzer.client.batch_run(tasks)):
+                if result["error"]:
+                    continue
+                database.upsert_report(analyzer.parse_report(result["content"]), source=f"{item['book']}#{item['num']}")
+                done.append(item)
+            self.store.mark_analyzed(done)
+            total += len(done)
+            if len(done) < len(items):
+                # 本批有失败，留待下次运行，避免死循环
+                return total
+
+
+if __name__ == "__main__":
+    print(normalize_text("第一章\u200b  开始\n\n\u3000\u3000正文"))
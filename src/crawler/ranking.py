@@ -1,39 +1,106 @@
 """
 小说排行榜爬虫
 """
-import requests
-from bs4 import BeautifulSoup
-from typing import List, Dict
-import time
+from typing import Iterable, List, Dict
+
+from src.api import tracing
+from src.crawler.engine import CrawlEngine, SharedEngine
+from src.crawler.rules import get_extractor
+
+
+def extract_chapter_text(html: str, url: str = None) -> str:
+    """从章节页 HTML 中提取正文（按站点规则，未匹配时退回通用正文容器/整页文本）"""
+    return get_extractor().chapter(html, url=url)["text"]
+
 
 class NovelCrawler:
     """小说数据采集器"""
     
-    def __init__(self):
+    def __init__(self, engine: CrawlEngine = None, ranking_store=None, **engine_options):
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
+        self.engine_options = {"user_agent": self.headers["User-Agent"], **engine_options}
+        self.engines = SharedEngine(engine, **self.engine_options)  # 各次调用共用（可传给 ChapterIngestor）
+        self.ranking_store = ranking_store  # 设置后每次抓到的榜单都记入 RankingStore
+
+    def close(self):
+        self.engines.close()
     
     def get_qidian_ranking(self, category: str = "fantasy") -> List[Dict]:
         """获取起点中文网排行榜"""
-        # TODO: 实现起点爬虫
-        # 实际使用时需遵守 robots.txt
-        return []
+        return self.get_ranking("qidian", category)
     
     def get_fanqie_ranking(self, category: str = "novel") -> List[Dict]:
         """获取番茄小说排行榜"""
-        # TODO: 实现番茄爬虫
-        return []
+        return self.get_ranking("fanqie", category)
     
     def get_qimao_ranking(self, category: str = "fantasy") -> List[Dict]:
         """获取七猫小说排行榜"""
-        # TODO: 实现七猫爬虫
-        return []
+        return self.get_ranking("qimao", category)
+
+    @tracing.traced("crawler.ranking")
+    def get_ranking(self, site: str, category: str) -> List[Dict]:
+        """按站点规则抓取并解析排行榜，category 可为题材代码或中文题材名（见 GENRE_MAPPING），站点未知时抛出 ValueError"""
+        url = get_extractor().category_url(site, GENRE_MAPPING.get(category, category))
+        if url is None:
+            return []
+        page = self.engines.run(lambda: self._fetch_pages([url]))[0]
+        if not page["text"]:
+            return []
+        with tracing.span("crawler.parse", site=site):
+            books = get_extractor().ranking(page["text"], site=site, url=url)
+        if self.ranking_store is not None and books:
+            self.ranking_store.add_snapshot(books, site=site, category=category)
+        return books
+
+    @tracing.traced("crawler.toc")
+    def get_toc(self, url: str) -> List[str]:
+        """抓取目录页，返回按顺序排列的章节 URL"""
+        page = self.engines.run(lambda: self._fetch_pages([url]))[0]
+        if not page["text"]:
+            return []
+        with tracing.span("crawler.parse"):
+            return get_extractor().toc(page["text"], url=url)
     
     def parse_chapter_content(self, url: str) -> str:
         """解析章节内容"""
-        # TODO: 实现章节解析
-        return ""
+        return self.fetch_chapters([url])[0]["text"] or ""
+
+    def fetch_chapters(self, urls: Iterable[str], concurrency: int = 32) -> List[Dict]:
+        """批量抓取章节（同步接口），结果按输入顺序返回"""
+        return self.engines.run(lambda: self.fetch_chapters_async(urls, concurrency))
+
+    @tracing.traced("crawler.chapters")
+    async def fetch_chapters_async(self, urls: Iterable[str], concurrency: int = 32) -> List[Dict]:
+        """批量抓取章节，返回 [{"url", "text", "not_modified", "status", "error"}]
+
+        304 未修改的章节 not_modified=True，下游可据此跳过入库
+        """
+        pages = await self._fetch_pages(urls, concurrency)
+        with tracing.span("crawler.parse", pages=len(pages)):
+            return [self._chapter(page) for page in pages]
+
+    @staticmethod
+    def _chapter(page: Dict) -> Dict:
+        """解析单个章节页；解析失败只记入该页的 error，不影响同批其他页面"""
+        text, error = None, page["error"]
+        if page["text"]:
+            try:
+                text = extract_chapter_text(page["text"], page["url"])
+            except Exception as e:
+                error = f"parse: {type(e).__name__}: {e}"
+        return {
+            "url": page["url"],
+            "text": text,
+            "not_modified": page["not_modified"],
+            "status": page["status"],
+            "error": error
+        }
+
+    async def _fetch_pages(self, urls: Iterable[str], concurrency: int = 32) -> List[Dict]:
+        async with self.engines.session() as engine:
+            return await engine.fetch_many(urls, concurrency=concurrency)
 
 # 常用题材映射
 GENRE_MAPPING = {
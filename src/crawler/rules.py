@@ -0,0 +1,293 @@
+"""
+站点抽取规则
+每个站点的 CSS 选择器在启动时编译一次，运行在可替换的 HTML 解析后端上：
+lxml（快速路径）优先，未安装时退回 BeautifulSoup
+"""
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+import re
+import threading
+
+# 字段写法："选择器" 取文本，"选择器@属性" 取属性
+SITE_RULES = {
+    "qidian": {
+        "hosts": ("www.qidian.com", "m.qidian.com", "book.qidian.com", "read.qidian.com"),
+        "ranking": {
+            "item": "#book-img-text li, .rank-view-list li",
+            "fields": {
+                "title": "h2 a, h4 a",
+                "url": "h2 a@href, h4 a@href",
+                "author": "p.author a.name",
+                "category": "p.author a:nth-of-type(2)",
+                "intro": "p.intro",
+                "latest": "p.update a"
+            }
+        },
+        "toc": "#allCatalog li a, .catalog-volume li a",
+        "chapter": {"title": ".j_chapterName, h1.title", "content": ".read-content p, main.content p"},
+        "categories": {
+            "fantasy": "https://www.qidian.com/rank/yuepiao/chn21/",
+            "urban": "https://www.qidian.com/rank/yuepiao/chn4/",
+            "history": "https://www.qidian.com/rank/yuepiao/chn5/",
+            "game": "https://www.qidian.com/rank/yuepiao/chn7/",
+            "scifi": "https://www.qidian.com/rank/yuepiao/chn9/",
+            "mystery": "https://www.qidian.com/rank/yuepiao/chn10/",
+            "fanfic": "https://www.qidian.com/rank/yuepiao/chn20109/"
+        }
+    },
+    "fanqie": {
+        "hosts": ("fanqienovel.com", "www.fanqienovel.com"),
+        "ranking": {
+            "item": ".rank-book-item",
+            "fields": {
+                "title": ".title a",
+                "url": ".title a@href",
+                "author": ".author",
+                "intro": ".desc",
+                "latest": ".chapter"
+            }
+        },
+        "toc": ".chapter-item a",
+        "chapter": {"title": ".muye-reader-title", "content": ".muye-reader-content p"},
+        "categories": {
+            "fantasy": "https://fanqienovel.com/rank/1_2_1141",
+            "urban": "https://fanqienovel.com/rank/1_2_1014",
+            "history": "https://fanqienovel.com/rank/1_2_273",
+            "scifi": "https://fanqienovel.com/rank/1_2_8",
+            "mystery": "https://fanqienovel.com/rank/1_2_10",
+            "romance": "https://fanqienovel.com/rank/0_2_1139",
+            "game": "https://fanqienovel.com/rank/1_2_746"
+        }
+    },
+    "qimao": {
+        "hosts": ("www.qimao.com", "qimao.com"),
+        "ranking": {
+            "item": ".rank-list-item, .book-list li",
+            "fields": {
+                "title": ".s-tit a",
+                "url": ".s-tit a@href",
+                "author": ".s-author a",
+                "intro": ".s-des",
+                "latest": ".s-update a"
+            }
+        },
+        "toc": ".chapter-list li a",
+        "chapter": {"title": ".chapter-title", "content": ".article p"},
+        "categories": {
+            "fantasy": "https://www.qimao.com/paihang/boy/hot/1/",
+            "urban": "https://www.qimao.com/paihang/boy/hot/2/",
+            "history": "https://www.qimao.com/paihang/boy/hot/3/",
+            "scifi": "https://www.qimao.com/paihang/boy/hot/4/",
+            "romance": "https://www.qimao.com/paihang/girl/hot/1/"
+        }
+    }
+}
+
+# 未匹配站点规则时的通用正文选择器
+GENERIC_CONTENT = "#content, .read-content, #chapter-content, .chapter-content, article"
+
+
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+class LxmlBackend:
+    """lxml.html + cssselect（选择器预编译为 XPath）"""
+
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from lxml.cssselect import CSSSelector
+        self._parse = lxml.html.document_fromstring
+        self._selector = CSSSelector
+
+    def parse(self, html: str):
+        # lxml 不接受带 encoding 声明的 str（<?xml ... encoding="gbk"?>），正文已解码，声明可直接去掉
+        html = _XML_DECLARATION.sub("", html, count=1)
+        return self._parse(html if html.strip() else "<html></html>")
+
+    def compile(self, selector: str):
+        return self._selector(selector)
+
+    def select(self, compiled, node) -> List:
+        return compiled(node)
+
+    def text(self, node) -> str:
+        return node.text_content()
+
+    def lines(self, node) -> str:
+        """按元素边界换行的文本（正文用，<br> 等处断行）"""
+        return "\n".join(node.itertext())
+
+    def attr(self, node, name: str) -> Optional[str]:
+        return node.get(name)
+
+    def strip(self, node, tags: List[str]):
+        for element in list(node.iter(*tags)):
+            element.drop_tree()
+
+
+class SoupBackend:
+    """BeautifulSoup + soupsieve（选择器预编译）"""
+
+    name = "bs4"
+
+    def __init__(self, parser: str = "html.parser"):
+        import soupsieve
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+        self._compile = soupsieve.compile
+        self.parser = parser
+
+    def parse(self, html: str):
+        return self._soup(html, self.parser)
+
+    def compile(self, selector: str):
+        return self._compile(selector)
+
+    def select(self, compiled, node) -> List:
+        return compiled.select(node)
+
+    def text(self, node) -> str:
+        return node.get_text()
+
+    def lines(self, node) -> str:
+        """按元素边界换行的文本（正文用，<br> 等处断行）"""
+        return node.get_text("\n")
+
+    def attr(self, node, name: str) -> Optional[str]:
+        return node.get(name)
+
+    def strip(self, node, tags: List[str]):
+        for element in node(tags):
+            element.decompose()
+
+
+def make_backend(name: str = "auto"):
+    """auto：有 lxml 用 lxml，否则 BeautifulSoup"""
+    if name in ("auto", "lxml"):
+        try:
+            return LxmlBackend()
+        except ImportError:
+            if name == "lxml":
+                raise
+    return SoupBackend()
+
+
+class CompiledRule:
+    """某个站点在某个后端上的已编译规则"""
+
+    def __init__(self, site: str, rule: Dict, backend):
+        self.site = site
+        self.hosts = rule["hosts"]
+        self.categories = rule.get("categories", {})
+        self.backend = backend
+        ranking = rule.get("ranking")
+        self.item = backend.compile(ranking["item"]) if ranking else None
+        self.fields = {name: self._field(spec) for name, spec in (ranking or {}).get("fields", {}).items()}
+        self.toc = backend.compile(rule["toc"]) if rule.get("toc") else None
+        chapter = rule.get("chapter", {})
+        self.title = backend.compile(chapter["title"]) if chapter.get("title") else None
+        self.content = backend.compile(chapter["content"]) if chapter.get("content") else None
+
+    def _field(self, spec: str):
+        # "a@href, b@href" 形式：各分支属性相同，整体编译为一个选择器
+        attr = None
+        parts = []
+        for part in spec.split(","):
+            selector, _, name = part.strip().partition("@")
+            parts.append(selector)
+            attr = name or attr
+        return self.backend.compile(", ".join(parts)), attr
+
+    def _first(self, compiled, node, attr: str = None) -> Optional[str]:
+        found = self.backend.select(compiled, node)
+        if not found:
+            return None
+        value = self.backend.attr(found[0], attr) if attr else self.backend.text(found[0])
+        return value.strip() if value else value
+
+
+class Extractor:
+    """按 URL 或站点名选择已编译规则抽取排行榜、目录与章节正文"""
+
+    def __init__(self, backend="auto", rules: Dict = None):
+        self.backend = make_backend(backend) if isinstance(backend, str) else backend
+        self.rules = {site: CompiledRule(site, rule, self.backend) for site, rule in (rules or SITE_RULES).items()}
+        self._hosts = {host: rule for rule in self.rules.values() for host in rule.hosts}
+        self._generic = self.backend.compile(GENERIC_CONTENT)
+
+    def rule_for(self, url: str) -> Optional[CompiledRule]:
+        return self._hosts.get(urlsplit(url).netloc)
+
+    def site(self, site: str) -> CompiledRule:
+        """按站点名取规则，未知站点抛出 ValueError"""
+        rule = self.rules.get(site)
+        if rule is None:
+            raise ValueError(f"未知站点: {site!r}（可选: {', '.join(sorted(self.rules))}）")
+        return rule
+
+    def _rule(self, site: Optional[str], url: Optional[str]) -> Optional[CompiledRule]:
+        if site:
+            return self.site(site)
+        return self.rule_for(url) if url else None
+
+    def category_url(self, site: str, category: str) -> Optional[str]:
+        """题材代码（见 GENRE_MAPPING 的值）对应的排行榜地址；站点未知时抛出 ValueError，题材未配置时返回 None"""
+        return self.site(site).categories.get(category)
+
+    def ranking(self, html: str, site: str = None, url: str = None) -> List[Dict]:
+        """解析排行榜页，返回 [{"rank", "title", "url", "author", ...}]"""
+        rule = self._rule(site, url)
+        if rule is None or rule.item is None:
+            return []
+        root = self.backend.parse(html)
+        books = []
+        for item in self.backend.select(rule.item, root):
+            book = {"rank": len(books) + 1}
+            for name, (compiled, attr) in rule.fields.items():
+                book[name] = rule._first(compiled, item, attr)
+            if book.get("url") and url:
+                book["url"] = urljoin(url, book["url"])
+            if book.get("title"):
+                books.append(book)
+        return books
+
+    def toc(self, html: str, site: str = None, url: str = None) -> List[str]:
+        """解析目录页，返回按顺序排列的章节 URL"""
+        rule = self._rule(site, url)
+        if rule is None or rule.toc is None:
+            return []
+        root = self.backend.parse(html)
+        links = (self.backend.attr(a, "href") for a in self.backend.select(rule.toc, root))
+        return [urljoin(url, href) if url else href for href in links if href]
+
+    def chapter(self, html: str, site: str = None, url: str = None) -> Dict:
+        """解析章节页，返回 {"title", "text"}；站点规则取不到正文时退回通用选择器/整页文本"""
+        rule = self._rule(site, url)
+        root = self.backend.parse(html)
+        title = rule._first(rule.title, root) if rule and rule.title else None
+        paragraphs = self.backend.select(rule.content, root) if rule and rule.content else []
+        if not paragraphs:
+            self.backend.strip(root, ["script", "style"])
+            paragraphs = self.backend.select(self._generic, root)[:1] or [root]
+        lines = (line.strip() for node in paragraphs for line in self.backend.lines(node).splitlines())
+        return {"title": title, "text": "\n".join(line for line in lines if line)}
+
+
+_extractor: Optional[Extractor] = None
+_extractor_lock = threading.Lock()
+
+
+def get_extractor() -> Extractor:
+    """共享的抽取器（规则只编译一次）"""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = Extractor()
+    return _extractor
+
+
+if __name__ == "__main__":
+    extractor = get_extractor()
+    print(f"解析后端: {extractor.backend.name}，站点: {', '.join(extractor.rules)}")
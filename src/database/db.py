@@ -0,0 +1,237 @@
+"""
+基因库 - SQLite 存储
+WAL 模式；题材/类型/来源索引；金句与爽点的 FTS5 全文索引；游标分页
+"""
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 基因类型
+GENE_TYPES = ("genre", "knowledge", "report", "excitement", "sentence")
+
+# 进入全文索引的类型（data.text 为索引文本）
+TEXT_TYPES = ("excitement", "sentence")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS genes (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    genre TEXT,
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (type, source, name)
+);
+CREATE INDEX IF NOT EXISTS idx_genes_type ON genes(type, id);
+CREATE INDEX IF NOT EXISTS idx_genes_genre ON genes(genre, type, id);
+CREATE INDEX IF NOT EXISTS idx_genes_source ON genes(source, id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS gene_text USING fts5(text, tokenize='{tokenizer}');
+
+CREATE TRIGGER IF NOT EXISTS genes_text_ai AFTER INSERT ON genes
+WHEN new.type IN ('excitement', 'sentence') BEGIN
+    INSERT INTO gene_text(rowid, text) VALUES (new.id, json_extract(new.data, '$.text'));
+END;
+CREATE TRIGGER IF NOT EXISTS genes_text_ad AFTER DELETE ON genes
+WHEN old.type IN ('excitement', 'sentence') BEGIN
+    DELETE FROM gene_text WHERE rowid = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS genes_text_au AFTER UPDATE OF data ON genes
+WHEN new.type IN ('excitement', 'sentence') BEGIN
+    DELETE FROM gene_text WHERE rowid = old.id;
+    INSERT INTO gene_text(rowid, text) VALUES (new.id, json_extract(new.data, '$.text'));
+END;
+"""
+
+
+def _fts_tokenizer() -> str:
+    """中文检索优先使用 trigram 分词（SQLite >= 3.34），否则退回 unicode61"""
+    return "trigram" if sqlite3.sqlite_version_info >= (3, 34, 0) else "unicode61"
+
+
+def _hash(data: Dict) -> str:
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class GeneDatabase:
+    """小说基因库"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("DATABASE_PATH", "./data/genes.db")
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        conn = self.conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA.replace("{tokenizer}", _fts_tokenizer()))
+        conn.commit()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """每个线程一个连接（WAL 下读写互不阻塞）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ============ 写入 ============
+
+    def upsert_genes(self, genes: Iterable[Dict]) -> int:
+        """批量写入基因（按 type+source+name 去重，内容未变化的行不更新），返回处理行数
+
+        每项需包含 type / source / name / data，可选 genre
+        """
+        now = time.time()
+        rows = [
+            (
+                gene["type"],
+                gene.get("genre"),
+                gene["source"],
+                gene["name"],
+                json.dumps(gene["data"], ensure_ascii=False),
+                _hash(gene["data"]),
+                now,
+                now
+            )
+            for gene in genes
+        ]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO genes (type, genre, source, name, data, content_hash, created, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(type, source, name) DO UPDATE SET
+                    genre = excluded.genre,
+                    data = excluded.data,
+                    content_hash = excluded.content_hash,
+                    updated = excluded.updated
+                WHERE genes.content_hash != excluded.content_hash
+            """, rows)
+        return len(rows)
+
+    def upsert_report(self, report: Dict, source: str, genre: str = None) -> int:
+        """写入 GeneAnalyzer 的基因报告，并把爽点、金句拆成可检索的独立条目"""
+        genre = genre or (report.get("genre") or {}).get("genre")
+        data = {k: v for k, v in report.items() if k != "meta"}
+        genes = [{"type": "report", "genre": genre, "source": source, "name": source, "data": data}]
+        for point in report.get("excitement_points") or []:
+            if isinstance(point, str) and point:
+                genes.append({"type": "excitement", "genre": genre, "source": source, "name": point,
+                              "data": {"text": point}})
+        for sentence in report.get("golden_sentences") or []:
+            if isinstance(sentence, str) and sentence:
+                name = hashlib.sha1(sentence.encode("utf-8")).hexdigest()[:16]
+                genes.append({"type": "sentence", "genre": genre, "source": source, "name": name,
+                              "data": {"text": sentence}})
+        return self.upsert_genes(genes)
+
+    def seed_builtin(self) -> int:
+        """导入代码内置的基因（GENRE_GENES / GENE_TEMPLATES / 控制论知识基因）"""
+        from src.generator.novel import GENRE_GENES
+        from src.analyzer.gene import GENE_TEMPLATES
+        from src.analyzer.cybernetics_gene import get_all_genes
+
+        genes = [
+            {"type": "genre", "genre": genre, "source": "builtin:generator", "name": genre, "data": data}
+            for genre, data in GENRE_GENES.items()
+        ]
+        genes += [
+            {"type": "genre", "genre": data["name"], "source": "builtin:analyzer", "name": key, "data": data}
+            for key, data in GENE_TEMPLATES.items()
+        ]
+        genes += [
+            {"type": "knowledge", "source": "builtin:cybernetics", "name": data["name"], "data": data}
+            for data in get_all_genes()
+        ]
+        return self.upsert_genes(genes)
+
+    # ============ 查询 ============
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        return {
+            "id": row["id"],
+            "type": row["type"],
+            "genre": row["genre"],
+            "source": row["source"],
+            "name": row["name"],
+            "data": json.loads(row["data"]),
+            "updated": row["updated"]
+        }
+
+    def list_genes(
+        self,
+        gene_type: str = None,
+        genre: str = None,
+        source: str = None,
+        cursor: int = 0,
+        limit: int = 50
+    ) -> Dict:
+        """游标分页查询，返回 {"items", "next_cursor"}（next_cursor 为 None 表示没有更多）"""
+        where, params = ["id > ?"], [cursor or 0]
+        for column, value in (("type", gene_type), ("genre", genre), ("source", source)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        limit = max(1, min(limit, 500))
+        rows = self.conn.execute(
+            f"SELECT * FROM genes WHERE {' AND '.join(where)} ORDER BY id LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        items = [self._row(row) for row in rows[:limit]]
+        return {
+            "items": items,
+            "next_cursor": items[-1]["id"] if len(rows) > limit else None
+        }
+
+    def get_gene(self, gene_id: int) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM genes WHERE id = ?", (gene_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def search_text(self, query: str, gene_type: str = None, genre: str = None, limit: int = 20) -> List[Dict]:
+        """在金句与爽点中全文检索"""
+        where, params = [], []
+        for column, value in (("type", gene_type), ("genre", genre)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if len(query) >= 3:
+            sql = "SELECT genes.* FROM gene_text JOIN genes ON genes.id = gene_text.rowid WHERE gene_text MATCH ?"
+            params.insert(0, '"' + query.replace('"', '""') + '"')
+        else:
+            # trigram 索引要求至少 3 个字符，短查询直接扫描可检索类型
+            types = ", ".join(f"'{t}'" for t in TEXT_TYPES)
+            sql = f"SELECT * FROM genes WHERE type IN ({types}) AND json_extract(data, '$.text') LIKE ?"
+            params.insert(0, f"%{query}%")
+        sql += "".join(f" AND {clause}" for clause in where) + " LIMIT ?"
+        rows = self.conn.execute(sql, params + [max(1, min(limit, 200))]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def count(self, gene_type: str = None) -> int:
+        if gene_type:
+            return self.conn.execute("SELECT COUNT(*) FROM genes WHERE type = ?", (gene_type,)).fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM genes").fetchone()[0]
+
+
+_db: Optional[GeneDatabase] = None
+_db_lock = threading.Lock()
+
+
+def get_database() -> GeneDatabase:
+    """获取共享的基因库（首次打开时导入内置基因）"""
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = GeneDatabase()
+            _db.seed_builtin()
+    return _db
@@ -0,0 +1,362 @@
+"""
+排行榜时间序列 - 列式存储
+每条记录一行：时间戳 / 作品 / 名次 / 榜单 / 题材 / 站点，各列为定长 numpy 数组，追加写入磁盘并以 memmap 读取；
+作品、榜单、题材、站点做字典编码（作品字典逐行追加到 titles.jsonl）。按时间排序存放，时间窗口查询只需二分定位一段连续切片。
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+COLUMNS = {
+    "ts": np.int64,         # 快照时间（unix 秒）
+    "title": np.int32,      # 作品 id
+    "rank": np.int16,       # 名次（从 1 开始）
+    "list": np.int16,       # 榜单 id
+    "category": np.int16,   # 题材 id
+    "site": np.int16        # 站点 id
+}
+
+DAY = 86400
+
+# 同一轮抓取的各榜单时间戳相差不超过该值，视为同一期快照
+SNAPSHOT_TOLERANCE = DAY // 2
+
+
+def _category_code(category: str) -> str:
+    """题材统一存为 GENRE_MAPPING 的代码（玄幻 -> fantasy）"""
+    from src.crawler.ranking import GENRE_MAPPING
+    return GENRE_MAPPING.get(category, category)
+
+
+class RankingStore:
+    """排行榜历史"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("RANKING_STORE_PATH", "./data/rankings")
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta_stamp = None
+        self._read_meta()
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _stamp(self):
+        try:
+            st = os.stat(self._meta_path())
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _read_meta(self):
+        """读入 meta.json 与作品字典并映射各列"""
+        self._meta_stamp = self._stamp()
+        self.meta = {"count": 0, "lists": [], "categories": [], "sites": []}
+        if self._meta_stamp is not None:
+            with open(self._meta_path(), encoding="utf-8") as f:
+                self.meta.update(json.load(f))
+        self.meta["titles"] = []
+        titles_path = os.path.join(self.path, "titles.jsonl")
+        if os.path.exists(titles_path):
+            with open(titles_path, encoding="utf-8") as f:
+                self.meta["titles"] = [json.loads(line) for line in f if line.strip()]
+        self._new_titles: List[Dict] = []
+        self._index = {
+            name: {self._title_key(item) if name == "titles" else item: i for i, item in enumerate(self.meta[name])}
+            for name in ("titles", "lists", "categories", "sites")
+        }
+        self._load()
+
+    def _refresh(self):
+        """其他进程（如定时抓取）写入后 meta.json 会被替换：查询与写入前发现变化就重新加载"""
+        if self._stamp() != self._meta_stamp:
+            with self._lock:
+                if self._stamp() != self._meta_stamp:
+                    self._read_meta()
+
+    def _snapshot(self):
+        """查询用的一致视图 (columns, meta, index)
+
+        写入与重载都整体替换 columns（不原地修改已映射的列），查询全程使用开始时取到的这一组引用；
+        行数以列长度为准，meta 中的字典只会追加，旧列里的编码始终有效
+        """
+        self._refresh()
+        with self._lock:
+            return self.columns, self.meta, self._index
+
+    @contextmanager
+    def _write_lock(self):
+        """进程间写锁（flock）：多个进程同时追加列文件会互相覆盖"""
+        try:
+            import fcntl
+        except ImportError:  # 非 POSIX 平台只依赖进程内的锁
+            yield
+            return
+        with open(os.path.join(self.path, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ============ 存储 ============
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _load(self):
+        """以 memmap 打开各列（只映射 meta 中记录的行数，忽略崩溃时写了一半的尾部）"""
+        count = self.meta["count"]
+        columns: Dict[str, np.ndarray] = {}
+        for name, dtype in COLUMNS.items():
+            if count:
+                columns[name] = np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(count,))
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+        self.columns = columns
+
+    def _save_titles(self):
+        """新作品先于引用它们的列数据落盘"""
+        if self._new_titles:
+            with open(os.path.join(self.path, "titles.jsonl"), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(info, ensure_ascii=False) + "\n" for info in self._new_titles))
+            self._new_titles = []
+
+    def _save_meta(self):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({k: v for k, v in self.meta.items() if k != "titles"}, ensure_ascii=False))
+        os.replace(tmp, self._meta_path())
+        self._meta_stamp = self._stamp()
+
+    def _write_columns(self, data: Dict[str, np.ndarray], mode: str):
+        """r+b 在已有行之后追加；wb 整体重写到临时文件再替换，正在查询的旧映射仍指向旧文件"""
+        for name, dtype in COLUMNS.items():
+            path = self._column_path(name)
+            with open(path if mode == "r+b" else path + ".tmp", mode) as f:
+                if mode == "r+b":
+                    f.seek(self.meta["count"] * np.dtype(dtype).itemsize)
+                    f.truncate()
+                f.write(np.ascontiguousarray(data[name], dtype=dtype).tobytes())
+            if mode != "r+b":
+                os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _title_key(info: Dict) -> str:
+        return f"{info['site']}:{info.get('url') or info['title']}"
+
+    def _encode(self, name: str, value) -> int:
+        index = self._index[name]
+        key = self._title_key(value) if name == "titles" else value
+        if key not in index:
+            index[key] = len(self.meta[name])
+            self.meta[name].append(value)
+            if name == "titles":
+                self._new_titles.append(value)
+        return index[key]
+
+    # ============ 写入 ============
+
+    def add_snapshot(
+        self,
+        books: Iterable[Dict],
+        site: str,
+        category: str,
+        list_name: str = "hot",
+        ts: float = None
+    ) -> int:
+        """追加一期榜单快照（books 为 NovelCrawler 排行榜结果，需含 rank 与 title），返回写入行数"""
+        return self.add_snapshots([{"books": books, "site": site, "category": category,
+                                    "list_name": list_name, "ts": ts}])
+
+    def add_snapshots(self, snapshots: Iterable[Dict]) -> int:
+        """批量追加快照（一次落盘），每项字段同 add_snapshot 的参数"""
+        now = time.time()
+        with self._lock, self._write_lock():
+            # 拿到写锁后再检查一次：等锁期间其他进程可能已追加
+            if self._stamp() != self._meta_stamp:
+                self._read_meta()
+            parts = {name: [] for name in COLUMNS}
+            for snapshot in snapshots:
+                site = snapshot["site"]
+                ts = int(snapshot["ts"] if snapshot.get("ts") is not None else now)
+                codes = (
+                    self._encode("lists", snapshot.get("list_name") or "hot"),
+                    self._encode("categories", _category_code(snapshot["category"])),
+                    self._encode("sites", site)
+                )
+                for i, book in enumerate(snapshot["books"]):
+                    info = {"site": site, "title": book["title"], "url": book.get("url"), "author": book.get("author")}
+                    row = (ts, self._encode("titles", info), int(book.get("rank") or i + 1)) + codes
+                    for name, value in zip(COLUMNS, row):
+                        parts[name].append(value)
+            count = len(parts["ts"])
+            if not count:
+                return 0
+            self._save_titles()
+            data = {name: np.array(values, dtype=COLUMNS[name]) for name, values in parts.items()}
+            ts_column = self.columns["ts"]
+            if (len(ts_column) and data["ts"][0] < ts_column[-1]) or (np.diff(data["ts"]) < 0).any():
+                # 补录旧快照：整体重排后重写（少见）
+                merged = {name: np.concatenate([np.asarray(self.columns[name]), data[name]]) for name in COLUMNS}
+                order = np.argsort(merged["ts"], kind="stable")
+                self._write_columns({name: merged[name][order] for name in COLUMNS}, "wb")
+            else:
+                self._write_columns(data, "r+b" if self.meta["count"] else "wb")
+            self.meta["count"] += count
+            self._save_meta()
+            self._load()
+            return count
+
+    # ============ 查询 ============
+
+    @staticmethod
+    def _window(columns: Dict[str, np.ndarray], start: float, end: float) -> slice:
+        ts = columns["ts"]
+        return slice(int(np.searchsorted(ts, start, "left")), int(np.searchsorted(ts, end, "right")))
+
+    @staticmethod
+    def _filter(columns: Dict[str, np.ndarray], index: Dict, window: slice, **filters) -> np.ndarray:
+        """窗口内满足过滤条件的行（返回相对 window 起点的下标）"""
+        mask = None
+        for name, value in filters.items():
+            if value is None:
+                continue
+            index_name = {"category": "categories", "list": "lists", "site": "sites"}[name]
+            if name == "category":
+                value = _category_code(value)
+            code = index[index_name].get(value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            hit = columns[name][window] == code
+            mask = hit if mask is None else mask & hit
+        if mask is None:
+            return np.arange(window.stop - window.start)
+        return np.flatnonzero(mask)
+
+    def risers(
+        self,
+        category: str = None,
+        days: float = 7,
+        limit: int = 50,
+        site: str = None,
+        list_name: str = None,
+        now: float = None
+    ) -> List[Dict]:
+        """窗口内名次上升最多的作品（仍在该榜单最新一期上）
+
+        名次只在同一榜单内比较：按 (作品, 榜单) 分组，上升幅度 = 窗口内首次名次 - 最新名次；
+        窗口中途新上榜的作品以该榜单窗口内最大名次 + 1 作为起点。同一作品可能因多个榜单同时上升而出现多次。
+        """
+        columns, meta, index = self._snapshot()
+        if now is None:
+            now = int(columns["ts"][-1]) if len(columns["ts"]) else time.time()
+        window = self._window(columns, now - days * DAY, now)
+        rows = self._filter(columns, index, window, category=category, site=site, list=list_name)
+        if not len(rows):
+            return []
+        rows = rows + window.start
+        ts = np.asarray(columns["ts"][rows])
+        titles = np.asarray(columns["title"][rows])
+        lists = np.asarray(columns["list"][rows])
+        ranks = np.asarray(columns["rank"][rows]).astype(np.int32)
+
+        # 各榜单在窗口内的最早 / 最新快照时间与最大名次
+        n_lists = len(meta["lists"])
+        list_first = np.full(n_lists, np.iinfo(np.int64).max, dtype=np.int64)
+        list_latest = np.zeros(n_lists, dtype=np.int64)
+        list_max_rank = np.zeros(n_lists, dtype=np.int32)
+        np.minimum.at(list_first, lists, ts)
+        np.maximum.at(list_latest, lists, ts)
+        np.maximum.at(list_max_rank, lists, ranks)
+
+        order = np.lexsort((ts, titles, lists))
+        titles, lists, ts, ranks = titles[order], lists[order], ts[order], ranks[order]
+        starts = np.flatnonzero(np.r_[True, (titles[1:] != titles[:-1]) | (lists[1:] != lists[:-1])])
+        ends = np.r_[starts[1:], len(titles)] - 1
+        group_lists = lists[starts]
+
+        first_ts = ts[starts]
+        entrant = first_ts > list_first[group_lists] + SNAPSHOT_TOLERANCE
+        first_rank = np.where(entrant, list_max_rank[group_lists] + 1, ranks[starts])
+        last_rank = ranks[ends]
+        delta = first_rank - last_rank
+        # 只保留仍在该榜单最新一期上、且名次上升的作品
+        candidates = np.flatnonzero((ts[ends] >= list_latest[group_lists] - SNAPSHOT_TOLERANCE) & (delta > 0))
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-delta[candidates], limit - 1)[:limit]]
+        top = candidates[np.lexsort((last_rank[candidates], -delta[candidates]))]
+        result = []
+        for i in top:
+            title_id = int(titles[starts[i]])
+            result.append({
+                "id": title_id,
+                **meta["titles"][title_id],
+                "list": meta["lists"][int(group_lists[i])],
+                "from_rank": None if entrant[i] else int(first_rank[i]),
+                "rank": int(last_rank[i]),
+                "delta": int(delta[i]),
+                "new_entry": bool(entrant[i]),
+                "first_seen": int(first_ts[i]),
+                "last_seen": int(ts[ends[i]])
+            })
+        return result
+
+    def history(self, title_id: int, days: float = None, now: float = None) -> Dict:
+        """某部作品的名次序列"""
+        columns, meta, _ = self._snapshot()
+        if title_id < 0 or title_id >= len(meta["titles"]):
+            return {}
+        if days is None:
+            window = slice(0, len(columns["ts"]))
+        else:
+            now = now if now is not None else time.time()
+            window = self._window(columns, now - days * DAY, now)
+        rows = np.flatnonzero(columns["title"][window] == title_id) + window.start
+        return {
+            "id": title_id,
+            **meta["titles"][title_id],
+            "ts": columns["ts"][rows].tolist(),
+            "rank": columns["rank"][rows].tolist(),
+            "list": [meta["lists"][i] for i in columns["list"][rows]],
+            "category": [meta["categories"][i] for i in columns["category"][rows]]
+        }
+
+    def find_titles(self, query: str, limit: int = 20) -> List[Dict]:
+        _, meta, _ = self._snapshot()
+        return [
+            {"id": i, **info}
+            for i, info in enumerate(meta["titles"]) if query in info["title"]
+        ][:limit]
+
+    def stats(self) -> Dict:
+        columns, meta, _ = self._snapshot()
+        count = len(columns["ts"])
+        return {
+            "rows": count,
+            "titles": len(meta["titles"]),
+            "bytes": sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values()) * count,
+            "first": int(columns["ts"][0]) if count else None,
+            "last": int(columns["ts"][-1]) if count else None
+        }
+
+
+_store: Optional[RankingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_ranking_store() -> RankingStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RankingStore()
+    return _store
+
+
+if __name__ == "__main__":
+    print(get_ranking_store().stats())
@@ -0,0 +1,176 @@
+"""
+滚动故事记忆
+章节摘要 → 卷摘要 → 全书梗概 三级摘要，按内容哈希增量维护，
+使续写提示词的长度从第 1 章到第 300 章基本恒定
+"""
+from typing import Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import inspect
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class StoryMemory:
+    """分层故事记忆
+
+    - 每章写完后生成一次章节摘要（内容哈希不变则不重算）
+    - 每满 arc_size 章合并为一条卷摘要
+    - 更早的卷依次滚入全书梗概：rollup[k] = 摘要(rollup[k-1] + 卷k)
+    每一级摘要都记录其来源哈希，只有来源变化的摘要才会重新生成。
+    """
+
+    def __init__(
+        self,
+        client=None,
+        arc_size: int = 8,
+        recent_arcs: int = 2,
+        tail_chars: int = 500,
+        chapter_summary_chars: int = 150,
+        arc_summary_chars: int = 300,
+        rollup_chars: int = 500,
+        summarize: Callable[[str, int], str] = None
+    ):
+        self.client = client
+        self.arc_size = arc_size
+        self.recent_arcs = recent_arcs
+        self.tail_chars = tail_chars
+        self.chapter_summary_chars = chapter_summary_chars
+        self.arc_summary_chars = arc_summary_chars
+        self.rollup_chars = rollup_chars
+        self._summarize_fn = summarize
+        self.chapters: Dict[int, Dict] = {}   # 章节号 -> {"hash", "summary", "tail"}
+        self.arcs: Dict[int, Dict] = {}       # 卷序号 -> {"hash", "summary"}
+        self.rollups: Dict[int, Dict] = {}    # 卷序号 -> {"hash", "summary"}，覆盖第 0..k 卷
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # 异步客户端所在的事件循环（aupdate / acontext 设置）
+
+    # ============ 摘要生成 ============
+
+    def _summarize(self, text: str, limit: int) -> str:
+        if self._summarize_fn:
+            return self._summarize_fn(text, limit)
+        result = self.client.chat(
+            messages=[
+                {"role": "system", "content": "你是一个小说编辑，擅长提炼剧情要点。"},
+                {"role": "user", "content": f"请用不超过{limit}字概括以下内容的关键情节、人物状态变化和未解决的悬念：\n\n{text}"}
+            ],
+            temperature=0.3,
+            max_tokens=limit * 2,
+            task="summary"
+        )
+        if inspect.isawaitable(result):
+            # 异步客户端：本方法运行在 aupdate / acontext 的工作线程中，请求回到事件循环上执行
+            result = asyncio.run_coroutine_threadsafe(result, self._loop).result()
+        return result.choices[0].message.content
+
+    # ============ 增量维护 ============
+
+    def update(self, chapter_num: int, content: str) -> bool:
+        """写入/更新一章，返回是否重新生成了章节摘要"""
+        content_hash = _digest(content)
+        current = self.chapters.get(chapter_num)
+        if current and current["hash"] == content_hash:
+            return False
+        self.chapters[chapter_num] = {
+            "hash": content_hash,
+            "summary": self._summarize(content, self.chapter_summary_chars),
+            "tail": content[-self.tail_chars:]
+        }
+        return True
+
+    async def aupdate(self, chapter_num: int, content: str) -> bool:
+        """update 的异步版本（摘要在工作线程中维护，不阻塞事件循环）"""
+        self._loop = asyncio.get_running_loop()
+        return await asyncio.to_thread(self.update, chapter_num, content)
+
+    def _arc(self, index: int) -> Optional[Dict]:
+        """第 index 卷（章节 index*arc_size+1 起）的摘要，章节不全时返回 None"""
+        nums = range(index * self.arc_size + 1, (index + 1) * self.arc_size + 1)
+        if any(num not in self.chapters for num in nums):
+            return None
+        source = _digest(*(self.chapters[num]["hash"] for num in nums))
+        arc = self.arcs.get(index)
+        if arc is None or arc["hash"] != source:
+            text = "\n".join(f"第{num}章：{self.chapters[num]['summary']}" for num in nums)
+            arc = {"hash": source, "summary": self._summarize(text, self.arc_summary_chars)}
+            self.arcs[index] = arc
+        return arc
+
+    def _rollup(self, index: int) -> Optional[Dict]:
+        """覆盖第 0..index 卷的全书梗概"""
+        if index < 0:
+            return None
+        arc = self._arc(index)
+        if arc is None:
+            return None
+        previous = self._rollup(index - 1) if index > 0 else None
+        source = _digest(previous["hash"] if previous else "", arc["hash"])
+        rollup = self.rollups.get(index)
+        if rollup is None or rollup["hash"] != source:
+            text = f"此前梗概：{previous['summary']}\n\n新一卷：{arc['summary']}" if previous else arc["summary"]
+            rollup = {"hash": source, "summary": self._summarize(text, self.rollup_chars)}
+            self.rollups[index] = rollup
+        return rollup
+
+    # ============ 上下文组装 ============
+
+    def context(self, chapter_num: int) -> str:
+        """为第 chapter_num 章组装前情上下文（长度有上界）"""
+        if chapter_num <= 1 or not self.chapters:
+            return "（开头）"
+        current_arc = (chapter_num - 1) // self.arc_size
+        first_recent = max(0, current_arc - self.recent_arcs)
+        sections: List[str] = []
+
+        rollup = self._rollup(first_recent - 1)
+        if rollup:
+            sections.append(f"### 全书梗概\n{rollup['summary']}")
+
+        arc_lines = []
+        for index in range(first_recent, current_arc):
+            arc = self._arc(index)
+            if arc:
+                start = index * self.arc_size + 1
+                arc_lines.append(f"第{start}-{start + self.arc_size - 1}章：{arc['summary']}")
+        if arc_lines:
+            sections.append("### 近期卷摘要\n" + "\n".join(arc_lines))
+
+        chapter_lines = [
+            f"第{num}章：{self.chapters[num]['summary']}"
+            for num in range(current_arc * self.arc_size + 1, chapter_num)
+            if num in self.chapters
+        ]
+        if chapter_lines:
+            sections.append("### 本卷已写章节\n" + "\n".join(chapter_lines))
+
+        previous = self.chapters.get(chapter_num - 1)
+        if previous:
+            sections.append(f"### 上一章结尾\n{previous['tail']}")
+
+        return "\n\n".join(sections) or "（开头）"
+
+    async def acontext(self, chapter_num: int) -> str:
+        """context 的异步版本"""
+        self._loop = asyncio.get_running_loop()
+        return await asyncio.to_thread(self.context, chapter_num)
+
+    # ============ 持久化 ============
+
+    def to_dict(self) -> Dict:
+        return {
+            "chapters": self.chapters,
+            "arcs": self.arcs,
+            "rollups": self.rollups
+        }
+
+    def load(self, state: Dict):
+        """恢复 to_dict() 的结果（JSON 往返后键为字符串）"""
+        self.chapters = {int(k): v for k, v in state.get("chapters", {}).items()}
+        self.arcs = {int(k): v for k, v in state.get("arcs", {}).items()}
+        self.rollups = {int(k): v for k, v in state.get("rollups", {}).items()}
@@ -3,8 +3,16 @@
 支持多题材、多风格、自动书写
 """
 from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import json
-from src.api.minimax_client import MiniMaxClient
+from src.api import tracing
+from src.api.hedging import hedging_enabled
+from src.api.metrics import timed_prompt
+from src.api.minimax_client import MiniMaxClient, AsyncMiniMaxClient
+from src.generator.memory import StoryMemory
+from src.generator.pipeline import AsyncBookPipeline, BookPipeline, CheckpointStore
+from src.generator.polish import get_polish_cache, needs_polish, split_chunks
 
 # 题材基因库
 GENRE_GENES = {
@@ -51,16 +59,20 @@ class NovelGenerator:
     
     def __init__(self, client: MiniMaxClient = None):
         self.client = client or MiniMaxClient()
+        self.polish_cache = get_polish_cache()
     
-    def generate_outline(
+    # ============ 提示词构建（同步/异步共用） ============
+    
+    @timed_prompt("outline")
+    @tracing.traced("prompt.outline", root=False)
+    def _outline_messages(
         self,
         genre: str,
         theme: str,
         main_char: str,
-        length: str = "短篇",
-        style_genes: Dict = None
-    ) -> Dict:
-        """生成小说大纲"""
+        length: str,
+        style_genes: Dict
+    ) -> List[Dict]:
         gene_info = GENRE_GENES.get(genre, GENRE_GENES["都市"])
         
         prompt = f"""你是一个专业的小说大纲师。请为以下设定生成详细大纲：
@@ -85,40 +97,36 @@ class NovelGenerator:
 4. 预计章节数
 5. 核心爽点设计"""
 
-        result = self.client.chat(
-            messages=[
-                {"role": "system", "content": "你是一个专业的小说大纲师，擅长构思吸引人的故事。"},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=2000
-        )
-        
-        return {
-            "genre": genre,
-            "theme": theme,
-            "outline": result.choices[0].message.content,
-            "chapters": self._estimate_chapters(length)
-        }
+        return [
+            {"role": "system", "content": "你是一个专业的小说大纲师，擅长构思吸引人的故事。"},
+            {"role": "user", "content": prompt}
+        ]
     
-    def generate_chapter(
+    @timed_prompt("chapter")
+    @tracing.traced("prompt.chapter", root=False)
+    def _chapter_messages(
         self,
         outline: str,
         previous_content: str,
         chapter_num: int,
-        genre: str = "都市",
-        style_genes: Dict = None,
-        word_count: int = 2000
-    ) -> str:
-        """续写章节"""
+        genre: str,
+        style_genes: Dict,
+        word_count: int,
+        beats: str = None,
+        story_context: str = None
+    ) -> List[Dict]:
         gene_info = GENRE_GENES.get(genre, GENRE_GENES["都市"])
+        beats_section = f"\n## 本章细纲\n{beats}\n" if beats else ""
+        if story_context is None:
+            story_context = previous_content[-500:] if previous_content else "（开头）"
         
         prompt = f"""请根据以下大纲，续写第{chapter_num}章内容：
 
 ## 大纲
 {outline}
-
+{beats_section}
 ## 前文摘要
-{previous_content[-500:] if previous_content else "（开头）"}
+{story_context}
 
 ## 题材要求
 - 题材：{genre}
@@ -134,24 +142,35 @@ class NovelGenerator:
 - 爽点清晰
 - 章节结尾留悬念"""
 
-        result = self.client.chat(
-            messages=[
-                {"role": "system", "content": f"你是一个网文写手，擅长写{genre}题材，节奏快、爽点足。"},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=word_count + 500
-        )
-        
-        return result.choices[0].message.content
+        return [
+            {"role": "system", "content": f"你是一个网文写手，擅长写{genre}题材，节奏快、爽点足。"},
+            {"role": "user", "content": prompt}
+        ]
     
-    def generate_dialogue(
-        self,
-        character1: str,
-        character2: str,
-        context: str,
-        emotion: str = "normal"
-    ) -> str:
-        """生成对话"""
+    @timed_prompt("beats")
+    @tracing.traced("prompt.beats", root=False)
+    def _beats_messages(self, outline: str, chapter_num: int, total_chapters: int, genre: str) -> List[Dict]:
+        prompt = f"""请根据以下{genre}小说大纲，为全书共{total_chapters}章中的第{chapter_num}章制定细纲：
+
+## 大纲
+{outline}
+
+请给出：
+1. 本章在主线中的位置与作用
+2. 3-5个情节节拍（起因→冲突→爽点→悬念）
+3. 出场人物
+4. 章末钩子
+
+只输出细纲，不要写正文，200字以内。"""
+
+        return [
+            {"role": "system", "content": "你是一个专业的网文策划，擅长拆分章节节奏。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    @timed_prompt("dialogue")
+    @tracing.traced("prompt.dialogue", root=False)
+    def _dialogue_messages(self, character1: str, character2: str, context: str, emotion: str) -> List[Dict]:
         emotion_map = {
             "normal": "自然日常",
             "conflict": "剑拔弩张",
@@ -173,24 +192,14 @@ class NovelGenerator:
 - 推动情节发展
 - 字数200-500字"""
 
-        result = self.client.chat(
-            messages=[
-                {"role": "system", "content": "你是一个小说对话写作专家。"},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=800
-        )
-        
-        return result.choices[0].message.content
+        return [
+            {"role": "system", "content": "你是一个小说对话写作专家。"},
+            {"role": "user", "content": prompt}
+        ]
     
-    def generate_scene(
-        self,
-        location: str,
-        time: str,
-        mood: str,
-        key_events: List[str]
-    ) -> str:
-        """生成场景描写"""
+    @timed_prompt("scene")
+    @tracing.traced("prompt.scene", root=False)
+    def _scene_messages(self, location: str, time: str, mood: str, key_events: List[str]) -> List[Dict]:
         prompt = f"""请描写以下场景：
 
 - 地点：{location}
@@ -203,43 +212,220 @@ class NovelGenerator:
 - 渲染氛围
 - 字数300-800字"""
 
-        result = self.client.chat(
-            messages=[
-                {"role": "system", "content": "你是一个小说场景描写专家。"},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000
-        )
-        
-        return result.choices[0].message.content
+        return [
+            {"role": "system", "content": "你是一个小说场景描写专家。"},
+            {"role": "user", "content": prompt}
+        ]
     
-    def polish_chapter(self, content: str, level: str = "medium") -> str:
-        """润色章节"""
+    @timed_prompt("polish")
+    @tracing.traced("prompt.polish", root=False)
+    def _polish_messages(self, content: str, level: str, previous: str = None) -> List[Dict]:
         level_desc = {
             "light": "轻微润色，保持原汁原味",
             "medium": "中等润色，提升文笔",
             "heavy": "大幅改写，提升爽点"
         }
         
-        prompt = f"""请对以下章节进行{level_desc.get(level, level)}：
-
-{content}
+        # 润色要求放在 system 中，各分块共享同一前缀
+        style = f"""你是一个小说润色专家。润色方式：{level_desc.get(level, level)}。
 
 要求：
 - 保持原有情节
 - 优化表达
-- 提升阅读体验"""
-
+- 提升阅读体验
+- 保持段落划分，只输出润色后的正文"""
+        context = f"## 上文（仅供衔接，不要输出）\n{previous}\n\n" if previous else ""
+        
+        return [
+            {"role": "system", "content": style},
+            {"role": "user", "content": f"{context}请润色以下内容：\n\n{content}"}
+        ]
+    
+    def _plan_polish(self, content: str, level: str, chunk_chars: int):
+        """切分章节并查缓存，返回 (分块, 结果占位, 待润色分块下标)"""
+        chunks = split_chunks(content, chunk_chars)
+        results: List[Optional[str]] = [None] * len(chunks)
+        pending = []
+        for i, chunk in enumerate(chunks):
+            if not needs_polish(chunk):
+                results[i] = chunk
+                continue
+            cached = self.polish_cache.get(chunk, level)
+            if cached is None:
+                pending.append(i)
+            else:
+                results[i] = cached
+        return chunks, results, pending
+    
+    def _polish_chunk_messages(self, chunks: List[str], i: int, level: str) -> List[Dict]:
+        previous = chunks[i - 1][-200:] if i > 0 else None
+        return self._polish_messages(chunks[i], level, previous)
+    
+    # ============ 生成接口 ============
+    
+    @tracing.traced("generator.outline")
+    def generate_outline(
+        self,
+        genre: str,
+        theme: str,
+        main_char: str,
+        length: str = "短篇",
+        style_genes: Dict = None
+    ) -> Dict:
+        """生成小说大纲"""
+        result = self.client.chat(
+            messages=self._outline_messages(genre, theme, main_char, length, style_genes),
+            task="outline",
+            max_tokens=2000
+        )
+        
+        return {
+            "genre": genre,
+            "theme": theme,
+            "outline": result.choices[0].message.content,
+            "chapters": self._estimate_chapters(length)
+        }
+    
+    @tracing.traced("generator.chapter")
+    def generate_chapter(
+        self,
+        outline: str,
+        previous_content: str,
+        chapter_num: int,
+        genre: str = "都市",
+        style_genes: Dict = None,
+        word_count: int = 2000,
+        beats: str = None,
+        memory: StoryMemory = None
+    ) -> str:
+        """续写章节
+        
+        beats 为可选的本章细纲；传入 memory 时用分层摘要代替 previous_content 作为前情，
+        并在生成后把本章写入记忆
+        """
+        story_context = None
+        if memory:
+            with tracing.span("memory.context"):
+                story_context = memory.context(chapter_num)
+        result = self.client.chat(
+            messages=self._chapter_messages(
+                outline, previous_content, chapter_num, genre, style_genes, word_count, beats, story_context
+            ),
+            task="chapter",
+            max_tokens=word_count + 500
+        )
+        
+        content = result.choices[0].message.content
+        if memory:
+            with tracing.span("memory.update"):
+                memory.update(chapter_num, content)
+        return content
+    
+    @tracing.traced("generator.beats")
+    def generate_beats(self, outline: str, chapter_num: int, total_chapters: int, genre: str = "都市") -> str:
+        """生成单章细纲"""
+        result = self.client.chat(
+            messages=self._beats_messages(outline, chapter_num, total_chapters, genre),
+            task="beats",
+            max_tokens=500
+        )
+        
+        return result.choices[0].message.content
+    
+    @tracing.traced("generator.dialogue")
+    def generate_dialogue(
+        self,
+        character1: str,
+        character2: str,
+        context: str,
+        emotion: str = "normal"
+    ) -> str:
+        """生成对话"""
+        result = self.client.chat(
+            messages=self._dialogue_messages(character1, character2, context, emotion),
+            task="dialogue",
+            max_tokens=800,
+            hedge=hedging_enabled()
+        )
+        
+        return result.choices[0].message.content
+    
+    @tracing.traced("generator.scene")
+    def generate_scene(
+        self,
+        location: str,
+        time: str,
+        mood: str,
+        key_events: List[str]
+    ) -> str:
+        """生成场景描写"""
         result = self.client.chat(
-            messages=[
-                {"role": "system", "content": "你是一个小说润色专家。"},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=len(content) + 500
+            messages=self._scene_messages(location, time, mood, key_events),
+            task="scene",
+            max_tokens=1000
         )
         
         return result.choices[0].message.content
     
+    @tracing.traced("generator.polish_chapter")
+    def polish_chapter(self, content: str, level: str = "medium", chunk_chars: int = 1500) -> str:
+        """润色章节
+        
+        按段落/场景切块并发润色后按原顺序拼接；分块结果按内容哈希缓存，
+        手工修改后再次润色只会重新处理改动所在的分块
+        """
+        chunks, results, pending = self._plan_polish(content, level, chunk_chars)
+        
+        def polish(i: int) -> str:
+            result = self.client.chat(
+                messages=self._polish_chunk_messages(chunks, i, level),
+                task="polish",
+                max_tokens=len(chunks[i]) + 200
+            )
+            text = result.choices[0].message.content
+            self.polish_cache.set(chunks[i], level, text)
+            return text
+        
+        if len(pending) > 1:
+            workers = min(len(pending), getattr(self.client, "max_workers", 4))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for i, text in zip(pending, pool.map(tracing.wrap(polish), pending)):
+                    results[i] = text
+        elif pending:
+            results[pending[0]] = polish(pending[0])
+        
+        return "\n".join(results)
+    
+    @tracing.traced("generator.book")
+    def generate_book(
+        self,
+        genre: str,
+        theme: str,
+        main_char: str,
+        length: str = "短篇",
+        chapters: int = None,
+        style_genes: Dict = None,
+        word_count: int = 2000,
+        polish_level: str = None,
+        run_id: str = None,
+        store: CheckpointStore = None,
+        progress=None
+    ) -> Dict:
+        """整书生成：大纲 → 细纲 → 正文 → 润色，带检查点，中断后以相同参数（或 run_id）重跑即可续写"""
+        pipeline = BookPipeline(self, store=store)
+        return pipeline.run(
+            genre,
+            theme,
+            main_char,
+            length=length,
+            chapters=chapters,
+            style_genes=style_genes,
+            word_count=word_count,
+            polish_level=polish_level,
+            run_id=run_id,
+            progress=progress
+        )
+    
     def _estimate_chapters(self, length: str) -> int:
         """估算章节数"""
         return {
@@ -250,6 +436,159 @@ class NovelGenerator:
         }.get(length, 10)
 
 
+class AsyncNovelGenerator(NovelGenerator):
+    """异步小说生成引擎（基于 AsyncMiniMaxClient，接口与 NovelGenerator 一致）"""
+    
+    def __init__(self, client: AsyncMiniMaxClient = None):
+        self.client = client or AsyncMiniMaxClient()
+        self.polish_cache = get_polish_cache()
+    
+    @tracing.traced("generator.outline")
+    async def generate_outline(
+        self,
+        genre: str,
+        theme: str,
+        main_char: str,
+        length: str = "短篇",
+        style_genes: Dict = None
+    ) -> Dict:
+        """生成小说大纲"""
+        result = await self.client.chat(
+            messages=self._outline_messages(genre, theme, main_char, length, style_genes),
+            task="outline",
+            max_tokens=2000
+        )
+        
+        return {
+            "genre": genre,
+            "theme": theme,
+            "outline": result.choices[0].message.content,
+            "chapters": self._estimate_chapters(length)
+        }
+    
+    @tracing.traced("generator.chapter")
+    async def generate_chapter(
+        self,
+        outline: str,
+        previous_content: str,
+        chapter_num: int,
+        genre: str = "都市",
+        style_genes: Dict = None,
+        word_count: int = 2000,
+        beats: str = None,
+        memory: StoryMemory = None
+    ) -> str:
+        """续写章节（memory 同 NovelGenerator.generate_chapter，摘要维护不阻塞事件循环）"""
+        story_context = None
+        if memory:
+            with tracing.span("memory.context"):
+                story_context = await memory.acontext(chapter_num)
+        result = await self.client.chat(
+            messages=self._chapter_messages(
+                outline, previous_content, chapter_num, genre, style_genes, word_count, beats, story_context
+            ),
+            task="chapter",
+            max_tokens=word_count + 500
+        )
+        content = result.choices[0].message.content
+        if memory:
+            with tracing.span("memory.update"):
+                await memory.aupdate(chapter_num, content)
+        return content
+    
+    @tracing.traced("generator.beats")
+    async def generate_beats(self, outline: str, chapter_num: int, total_chapters: int, genre: str = "都市") -> str:
+        """生成单章细纲"""
+        result = await self.client.chat(
+            messages=self._beats_messages(outline, chapter_num, total_chapters, genre),
+            task="beats",
+            max_tokens=500
+        )
+        return result.choices[0].message.content
+    
+    @tracing.traced("generator.dialogue")
+    async def generate_dialogue(
+        self,
+        character1: str,
+        character2: str,
+        context: str,
+        emotion: str = "normal"
+    ) -> str:
+        """生成对话"""
+        result = await self.client.chat(
+            messages=self._dialogue_messages(character1, character2, context, emotion),
+            task="dialogue",
+            max_tokens=800,
+            hedge=hedging_enabled()
+        )
+        return result.choices[0].message.content
+    
+    @tracing.traced("generator.scene")
+    async def generate_scene(
+        self,
+        location: str,
+        time: str,
+        mood: str,
+        key_events: List[str]
+    ) -> str:
+        """生成场景描写"""
+        result = await self.client.chat(
+            messages=self._scene_messages(location, time, mood, key_events),
+            task="scene",
+            max_tokens=1000
+        )
+        return result.choices[0].message.content
+    
+    @tracing.traced("generator.polish_chapter")
+    async def polish_chapter(self, content: str, level: str = "medium", chunk_chars: int = 1500) -> str:
+        """润色章节（分块并发，分块结果缓存）"""
+        chunks, results, pending = await asyncio.to_thread(self._plan_polish, content, level, chunk_chars)
+        
+        async def polish(i: int) -> str:
+            result = await self.client.chat(
+                messages=self._polish_chunk_messages(chunks, i, level),
+                task="polish",
+                max_tokens=len(chunks[i]) + 200
+            )
+            text = result.choices[0].message.content
+            await asyncio.to_thread(self.polish_cache.set, chunks[i], level, text)
+            return text
+        
+        for i, text in zip(pending, await asyncio.gather(*(polish(i) for i in pending))):
+            results[i] = text
+        return "\n".join(results)
+    
+    @tracing.traced("generator.book")
+    async def generate_book(
+        self,
+        genre: str,
+        theme: str,
+        main_char: str,
+        length: str = "短篇",
+        chapters: int = None,
+        style_genes: Dict = None,
+        word_count: int = 2000,
+        polish_level: str = None,
+        run_id: str = None,
+        store: CheckpointStore = None,
+        progress=None
+    ) -> Dict:
+        """整书生成（异步流水线，检查点与 NovelGenerator.generate_book 通用）"""
+        pipeline = AsyncBookPipeline(self, store=store)
+        return await pipeline.run(
+            genre,
+            theme,
+            main_char,
+            length=length,
+            chapters=chapters,
+            style_genes=style_genes,
+            word_count=word_count,
+            polish_level=polish_level,
+            run_id=run_id,
+            progress=progress
+        )
+
+
 def get_generator() -> NovelGenerator:
     """获取生成器实例"""
     return NovelGenerator()
@@ -0,0 +1,326 @@
+"""
+整书生成流水线
+大纲 → 每章细纲 → 章节正文 → 润色（可选），每个完成的阶段都写入检查点，崩溃后可原地续跑
+"""
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.generator.memory import StoryMemory
+
+
+class CheckpointStore:
+    """SQLite 阶段检查点：(run_id, stage, key) -> JSON"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("CHECKPOINT_PATH", "./data/checkpoints.db")
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                config TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (run_id, stage, key)
+            );
+        """)
+        self.conn.commit()
+
+    def save_run(self, run_id: str, config: Dict):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, config, created) VALUES (?, ?, ?)",
+                (run_id, json.dumps(config, ensure_ascii=False), time.time())
+            )
+            self.conn.commit()
+
+    def get_run(self, run_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT config FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, run_id: str, stage: str, key: str = ""):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM checkpoints WHERE run_id = ? AND stage = ? AND key = ?",
+                (run_id, stage, str(key))
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, run_id: str, stage: str, key, value):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (run_id, stage, key, value, updated) VALUES (?, ?, ?, ?, ?)",
+                (run_id, stage, str(key), json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self.conn.commit()
+
+    def stage_items(self, run_id: str, stage: str) -> Dict[str, object]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key, value FROM checkpoints WHERE run_id = ? AND stage = ?", (run_id, stage)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+
+class BookPipeline:
+    """整书生成流水线
+
+    正文阶段必须按章节顺序串行（依赖前文），细纲与润色与之并行：
+    细纲在大纲完成后全部提交到线程池，润色在每章正文完成后立即提交。
+    前文通过 StoryMemory 分层摘要传递，记忆状态随每章一起写入检查点。
+    """
+
+    def __init__(self, generator, store: CheckpointStore = None, max_workers: int = None):
+        self.generator = generator
+        self.store = store or CheckpointStore()
+        self.max_workers = max_workers or getattr(generator.client, "max_workers", 4)
+
+    @staticmethod
+    def make_run_id(config: Dict) -> str:
+        """相同配置得到相同 run_id，重复调用即自动续跑"""
+        canonical = json.dumps(config, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    def run(
+        self,
+        genre: str,
+        theme: str,
+        main_char: str,
+        length: str = "短篇",
+        chapters: int = None,
+        style_genes: Dict = None,
+        word_count: int = 2000,
+        polish_level: str = None,
+        run_id: str = None,
+        progress: Callable[[str, int, str], None] = None
+    ) -> Dict:
+        """执行（或续跑）整书生成，progress(stage, chapter_num, status) 回调报告进度"""
+        config = self._config(genre, theme, main_char, length, chapters, style_genes, word_count, polish_level)
+        run_id = run_id or self.make_run_id(config)
+        self.store.save_run(run_id, config)
+        report = progress or (lambda stage, num, status: None)
+
+        outline = self.store.get(run_id, "outline")
+        if outline is None:
+            report("outline", 0, "running")
+            outline = self.generator.generate_outline(genre, theme, main_char, length, style_genes)
+            self.store.put(run_id, "outline", "", outline)
+        report("outline", 0, "done")
+        total = chapters or outline["chapters"]
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            beat_futures = {
+                num: self._submit(pool, run_id, "beats", num, report, self.generator.generate_beats,
+                                  outline["outline"], num, total, genre)
+                for num in range(1, total + 1)
+            }
+            polish_futures: Dict[int, Future] = {}
+            contents: List[str] = []
+            memory = StoryMemory(self.generator.client)
+            memory.load(self.store.get(run_id, "memory") or {})
+            for num in range(1, total + 1):
+                self._raise_failed(beat_futures, polish_futures)
+                content = self.store.get(run_id, "chapter", num)
+                if content is None:
+                    beats = beat_futures[num].result()
+                    report("chapter", num, "running")
+                    content = self.generator.generate_chapter(
+                        outline["outline"],
+                        contents[-1] if contents else "",
+                        num,
+                        genre=genre,
+                        style_genes=style_genes,
+                        word_count=word_count,
+                        beats=beats,
+                        memory=memory
+                    )
+                    self.store.put(run_id, "chapter", num, content)
+                else:
+                    memory.update(num, content)  # 检查点中的记忆已覆盖该章时不会重新摘要
+                self.store.put(run_id, "memory", "", memory.to_dict())
+                report("chapter", num, "done")
+                contents.append(content)
+                if polish_level:
+                    polish_futures[num] = self._submit(pool, run_id, "polish", num, report,
+                                                       self.generator.polish_chapter, content, polish_level)
+
+            beats = {num: future.result() for num, future in beat_futures.items()}
+            polished = {num: future.result() for num, future in polish_futures.items()}
+        except BaseException:
+            # 任一阶段出错（包括进度回调抛出的取消）：未开始的细纲/润色不再执行，等在途的结束后退出
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+        return self._result(run_id, genre, theme, outline, beats, contents, polished)
+
+    @staticmethod
+    def _raise_failed(*futures: Dict):
+        """后台阶段已失败（如进度回调抛出取消）时立即停止，不再继续写后面的章节"""
+        for group in futures:
+            for future in group.values():
+                if future.done() and not future.cancelled() and future.exception() is not None:
+                    raise future.exception()
+
+    @staticmethod
+    def _config(genre, theme, main_char, length, chapters, style_genes, word_count, polish_level) -> Dict:
+        return {
+            "genre": genre,
+            "theme": theme,
+            "main_char": main_char,
+            "length": length,
+            "chapters": chapters,
+            "style_genes": style_genes,
+            "word_count": word_count,
+            "polish_level": polish_level
+        }
+
+    @staticmethod
+    def _result(run_id: str, genre: str, theme: str, outline: Dict, beats: Dict, contents: List[str],
+                polished: Dict) -> Dict:
+        return {
+            "run_id": run_id,
+            "genre": genre,
+            "theme": theme,
+            "outline": outline["outline"],
+            "chapters": [
+                {
+                    "num": num,
+                    "beats": beats[num],
+                    "content": content,
+                    "polished": polished.get(num)
+                }
+                for num, content in enumerate(contents, 1)
+            ]
+        }
+
+    def _submit(self, pool: ThreadPoolExecutor, run_id: str, stage: str, num: int, report, fn, *args) -> Future:
+        """已有检查点直接返回完成态 Future，否则提交任务并在完成后写检查点"""
+        cached = self.store.get(run_id, stage, num)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        def task():
+            report(stage, num, "running")
+            value = fn(*args)
+            self.store.put(run_id, stage, num, value)
+            report(stage, num, "done")
+            return value
+
+        return pool.submit(task)
+
+
+class AsyncBookPipeline(BookPipeline):
+    """异步整书生成流水线（AsyncNovelGenerator 使用）
+
+    阶段划分与 BookPipeline 相同：细纲与润色作为事件循环上的任务并发执行（最多 max_workers 个），
+    正文按顺序串行；检查点读写放到工作线程，不阻塞事件循环。
+    """
+
+    async def run(
+        self,
+        genre: str,
+        theme: str,
+        main_char: str,
+        length: str = "短篇",
+        chapters: int = None,
+        style_genes: Dict = None,
+        word_count: int = 2000,
+        polish_level: str = None,
+        run_id: str = None,
+        progress: Callable[[str, int, str], None] = None
+    ) -> Dict:
+        """执行（或续跑）整书生成，参数同 BookPipeline.run"""
+        config = self._config(genre, theme, main_char, length, chapters, style_genes, word_count, polish_level)
+        run_id = run_id or self.make_run_id(config)
+        await asyncio.to_thread(self.store.save_run, run_id, config)
+        report = progress or (lambda stage, num, status: None)
+
+        outline = await asyncio.to_thread(self.store.get, run_id, "outline")
+        if outline is None:
+            report("outline", 0, "running")
+            outline = await self.generator.generate_outline(genre, theme, main_char, length, style_genes)
+            await asyncio.to_thread(self.store.put, run_id, "outline", "", outline)
+        report("outline", 0, "done")
+        total = chapters or outline["chapters"]
+
+        limit = asyncio.Semaphore(self.max_workers)
+        beat_tasks = {
+            num: self._spawn(limit, run_id, "beats", num, report, self.generator.generate_beats,
+                             outline["outline"], num, total, genre)
+            for num in range(1, total + 1)
+        }
+        polish_tasks: Dict[int, asyncio.Task] = {}
+        try:
+            contents: List[str] = []
+            memory = StoryMemory(self.generator.client)
+            memory.load(await asyncio.to_thread(self.store.get, run_id, "memory") or {})
+            for num in range(1, total + 1):
+                self._raise_failed(beat_tasks, polish_tasks)
+                content = await asyncio.to_thread(self.store.get, run_id, "chapter", num)
+                if content is None:
+                    beats = await beat_tasks[num]
+                    report("chapter", num, "running")
+                    content = await self.generator.generate_chapter(
+                        outline["outline"],
+                        contents[-1] if contents else "",
+                        num,
+                        genre=genre,
+                        style_genes=style_genes,
+                        word_count=word_count,
+                        beats=beats,
+                        memory=memory
+                    )
+                    await asyncio.to_thread(self.store.put, run_id, "chapter", num, content)
+                else:
+                    await memory.aupdate(num, content)
+                await asyncio.to_thread(self.store.put, run_id, "memory", "", memory.to_dict())
+                report("chapter", num, "done")
+                contents.append(content)
+                if polish_level:
+                    polish_tasks[num] = self._spawn(limit, run_id, "polish", num, report,
+                                                    self.generator.polish_chapter, content, polish_level)
+
+            beats = {num: await task for num, task in beat_tasks.items()}
+            polished = {num: await task for num, task in polish_tasks.items()}
+        finally:
+            # 出错或被取消时不留下后台任务
+            for task in [*beat_tasks.values(), *polish_tasks.values()]:
+                task.cancel()
+
+        return self._result(run_id, genre, theme, outline, beats, contents, polished)
+
+    def _spawn(self, limit: asyncio.Semaphore, run_id: str, stage: str, num: int, report, fn, *args) -> asyncio.Task:
+        """已有检查点直接返回，否则在并发上限内执行并写检查点"""
+        async def task():
+            cached = await asyncio.to_thread(self.store.get, run_id, stage, num)
+            if cached is not None:
+                return cached
+            async with limit:
+                report(stage, num, "running")
+                value = await fn(*args)
+                await asyncio.to_thread(self.store.put, run_id, stage, num, value)
+                report(stage, num, "done")
+                return value
+
+        return asyncio.ensure_future(task())
@@ -0,0 +1,144 @@
+"""
+分块润色工具
+按段落/场景切分章节，并以分块内容哈希缓存润色结果（SQLite 持久化，跨进程、跨重跑复用）
+"""
+from collections import OrderedDict
+from typing import List, Optional
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# 场景分隔行：***、* * *、———、###、空行以外的纯符号行
+SCENE_BREAK = re.compile(r"^\s*([*＊#＃=＝~～\-—·]\s*){3,}$")
+
+# 润色提示词版本：修改 NovelGenerator._polish_messages 时递增，旧缓存随之失效
+PROMPT_VERSION = "1"
+
+
+def _hash(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def split_chunks(content: str, chunk_chars: int = 1500, min_chars: int = 400) -> List[str]:
+    """把章节切成若干润色分块（每块由完整段落组成）
+
+    分块边界由段落内容决定（累计超过 min_chars 且段落哈希命中时断开，
+    超过 chunk_chars 时强制断开，场景分隔行处总是断开），
+    因此局部修改只会影响所在分块，其余分块保持不变，可命中缓存。
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in content.split("\n"):
+        if SCENE_BREAK.match(line):
+            if current:
+                chunks.append("\n".join(current))
+            chunks.append(line)
+            current, size = [], 0
+            continue
+        current.append(line)
+        size += len(line)
+        if line.strip() and (size >= chunk_chars or (size >= min_chars and _hash(line) % 4 == 0)):
+            chunks.append("\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def needs_polish(chunk: str) -> bool:
+    """空白分块和场景分隔行原样保留"""
+    return bool(chunk.strip()) and not SCENE_BREAK.match(chunk)
+
+
+class PolishCache:
+    """分块润色结果缓存（键：提示词版本 + 润色强度 + 分块内容哈希）
+
+    内存中按最近使用保留 max_entries 条；给定 path 时写入 SQLite，
+    同一份章节在新进程或重跑时仍能命中，只有改动过的分块重新润色。
+    """
+
+    def __init__(self, max_entries: int = 4096, path: str = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS polish_chunks (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self.conn.commit()
+
+    @staticmethod
+    def key(chunk: str, level: str) -> str:
+        return hashlib.sha1(f"{PROMPT_VERSION}\x00{level}\x00{chunk}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, value: str):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def get(self, chunk: str, level: str) -> Optional[str]:
+        key = self.key(chunk, level)
+        with self._lock:
+            value = self._items.get(key)
+            if value is None and self.conn is not None:
+                row = self.conn.execute("SELECT value FROM polish_chunks WHERE key = ?", (key,)).fetchone()
+                if row:
+                    value = row[0]
+                    self._remember(key, value)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, chunk: str, level: str, value: str):
+        key = self.key(chunk, level)
+        with self._lock:
+            self._remember(key, value)
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO polish_chunks (key, value, updated) VALUES (?, ?, ?)",
+                    (key, value, time.time())
+                )
+                self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+_cache: Optional[PolishCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_polish_cache() -> PolishCache:
+    """获取共享润色缓存；默认与检查点同库（CHECKPOINT_PATH），POLISH_CACHE_PATH 可单独指定，置空则只用内存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = os.getenv("POLISH_CACHE_PATH", os.getenv("CHECKPOINT_PATH", "./data/checkpoints.db"))
+            _cache = PolishCache(
+                max_entries=int(os.getenv("POLISH_CACHE_MAX_ENTRIES", "4096")),
+                path=path or None
+            )
+    return _cache
@@ -3,12 +3,13 @@ AI 小说创作助手
 """
 import os
 from openai import OpenAI
+from src.api.cache import cached_client
 
 # 配置API
-client = OpenAI(
+client = cached_client(OpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
     base_url=os.getenv("OPENAI_BASE_URL", "https://api.minimax.chat/v1")
-)
+))
 
 def generate_story(genre: str, prompt: str, max_tokens: int = 1000) -> str:
     """生成小说内容"""
@@ -0,0 +1,261 @@
+"""
+定时任务调度
+排行榜抓取 → 章节增量入库 → 基因提取，以及 EvoMap 心跳
+
+- 任务持久化在 SQLAlchemy 任务库（SCHEDULER_DB_URL），重启后保留下次运行时间
+- 每个任务 max_instances=1 + 跨进程文件锁，同一任务不会重叠运行
+- 停机错过的运行在宽限期内合并补跑一次（coalesce），超出宽限期跳过
+- 调用 LLM 的任务走单独的执行器，并与 API 服务、任务工作进程共用跨进程限速器（RPM/TPM/在途上限，见 LLM_LIMITER_DB）
+
+用法：python -m src.scheduler.cron [--list] [--run JOB]
+"""
+from typing import Callable, Dict, Optional
+import argparse
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# 任务定义：cron 表达式（可用 SCHEDULE_<ID> 覆盖）、随机抖动秒数、补跑宽限期、执行器
+JOBS = {
+    "crawl_rankings": {
+        "func": "src.scheduler.cron:crawl_rankings",
+        "cron": "0 2 * * *",
+        "jitter": 600,
+        "grace": 6 * 3600,
+        "executor": "default"
+    },
+    "ingest_chapters": {
+        "func": "src.scheduler.cron:ingest_chapters",
+        "cron": "30 3 * * *",
+        "jitter": 600,
+        "grace": 6 * 3600,
+        "executor": "default"
+    },
+    "extract_genes": {
+        "func": "src.scheduler.cron:extract_genes",
+        "cron": "15 * * * *",
+        "jitter": 120,
+        "grace": 3600,
+        "executor": "llm"
+    },
+    "evomap_heartbeat": {
+        "func": "src.scheduler.cron:evomap_heartbeat",
+        "cron": "*/15 * * * *",
+        "jitter": 60,
+        "grace": 60,
+        "executor": "default"
+    }
+}
+
+
+# ============ 跨进程互斥 ============
+
+class JobLock:
+    """任务文件锁（非阻塞）：另一个进程正在运行同一任务时直接跳过"""
+
+    def __init__(self, name: str, directory: str = None):
+        directory = directory or os.getenv("SCHEDULER_LOCK_DIR", "./data/locks")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.lock")
+        self._file = None
+
+    def acquire(self) -> bool:
+        try:
+            import fcntl
+        except ImportError:  # 非 POSIX 平台只依赖进程内的 max_instances
+            return True
+        self._file = open(self.path, "w")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._file:
+            self._file.close()  # 关闭文件即释放 flock
+            self._file = None
+
+
+def _guarded(name: str, work: Callable[[], Dict]) -> Optional[Dict]:
+    lock = JobLock(name)
+    if not lock.acquire():
+        logger.warning("任务 %s 正在其他进程运行，本次跳过", name)
+        return None
+    start = time.perf_counter()
+    try:
+        result = work()
+        logger.info("任务 %s 完成，用时 %.1fs：%s", name, time.perf_counter() - start, result)
+        return result
+    finally:
+        lock.release()
+
+
+# ============ 任务 ============
+
+def crawl_rankings() -> Optional[Dict]:
+    """抓取各站点各题材排行榜并记入排行榜历史"""
+    def work():
+        from src.crawler.ranking import NovelCrawler
+        from src.crawler.rules import get_extractor
+        from src.database.rankings import get_ranking_store
+
+        crawler = NovelCrawler(ranking_store=get_ranking_store())
+        counts = {}
+        try:
+            for site, rule in get_extractor().rules.items():
+                for category in rule.categories:
+                    counts[f"{site}/{category}"] = len(crawler.get_ranking(site, category))
+        finally:
+            crawler.close()
+        return counts
+    return _guarded("crawl_rankings", work)
+
+
+def ingest_chapters() -> Optional[Dict]:
+    """对近期上升最快的作品增量抓取开篇章节"""
+    def work():
+        from src.crawler.ingest import ChapterIngestor
+        from src.crawler.ranking import NovelCrawler
+        from src.database.rankings import get_ranking_store
+
+        books = int(os.getenv("SCHEDULER_INGEST_BOOKS", "20"))
+        chapters = int(os.getenv("SCHEDULER_INGEST_CHAPTERS", "50"))
+        crawler = NovelCrawler()
+        # 目录页与章节页共用一个引擎：robots 缓存、主机节流与连接池在整轮任务中保留
+        ingestor = ChapterIngestor(engine=crawler.engines)
+        stats = {"books": 0, "changed": 0}
+        seen = set()
+        try:
+            for book in get_ranking_store().risers(days=7, limit=books):
+                # 同一作品可能在多个榜单同时上升
+                if not book.get("url") or book["id"] in seen:
+                    continue
+                seen.add(book["id"])
+                toc = crawler.get_toc(book["url"])[:chapters]
+                if toc:
+                    result = ingestor.ingest(f"{book['site']}:{book['url']}", toc)
+                    stats["books"] += 1
+                    stats["changed"] += len(result["changed_chapters"])
+        finally:
+            crawler.close()
+        return stats
+    return _guarded("ingest_chapters", work)
+
+
+def extract_genes() -> Optional[Dict]:
+    """对新增或修改过的章节提取基因（经共享限速器）"""
+    def work():
+        from src.analyzer.gene import GeneAnalyzer
+        from src.api.minimax_client import get_client
+        from src.crawler.ingest import ChapterIngestor
+
+        return {"chapters": ChapterIngestor().analyze_pending(GeneAnalyzer(get_client()))}
+    return _guarded("extract_genes", work)
+
+
+def evomap_heartbeat() -> Optional[Dict]:
+    """EvoMap 节点心跳（未配置 EVOMAP_NODE_ID 时跳过）"""
+    node_id = os.getenv("EVOMAP_NODE_ID")
+    if not node_id:
+        return None
+
+    def work():
+        from src.evomap.client import EvoMapClient
+        return EvoMapClient(node_id=node_id).heartbeat()
+    return _guarded("evomap_heartbeat", work)
+
+
+# ============ 调度器 ============
+
+def build_scheduler(url: str = None):
+    """创建调度器（持久化任务库 + 默认执行器 + LLM 执行器）"""
+    from apscheduler.executors.pool import ThreadPoolExecutor
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    url = url or os.getenv("SCHEDULER_DB_URL", "sqlite:///data/scheduler.db")
+    if url.startswith("sqlite:///") and os.path.dirname(url[len("sqlite:///"):]):
+        os.makedirs(os.path.dirname(url[len("sqlite:///"):]), exist_ok=True)
+    return BackgroundScheduler(
+        jobstores={"default": SQLAlchemyJobStore(url=url)},
+        executors={
+            "default": ThreadPoolExecutor(int(os.getenv("SCHEDULER_WORKERS", "4"))),
+            "llm": ThreadPoolExecutor(int(os.getenv("SCHEDULER_LLM_JOBS", "1")))
+        },
+        job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 3600},
+        timezone=os.getenv("SCHEDULER_TIMEZONE", "Asia/Shanghai")
+    )
+
+
+def _trigger_key(trigger) -> tuple:
+    return str(trigger), trigger.jitter, str(trigger.timezone)
+
+
+def register_jobs(scheduler) -> list:
+    """注册（或按当前配置更新）全部任务；需在 scheduler.start(paused=True) 之后调用，才能看到任务库中已有的任务
+
+    任务库中已有的任务保留其下次运行时间（停机期间错过的运行才能补跑），只有 cron 表达式变化时才重新排期
+    """
+    from apscheduler.triggers.cron import CronTrigger
+
+    jobs = []
+    for job_id, spec in JOBS.items():
+        expression = os.getenv(f"SCHEDULE_{job_id.upper()}", spec["cron"])
+        existing = scheduler.get_job(job_id)
+        if expression in ("", "off"):
+            if existing:
+                scheduler.remove_job(job_id)
+            continue
+        trigger = CronTrigger.from_crontab(expression, timezone=scheduler.timezone)
+        trigger.jitter = spec["jitter"]
+        if existing is None:
+            jobs.append(scheduler.add_job(
+                spec["func"],
+                trigger=trigger,
+                id=job_id,
+                name=job_id,
+                executor=spec["executor"],
+                misfire_grace_time=spec["grace"]
+            ))
+            continue
+        if _trigger_key(existing.trigger) != _trigger_key(trigger):
+            scheduler.reschedule_job(job_id, trigger=trigger)
+        jobs.append(scheduler.modify_job(
+            job_id,
+            func=spec["func"],
+            name=job_id,
+            executor=spec["executor"],
+            misfire_grace_time=spec["grace"]
+        ))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="定时任务调度")
+    parser.add_argument("--list", action="store_true", help="列出任务与下次运行时间")
+    parser.add_argument("--run", choices=list(JOBS), help="立即运行一次指定任务")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.run:
+        print(globals()[args.run]())
+    else:
+        scheduler = build_scheduler()
+        scheduler.start(paused=True)
+        register_jobs(scheduler)
+        if args.list:
+            for job in scheduler.get_jobs():
+                print(f"{job.id:20s} {job.trigger}  下次运行: {job.next_run_time}")
+            scheduler.shutdown(wait=False)
+        else:
+            scheduler.resume()  # 停机期间错过的运行在此按宽限期补跑
+            try:
+                while True:
+                    time.sleep(3600)
+            except (KeyboardInterrupt, SystemExit):
+                scheduler.shutdown()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+# 润色缓存默认落盘到 ./data，测试里只用内存
+os.environ.setdefault("POLISH_CACHE_PATH", "")
+# 跨进程限速库同理，测试中各进程各自限速
+os.environ.setdefault("LLM_LIMITER_DB", "")
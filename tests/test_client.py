@@ -0,0 +1,67 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+from src.api.cache import ResponseCache
+from src.api.ratelimit import RateLimiter
+from src.api.resilience import AdaptiveLimiter, Resilience
+
+
+def _completion(content="ok"):
+    return ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    })
+
+
+def test_async_client_cache_io_runs_off_event_loop(tmp_path):
+    from src.api.minimax_client import AsyncMiniMaxClient
+
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    threads = []
+    for name in ("get_response", "put_response"):
+        method = getattr(cache, name)
+
+        def recorded(*args, _method=method, **kwargs):
+            threads.append(threading.get_ident())
+            return _method(*args, **kwargs)
+        setattr(cache, name, recorded)
+
+    calls = []
+
+    async def create(**params):
+        calls.append(params)
+        return _completion()
+
+    client = AsyncMiniMaxClient(api_key="test", rate_limiter=RateLimiter(), response_cache=cache,
+                                resilience=Resilience(limiter=AdaptiveLimiter()))
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def main():
+        loop_thread = threading.get_ident()
+        messages = [{"role": "user", "content": "hi"}]
+        first = await client.chat(messages, temperature=0, use_cache=True)
+        second = await client.chat(messages, temperature=0, use_cache=True)
+        return loop_thread, first, second
+
+    loop_thread, first, second = asyncio.run(main())
+    assert first.choices[0].message.content == second.choices[0].message.content == "ok"
+    assert len(calls) == 1
+    assert len(threads) == 3 and loop_thread not in threads
+
+
+def test_cache_skips_creative_temperatures(tmp_path, monkeypatch):
+    import src.api.cache as cache_module
+
+    monkeypatch.setenv("RESPONSE_CACHE", "1")
+    monkeypatch.setenv("RESPONSE_CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.delenv("RESPONSE_CACHE_MAX_TEMPERATURE", raising=False)
+    monkeypatch.setattr(cache_module, "_cache", None)
+    cache = cache_module.get_response_cache()
+    assert cache.cacheable({"temperature": 0})
+    assert cache.cacheable({"temperature": 0.3})
+    assert not cache.cacheable({"temperature": 0.7})
+    assert ResponseCache(str(tmp_path / "other.db"), max_temperature=None).cacheable({"temperature": 0.7})
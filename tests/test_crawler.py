@@ -0,0 +1,233 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.crawler.engine import CrawlEngine, ValidatorStore
+from src.crawler.ingest import ChapterIngestor, ChapterStore
+from src.crawler.ranking import NovelCrawler
+from src.crawler.rules import Extractor
+
+ROBOTS = "User-agent: *\nDisallow: /private/\nCrawl-delay: 1\n"
+TOC = '<html><body><div id="list"><a href="/chapter/1">第一章</a><a href="/chapter/2">第二章</a></div></body></html>'
+
+
+class _Site:
+    """本地站点：robots.txt、带 ETag 的页面（If-None-Match 命中返回 304）、先 429 再成功的页面"""
+
+    def __init__(self):
+        self.hits = {}
+        self.flaky = 1  # /flaky 先返回几次 429
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body="", headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                site.hits[self.path] = site.hits.get(self.path, 0) + 1
+                if self.path == "/robots.txt":
+                    self._send(200, ROBOTS)
+                elif self.path.startswith("/chapter/") or self.path == "/toc":
+                    if self.headers.get("If-None-Match") == '"v1"':
+                        self._send(304)
+                    else:
+                        body = TOC if self.path == "/toc" else f"<html><body><div id='content'>{self.path} 正文</div></body></html>"
+                        self._send(200, body, {"ETag": '"v1"'})
+                elif self.path == "/flaky":
+                    if site.flaky > 0:
+                        site.flaky -= 1
+                        self._send(429, "slow down", {"Retry-After": "1"})
+                    else:
+                        self._send(200, "ok")
+                else:
+                    self._send(404, "missing")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def site():
+    site = _Site()
+    yield site
+    site.close()
+
+
+def _options(tmp_path):
+    return dict(per_host_delay=0.0, backoff=0.01, validators=ValidatorStore(str(tmp_path / "crawl.db")))
+
+
+def test_robots_disallow_and_crawl_delay(site, tmp_path):
+    crawler = NovelCrawler(**_options(tmp_path))
+    try:
+        pages = crawler.engines.run(lambda: crawler._fetch_pages([f"{site.url}/private/x", f"{site.url}/chapter/1"]))
+        assert pages[0]["error"] == "disallowed by robots.txt"
+        assert pages[1]["status"] == 200
+        assert "/private/x" not in site.hits
+
+        # Crawl-delay 提高该主机的请求间隔
+        start = time.monotonic()
+        crawler.fetch_chapters([f"{site.url}/chapter/2", f"{site.url}/chapter/3"], concurrency=2)
+        assert time.monotonic() - start >= 1.0
+    finally:
+        crawler.close()
+
+
+def test_not_modified_served_from_cache(site, tmp_path):
+    crawler = NovelCrawler(**_options(tmp_path))
+    try:
+        first = crawler.fetch_chapters([f"{site.url}/chapter/1"])[0]
+        second = crawler.fetch_chapters([f"{site.url}/chapter/1"])[0]
+        assert not first["not_modified"]
+        assert second["not_modified"] and second["status"] == 304
+        assert second["text"] == first["text"] and "正文" in second["text"]
+    finally:
+        crawler.close()
+
+
+def test_retry_after_backoff(site, tmp_path):
+    crawler = NovelCrawler(**_options(tmp_path))
+    try:
+        start = time.monotonic()
+        page = crawler.engines.run(lambda: crawler._fetch_pages([f"{site.url}/flaky"]))[0]
+        assert page["status"] == 200 and page["error"] is None
+        assert page["attempts"] == 2
+        assert time.monotonic() - start >= 1.0
+        assert site.hits["/flaky"] == 2
+    finally:
+        crawler.close()
+
+
+def test_retries_exhausted(site, tmp_path):
+    site.flaky = 10
+    engine_options = {**_options(tmp_path), "max_retries": 1}
+    crawler = NovelCrawler(**engine_options)
+    try:
+        page = crawler.engines.run(lambda: crawler._fetch_pages([f"{site.url}/flaky"]))[0]
+        assert page["error"] == "HTTP 429" and page["attempts"] == 2
+    finally:
+        crawler.close()
+
+
+def test_one_engine_across_calls(site, tmp_path, monkeypatch):
+    host = site.url.split("//")[1]
+    extractor = Extractor(rules={"local": {"hosts": (host,), "toc": "#list a", "chapter": {"content": "#content"}}})
+    monkeypatch.setattr("src.crawler.ranking.get_extractor", lambda: extractor)
+    crawler = NovelCrawler(**_options(tmp_path))
+    ingestor = ChapterIngestor(store=ChapterStore(str(tmp_path / "chapters.db")), engine=crawler.engines)
+    try:
+        toc = crawler.get_toc(f"{site.url}/toc")
+        assert toc == [f"{site.url}/chapter/1", f"{site.url}/chapter/2"]
+        assert crawler.get_toc(f"{site.url}/toc") == toc
+        assert ingestor.ingest("book", toc)["new"] == 2
+        assert ingestor.ingest("book", toc, recheck=2)["not_modified"] == 2
+        # robots.txt 只取一次：各次同步调用与入库共用同一个引擎
+        assert site.hits["/robots.txt"] == 1
+    finally:
+        crawler.close()
+
+
+def test_external_engine_not_closed(site, tmp_path):
+    async def main():
+        engine = CrawlEngine(**_options(tmp_path))
+        crawler = NovelCrawler(engine=engine)
+        pages = await crawler._fetch_pages([f"{site.url}/chapter/1"])
+        assert pages[0]["status"] == 200
+        assert not engine.client.is_closed
+        await engine.close()
+
+    asyncio.run(main())
+
+
+def test_unknown_site_raises_value_error():
+    extractor = Extractor()
+    with pytest.raises(ValueError, match="nosuchsite"):
+        extractor.category_url("nosuchsite", "fantasy")
+    with pytest.raises(ValueError):
+        extractor.ranking("<html></html>", site="nosuchsite")
+    assert extractor.category_url("qidian", "nosuchgenre") is None
+
+
+XHTML = """<?xml version="1.0" encoding="gbk"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml"><head><title>第一章</title></head>
+<body><div id="list"><a href="/chapter/1">第一章</a><a href="/chapter/2">第二章</a></div>
+<div id="content">第一段<br/>第二段</div></body></html>"""
+
+
+def test_backends_agree_on_xml_declared_pages():
+    pytest.importorskip("lxml")
+    pytest.importorskip("bs4")
+    rules = {"local": {"hosts": ("example.test",), "toc": "#list a", "chapter": {"title": "title", "content": "#content"}}}
+    lxml_result, soup_result = (
+        (extractor.toc(XHTML, url="http://example.test/toc"), extractor.chapter(XHTML, url="http://example.test/c/1"))
+        for extractor in (Extractor("lxml", rules), Extractor("bs4", rules))
+    )
+    assert lxml_result == soup_result
+    assert lxml_result[0] == ["http://example.test/chapter/1", "http://example.test/chapter/2"]
+    assert lxml_result[1] == {"title": "第一章", "text": "第一段\n第二段"}
+
+
+def test_parse_errors_stay_on_their_page(tmp_path, monkeypatch):
+    def extract(html, url):
+        if url.endswith("/2"):
+            raise ValueError("broken page")
+        return html
+
+    monkeypatch.setattr("src.crawler.ranking.extract_chapter_text", extract)
+    pages = [
+        {"url": f"http://example.test/{i}", "text": "<p>正文</p>", "not_modified": False, "status": 200, "error": None}
+        for i in (1, 2)
+    ]
+    results = [NovelCrawler._chapter(page) for page in pages]
+    assert results[0]["text"] == "<p>正文</p>" and results[0]["error"] is None
+    assert results[1]["text"] is None and "broken page" in results[1]["error"]
+
+    ingestor = ChapterIngestor(store=ChapterStore(str(tmp_path / "chapters.db")), extract=extract)
+    assert [ingestor._ingest_page("book", i, page, None) for i, page in enumerate(pages, 1)] == ["new", "errors"]
+    assert "broken page" in pages[1]["error"]
+
+
+def test_store_io_runs_off_event_loop(site, tmp_path, monkeypatch):
+    validators = ValidatorStore(str(tmp_path / "crawl.db"))
+    store = ChapterStore(str(tmp_path / "chapters.db"))
+    threads = []
+    for target, name in ((validators, "get"), (validators, "put"), (validators, "text"),
+                         (store, "known"), (store, "put"), (store, "touch"), (store, "set_watermark")):
+        method = getattr(target, name)
+
+        def recorded(*args, _method=method, **kwargs):
+            threads.append(threading.get_ident())
+            return _method(*args, **kwargs)
+        monkeypatch.setattr(target, name, recorded)
+
+    engine = CrawlEngine(per_host_delay=0.0, validators=validators)
+    ingestor = ChapterIngestor(store=store, engine=engine, extract=lambda html, url: html)
+    toc = [f"{site.url}/chapter/1", f"{site.url}/chapter/2"]
+    try:
+        assert ingestor.ingest("book", toc)["new"] == 2
+        assert ingestor.ingest("book", toc, recheck=2)["not_modified"] == 2
+    finally:
+        ingestor.engines.run(engine.close)
+        ingestor.engines.close()
+    # 同步接口的事件循环运行在调用线程上
+    assert threads and threading.get_ident() not in threads
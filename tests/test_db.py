@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from src.database.db import GeneDatabase
+
+REPORT = {
+    "genre": {"genre": "玄幻", "confidence": 0.9},
+    "excitement_points": ["越级挑战", "废柴逆袭打脸"],
+    "golden_sentences": ["三十年河东，三十年河西，莫欺少年穷", "我命由我不由天"],
+    "meta": {"latency": 1.0}
+}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return GeneDatabase(str(tmp_path / "genes.db"))
+
+
+def _texts(items):
+    return sorted(item["data"]["text"] for item in items)
+
+
+@pytest.mark.skipif(sqlite3.sqlite_version_info < (3, 34, 0), reason="trigram 分词需要 SQLite >= 3.34")
+def test_trigram_search_matches_chinese_substrings(db):
+    db.upsert_report(REPORT, source="book:1")
+    db.upsert_report({"genre": {"genre": "都市"}, "excitement_points": ["豪门打脸"]}, source="book:2")
+
+    # 词中间的子串也能命中（trigram 不依赖分词）
+    assert _texts(db.search_text("莫欺少年")) == ["三十年河东，三十年河西，莫欺少年穷"]
+    assert _texts(db.search_text("逆袭打脸")) == ["废柴逆袭打脸"]
+    assert _texts(db.search_text("由我不", gene_type="sentence")) == ["我命由我不由天"]
+    assert db.search_text("由我不", gene_type="excitement") == []
+    # 少于 3 个字符走 LIKE 扫描，并可按题材过滤
+    assert _texts(db.search_text("打脸")) == ["废柴逆袭打脸", "豪门打脸"]
+    assert _texts(db.search_text("打脸", genre="都市")) == ["豪门打脸"]
+    assert db.search_text('"引号') == []
+    # meta 不写入报告
+    report = db.list_genes(gene_type="report")["items"][0]
+    assert "meta" not in report["data"] and report["genre"] == "玄幻"
+
+
+def test_index_follows_updates(db):
+    db.upsert_genes([{"type": "sentence", "source": "s", "name": "n", "data": {"text": "旧的金句内容"}}])
+    first = db.list_genes(gene_type="sentence")["items"][0]
+    # 内容未变化时不更新
+    db.upsert_genes([{"type": "sentence", "source": "s", "name": "n", "data": {"text": "旧的金句内容"}}])
+    assert db.get_gene(first["id"])["updated"] == first["updated"]
+
+    db.upsert_genes([{"type": "sentence", "source": "s", "name": "n", "data": {"text": "新的金句内容"}}])
+    assert db.search_text("旧的金句") == []
+    assert [item["id"] for item in db.search_text("新的金句")] == [first["id"]]
+    assert db.count("sentence") == 1
+
+
+def test_cursor_pagination(db):
+    db.upsert_genes([
+        {"type": "excitement", "genre": "玄幻" if i % 2 else "都市", "source": "bulk", "name": f"爽点{i}",
+         "data": {"text": f"爽点{i}"}}
+        for i in range(25)
+    ])
+    seen, cursor, pages = [], 0, 0
+    while True:
+        page = db.list_genes(gene_type="excitement", cursor=cursor, limit=10)
+        seen += [item["name"] for item in page["items"]]
+        pages += 1
+        if page["next_cursor"] is None:
+            break
+        cursor = page["next_cursor"]
+    assert pages == 3 and seen == [f"爽点{i}" for i in range(25)]
+
+    page = db.list_genes(genre="玄幻", limit=5)
+    assert len(page["items"]) == 5 and all(item["genre"] == "玄幻" for item in page["items"])
+    rest = db.list_genes(genre="玄幻", cursor=page["next_cursor"], limit=500)
+    assert len(rest["items"]) == 7 and rest["next_cursor"] is None
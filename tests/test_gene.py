@@ -0,0 +1,90 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.analyzer.gene import ASPECTS, GeneAnalyzer
+
+VALUES = {
+    "genre": {"genre": "玄幻", "confidence": 0.9, "reason": "修炼"},
+    "personality": {"traits": ["坚韧"], "ability": "系统", "growth": "废柴到强者", "motivation": "复仇"},
+    "excitement_points": ["打脸"],
+    "golden_sentences": ["莫欺少年穷"],
+    "emotion_curve": {"curve": [{"stage": "开端", "emotion": "压抑", "intensity": 3}]}
+}
+
+
+def _usage(total):
+    return SimpleNamespace(model_dump=lambda: {"prompt_tokens": total - 1, "completion_tokens": 1, "total_tokens": total})
+
+
+class FakeClient:
+    """chat 返回合并报告，batch_run 按维度返回各自结果"""
+
+    def __init__(self, combined):
+        self.combined = combined
+        self.chats = []
+        self.batches = []
+
+    def chat(self, messages, **kwargs):
+        self.chats.append(kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(self.combined, ensure_ascii=False)))],
+            usage=_usage(100)
+        )
+
+    def batch_run(self, tasks, max_workers=None):
+        self.batches.append(([self._aspect(task) for task in tasks], max_workers))
+        return [
+            {"content": json.dumps(VALUES[self._aspect(task)], ensure_ascii=False), "latency": 0.01,
+             "usage": {"prompt_tokens": 9, "completion_tokens": 1, "total_tokens": 10}, "error": None}
+            for task in tasks
+        ]
+
+    @staticmethod
+    def _aspect(task):
+        prompt = task["messages"][-1]["content"]
+        return next(name for name, spec in ASPECTS.items() if spec["instruction"] in prompt)
+
+
+@pytest.fixture(autouse=True)
+def no_local_genre(monkeypatch):
+    monkeypatch.setenv("GENRE_MATCH", "0")
+
+
+def test_single_mode_uses_one_combined_request():
+    client = FakeClient(VALUES)
+    report = GeneAnalyzer(client).generate_gene_report("正文", mode="single")
+    assert len(client.chats) == 1 and client.chats[0]["task"] == "analysis"
+    assert client.batches == []
+    assert {aspect: report[aspect] for aspect in ASPECTS} == VALUES
+    assert report["meta"]["usage"]["total_tokens"] == 100
+    assert all(item["shared"] for item in report["meta"]["aspects"].values())
+
+
+def test_single_mode_backfills_invalid_aspects():
+    combined = dict(VALUES, golden_sentences="不是列表")
+    del combined["personality"]
+    client = FakeClient(combined)
+    report = GeneAnalyzer(client).generate_gene_report("正文", mode="single")
+    assert client.batches == [(["personality", "golden_sentences"], None)]
+    assert report["personality"] == VALUES["personality"]
+    assert report["golden_sentences"] == VALUES["golden_sentences"]
+    # 合并请求的用量只计一次，再加两个补发请求
+    assert report["meta"]["usage"]["total_tokens"] == 120
+
+
+@pytest.mark.parametrize("mode, max_workers", [("parallel", None), ("sequential", 1)])
+def test_fanout_modes(mode, max_workers):
+    client = FakeClient(VALUES)
+    report = GeneAnalyzer(client).generate_gene_report("正文", mode=mode)
+    assert client.chats == []
+    assert client.batches == [(list(ASPECTS), max_workers)]
+    assert {aspect: report[aspect] for aspect in ASPECTS} == VALUES
+    assert report["meta"]["mode"] == mode
+    assert report["meta"]["usage"]["total_tokens"] == 10 * len(ASPECTS)
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError, match="报告模式"):
+        GeneAnalyzer(FakeClient(VALUES)).generate_gene_report("正文", mode="bogus")
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from src.generator.novel import AsyncNovelGenerator, NovelGenerator
+from src.generator.pipeline import CheckpointStore
+
+
+def _reply(task):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"<{task}>"))])
+
+
+class FakeClient:
+    max_workers = 4
+
+    def __init__(self):
+        self.tasks = []
+
+    def chat(self, messages, task=None, **kwargs):
+        self.tasks.append(task)
+        return _reply(task)
+
+
+class FakeAsyncClient(FakeClient):
+    async def chat(self, messages, task=None, **kwargs):
+        await asyncio.sleep(0)
+        self.tasks.append(task)
+        return _reply(task)
+
+
+BOOK = dict(genre="玄幻", theme="逆袭", main_char="林凡", chapters=3, polish_level="light", word_count=200)
+
+
+def test_async_generate_book_matches_sync(tmp_path):
+    expected = NovelGenerator(FakeClient()).generate_book(**BOOK, store=CheckpointStore(str(tmp_path / "sync.db")))
+
+    client = FakeAsyncClient()
+    book = asyncio.run(AsyncNovelGenerator(client).generate_book(
+        **BOOK, store=CheckpointStore(str(tmp_path / "async.db"))
+    ))
+    json.dumps(book)
+    assert book == expected
+    assert client.tasks.count("chapter") == 3
+    assert client.tasks.count("summary") == 3
+
+
+def test_async_generate_book_resumes_from_checkpoints(tmp_path):
+    store = CheckpointStore(str(tmp_path / "book.db"))
+    first = asyncio.run(AsyncNovelGenerator(FakeAsyncClient()).generate_book(**BOOK, store=store))
+
+    client = FakeAsyncClient()
+    again = asyncio.run(AsyncNovelGenerator(client).generate_book(**BOOK, store=store))
+    assert again == first
+    assert client.tasks == []
+
+
+def test_async_generate_chapter_updates_memory():
+    from src.generator.memory import StoryMemory
+
+    client = FakeAsyncClient()
+    memory = StoryMemory(client)
+    content = asyncio.run(AsyncNovelGenerator(client).generate_chapter("大纲", "", 1, memory=memory))
+    assert content == "<chapter>"
+    assert memory.chapters[1]["summary"] == "<summary>"
+
+
+def test_polish_cache_persists_across_generators(tmp_path, monkeypatch):
+    from src.generator import polish
+    from src.generator.polish import PolishCache
+
+    path = str(tmp_path / "checkpoints.db")
+    content = "第一段正文。\n\n* * *\n\n第二段正文。"
+    client = FakeClient()
+    generator = NovelGenerator(client)
+    generator.polish_cache = PolishCache(path=path)
+    first = generator.polish_chapter(content, level="light")
+    assert client.tasks.count("polish") == 2
+    generator.polish_cache.close()
+
+    # 新进程（新的缓存实例）重跑同一章节：全部命中，不再调用模型
+    client = FakeAsyncClient()
+    generator = AsyncNovelGenerator(client)
+    generator.polish_cache = PolishCache(path=path)
+    assert asyncio.run(generator.polish_chapter(content, level="light")) == first
+    assert client.tasks == []
+
+    # 润色强度或提示词版本变化时不复用旧结果
+    asyncio.run(generator.polish_chapter(content, level="heavy"))
+    assert client.tasks.count("polish") == 2
+    monkeypatch.setattr(polish, "PROMPT_VERSION", "2")
+    asyncio.run(generator.polish_chapter(content, level="light"))
+    assert client.tasks.count("polish") == 4
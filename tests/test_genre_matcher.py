@@ -0,0 +1,28 @@
+import random
+
+from src.analyzer.genre_matcher import AhoCorasick, GenreMatcher
+
+
+def _brute_force(patterns, text):
+    return [sum(text.startswith(p, i) for i in range(len(text))) for p in patterns]
+
+
+def test_single_character_patterns():
+    automaton = AhoCorasick(["a", "ab", "ba"])
+    assert automaton.count("axacbax") == _brute_force(automaton.patterns, "axacbax") == [3, 0, 1]
+
+
+def test_counts_match_brute_force():
+    rng = random.Random(42)
+    for _ in range(300):
+        patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 6))]
+        text = "".join(rng.choice("abcxy") for _ in range(rng.randint(0, 40)))
+        automaton = AhoCorasick(patterns)
+        assert automaton.count(text) == _brute_force(automaton.patterns, text), (patterns, text)
+
+
+def test_genre_lexicon_counts_match_brute_force():
+    matcher = GenreMatcher()
+    text = "他在宗门里修炼，突破筑基，又炼成金丹。公司老板开着豪车去会所。" * 3
+    assert matcher.automaton.count(text) == _brute_force(matcher.automaton.patterns, text)
+    assert matcher.classify(text * 5)["genre"] == "玄幻"
@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import time
+from types import SimpleNamespace
+
+from src.api.hedging import HedgeBudget, Hedger
+from src.api.ratelimit import RateLimiter
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)])
+
+
+class _Stream:
+    def __init__(self, name):
+        self.chunks = iter([_chunk(name)])
+        self.closed = False
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.closed = True
+
+
+class _AsyncStream(_Stream):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.closed = True
+
+
+def _hedger():
+    hedger = Hedger(min_delay=0.02, min_samples=1, budget=HedgeBudget(ratio=1))
+    hedger.tracker("m").observe(0.02)
+    return hedger
+
+
+def test_sync_race_discards_loser_and_keeps_context():
+    hedger = _hedger()
+    streams, seen, discarded = {}, [], []
+
+    def opener(name, delay):
+        def open_stream():
+            seen.append(request_id.get())
+            time.sleep(delay)
+            streams[name] = _Stream(name)
+            return streams[name]
+        return open_stream
+
+    request_id.set("req-1")
+    stream = hedger.race([
+        ("m", opener("primary", 0.3), lambda: discarded.append("primary")),
+        ("m", opener("backup", 0.0), lambda: discarded.append("backup"))
+    ])
+    assert next(iter(stream)).choices[0].delta.content == "backup"
+    assert seen == ["req-1", "req-1"]
+
+    # 慢的主请求打开后被关闭并归还
+    deadline = time.monotonic() + 2
+    while not discarded and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert discarded == ["primary"] and streams["primary"].closed
+    assert not streams["backup"].closed
+    assert hedger.counts["backup_wins"] == 1
+
+
+def test_async_race_discards_cancelled_loser():
+    hedger = _hedger()
+    discarded = []
+
+    def opener(name, delay):
+        async def open_stream():
+            await asyncio.sleep(delay)
+            return _AsyncStream(name)
+        return open_stream
+
+    async def main():
+        stream = await hedger.race_async([
+            ("m", opener("primary", 1.0), lambda: discarded.append("primary")),
+            ("m", opener("backup", 0.0), lambda: discarded.append("backup"))
+        ])
+        return [chunk.choices[0].delta.content async for chunk in stream]
+
+    assert asyncio.run(main()) == ["backup"]
+    assert discarded == ["primary"]
+
+
+def test_discard_refunds_unused_output_reservation():
+    from src.api.minimax_client import MiniMaxClient
+
+    limiter = RateLimiter(tpm=10000)
+    plan = {"estimated": 4100, "params": {"max_tokens": 4000}}
+    limiter.acquire(plan["estimated"])
+    client = MiniMaxClient.__new__(MiniMaxClient)
+    client.rate_limiter = limiter
+    client._discard(plan)
+    client._discard(plan)  # 同一个请求只结算一次
+    assert 9899 <= limiter.tokens.tokens <= 10000
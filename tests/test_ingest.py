@@ -0,0 +1,98 @@
+import pytest
+
+from src.crawler.ingest import ChapterIngestor, ChapterStore
+
+
+class FakeEngine:
+    """按 URL 返回预置页面，记录每次抓取的 URL；broken 中的 URL 返回错误"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.broken = set()
+        self.fetched = []
+
+    async def iter_fetch(self, urls, concurrency):
+        for url in urls:
+            self.fetched.append(url)
+            error = "HTTP 500" if url in self.broken else None
+            yield {"url": url, "text": None if error else self.pages[url], "not_modified": False,
+                   "status": 500 if error else 200, "error": error}
+
+    async def close(self):
+        pass
+
+
+def _url(num):
+    return f"http://example.test/c/{num}"
+
+
+def _toc(count):
+    return [_url(num) for num in range(1, count + 1)]
+
+
+@pytest.fixture
+def setup(tmp_path):
+    engine = FakeEngine({_url(num): f"第{num}章\n正文{num}" for num in range(1, 11)})
+    ingestor = ChapterIngestor(store=ChapterStore(str(tmp_path / "chapters.db")), engine=engine,
+                               extract=lambda html, url: html)
+    yield engine, ingestor
+    ingestor.engines.close()
+
+
+def test_watermark_fetches_only_new_chapters(setup):
+    engine, ingestor = setup
+    stats = ingestor.ingest("book", _toc(5))
+    assert stats["new"] == 5 and stats["watermark"] == 5
+    assert ingestor.store.watermark("book")["last_url"] == _url(5)
+
+    engine.fetched.clear()
+    stats = ingestor.ingest("book", _toc(7))
+    assert engine.fetched == [_url(6), _url(7)]
+    assert stats["new"] == 2 and stats["changed_chapters"] == [6, 7]
+
+    # 目录没有新章节：不抓取；recheck 只回看最近几章
+    engine.fetched.clear()
+    assert ingestor.ingest("book", _toc(7))["planned"] == 0
+    ingestor.ingest("book", _toc(7), recheck=2)
+    assert engine.fetched == [_url(6), _url(7)]
+
+
+def test_fingerprint_skips_unchanged_content(setup):
+    engine, ingestor = setup
+    ingestor.ingest("book", _toc(3))
+    ingestor.store.mark_analyzed(ingestor.store.pending_analysis("book"))
+
+    # 第 2 章只有排版变化（零宽字符、全角空格），第 3 章内容修改
+    engine.pages[_url(2)] = "\u3000\u3000第2章\u200b\n\n正文2  "
+    engine.pages[_url(3)] = "第3章\n正文3（修订）"
+    stats = ingestor.ingest("book", _toc(3), recheck=3)
+    assert stats["unchanged"] == 2 and stats["changed"] == 1
+    assert stats["changed_chapters"] == [3]
+    assert ingestor.store.text("book", 2) == "第2章\n正文2"
+    # 只有内容变化的章节需要重新分析
+    assert [item["num"] for item in ingestor.store.pending_analysis("book")] == [3]
+
+
+def test_failed_chapter_holds_watermark(setup):
+    engine, ingestor = setup
+    engine.broken.add(_url(3))
+    stats = ingestor.ingest("book", _toc(5))
+    assert stats["errors"] == 1 and stats["watermark"] == 2
+
+    engine.broken.clear()
+    engine.fetched.clear()
+    stats = ingestor.ingest("book", _toc(5))
+    # 失败章节及其后的章节重新抓取，已入库的 4、5 章指纹未变
+    assert engine.fetched == [_url(3), _url(4), _url(5)]
+    assert stats["new"] == 1 and stats["unchanged"] == 2 and stats["watermark"] == 5
+
+
+def test_reordered_toc_falls_back_to_url_comparison(setup):
+    engine, ingestor = setup
+    ingestor.ingest("book", _toc(4))
+    engine.fetched.clear()
+    # 作者删掉第 2 章并追加新章节：水位位置的 URL 对不上
+    toc = [_url(1), _url(3), _url(4), _url(5), _url(6)]
+    stats = ingestor.ingest("book", toc)
+    assert engine.fetched == [_url(5), _url(6)]
+    assert stats["watermark"] == 5
@@ -0,0 +1,215 @@
+import time
+
+import pytest
+
+from src.api import jobs
+from src.api.jobs import JobCancelled, JobContext, JobQueue, LeaseLost, Worker, validate_params
+from src.generator.novel import NovelGenerator
+from src.generator.pipeline import CheckpointStore
+
+from tests.test_generator import FakeClient
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), lease=60)
+
+
+# ============ 队列 ============
+
+def test_claim_by_priority_then_age(queue):
+    low = queue.submit("outline", {}, priority=0)
+    high = queue.submit("outline", {}, priority=5)
+    later = queue.submit("outline", {}, priority=0)
+    assert [queue.claim("w")["id"] for _ in range(3)] == [high, low, later]
+    assert queue.claim("w") is None
+
+
+def test_claim_filters_kinds(queue):
+    queue.submit("book", {})
+    assert queue.claim("w", ["outline"]) is None
+    assert queue.claim("w", ["book"])["kind"] == "book"
+
+
+def test_expired_lease_is_reclaimed(queue):
+    job_id = queue.submit("outline", {})
+    queue.lease = 0.01
+    assert queue.claim("w1")["id"] == job_id
+    assert not queue.renew(job_id, "w2")
+    time.sleep(0.02)
+    job = queue.claim("w2")
+    assert job["id"] == job_id and job["worker"] == "w2" and job["attempts"] == 2
+    assert not queue.renew(job_id, "w1")
+
+
+def test_fail_requeues_with_backoff_until_max_attempts(queue):
+    job_id = queue.submit("outline", {}, max_attempts=2)
+    queue.claim("w")
+    queue.fail(job_id, "boom", backoff=0.01)
+    job = queue.get(job_id)
+    assert job["status"] == "queued" and job["available_at"] > time.time() - 0.01
+    time.sleep(0.02)
+    assert queue.claim("w")["attempts"] == 2
+    queue.fail(job_id, "boom", backoff=0.01)
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_fail_without_retry(queue):
+    job_id = queue.submit("outline", {}, max_attempts=3)
+    queue.claim("w")
+    queue.fail(job_id, "TypeError", retry=False)
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_cancel_queued_and_running(queue):
+    queued = queue.submit("outline", {})
+    assert queue.cancel(queued) == "cancelled"
+    assert queue.claim("w") is None
+
+    running = queue.submit("outline", {})
+    job = queue.claim("w")
+    assert queue.cancel(running) == "cancelling"
+    with pytest.raises(JobCancelled):
+        JobContext(queue, job).emit("progress", {})
+    assert queue.cancel("missing") is None
+
+
+def test_cancel_requested_before_lease_expiry_is_finalised_on_claim(queue):
+    job_id = queue.submit("outline", {})
+    queue.lease = 0.01
+    queue.claim("w1")
+    queue.cancel(job_id)
+    time.sleep(0.02)
+    assert queue.claim("w2") is None
+    assert queue.get(job_id)["status"] == "cancelled"
+
+
+def test_stale_worker_cannot_overwrite_new_owner(queue):
+    job_id = queue.submit("outline", {}, max_attempts=3)
+    queue.lease = 0.01
+    queue.claim("w1")
+    time.sleep(0.02)
+    queue.lease = 60
+    queue.claim("w2")
+    assert not queue.complete(job_id, {"from": "w1"}, worker="w1")
+    assert not queue.fail(job_id, "boom", worker="w1")
+    assert not queue.mark_cancelled(job_id, worker="w1")
+    assert queue.get(job_id)["status"] == "running"
+    assert queue.complete(job_id, {"from": "w2"}, worker="w2")
+    assert queue.get(job_id)["result"] == {"from": "w2"}
+
+
+def test_expired_lease_is_not_completed_even_before_reclaim(queue):
+    job_id = queue.submit("outline", {})
+    queue.lease = 0.01
+    queue.claim("w1")
+    time.sleep(0.02)
+    assert not queue.complete(job_id, {}, worker="w1")
+
+
+def test_crashing_job_fails_after_max_attempts(queue):
+    job_id = queue.submit("outline", {}, max_attempts=2)
+    queue.lease = 0.01
+    for attempt in (1, 2):
+        assert queue.claim("w")["attempts"] == attempt
+        time.sleep(0.02)  # 工作进程崩溃，租约过期
+    assert queue.claim("w") is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and "租约过期" in job["error"]
+    assert [e["event"] for e in queue.events(job_id)][-1] == "failed"
+
+
+def test_run_job_stops_when_lease_is_lost(queue):
+    queue.lease = 0.06
+    job_id = queue.submit("slow", {})
+    seen = []
+
+    def handler(params, ctx):
+        # 另一个工作进程在租约过期后接手
+        with queue.conn:
+            queue.conn.execute("UPDATE jobs SET worker = 'w2' WHERE id = ?", (job_id,))
+        deadline = time.time() + 2
+        while time.time() < deadline:
+            try:
+                ctx.emit("progress", {})
+            except LeaseLost:
+                seen.append("lost")
+                raise
+            time.sleep(0.01)
+        return {"from": "w1"}
+
+    Worker(queue, handlers={"slow": handler}).run_job(queue.claim("w1", ["slow"]), "w1")
+    job = queue.get(job_id)
+    assert seen == ["lost"]
+    assert job["status"] == "running" and job["worker"] == "w2" and job["result"] is None
+
+
+# ============ 参数校验与执行 ============
+
+def test_validate_params_against_generator_signature():
+    validate_params("outline", {"genre": "玄幻", "theme": "逆袭", "main_char": "林凡"})
+    with pytest.raises(ValueError):
+        validate_params("outline", {"genre": "玄幻"})
+    with pytest.raises(ValueError):
+        validate_params("chapter", {"outline": "", "previous_content": "", "chapter_num": 1, "words": 10})
+    with pytest.raises(ValueError):
+        validate_params("book", {"genre": "玄幻", "theme": "逆袭", "main_char": "林凡", "run_id": "x"})
+
+
+def test_type_error_fails_without_retry(queue):
+    def handler(params, ctx):
+        raise TypeError("unexpected keyword argument")
+
+    job_id = queue.submit("bad", {}, max_attempts=3)
+    worker = Worker(queue, handlers={"bad": handler})
+    worker.run_job(queue.claim("w", ["bad"]), "w")
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 1
+
+
+def test_cancel_inside_pipeline_futures_stops_book(queue, tmp_path, monkeypatch):
+    client = FakeClient()
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"))
+    monkeypatch.setattr(jobs, "_generator", lambda: NovelGenerator(client))
+    monkeypatch.setattr("src.generator.pipeline.CheckpointStore", lambda: store)
+
+    job_id = queue.submit("book", {"genre": "玄幻", "theme": "逆袭", "main_char": "林凡", "chapters": 20})
+    job = queue.claim("w")
+    emit = JobContext.emit
+
+    def cancel_on_first_beat(self, event, data=None):
+        if data and data.get("stage") == "beats" and data.get("status") == "done":
+            queue.cancel(job_id)
+        emit(self, event, data)
+
+    monkeypatch.setattr(JobContext, "emit", cancel_on_first_beat)
+    Worker(queue).run_job(job, "w")
+    assert queue.get(job_id)["status"] == "cancelled"
+    assert client.tasks.count("chapter") < 20
+
+
+def test_submit_rejects_invalid_params_with_422(queue, monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.api import main
+
+    monkeypatch.setattr(jobs, "_queue", queue)
+    client = TestClient(main.app)
+    response = client.post("/api/jobs", json={"kind": "outline", "params": {"genre": "玄幻", "topic": "x"}})
+    assert response.status_code == 422
+    assert queue.counts()["queued"] == 0
+    response = client.post("/api/jobs", json={"kind": "outline", "params": {
+        "genre": "玄幻", "theme": "逆袭", "main_char": "林凡"
+    }})
+    assert response.status_code == 200
+    assert queue.counts()["queued"] == 1
+
+
+def test_stream_job_replays_events_until_final(queue, monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.api import main
+
+    monkeypatch.setattr(jobs, "_queue", queue)
+    job_id = queue.submit("outline", {})
+    queue.cancel(job_id)
+    body = TestClient(main.app).get(f"/api/jobs/{job_id}/stream").text
+    assert "event: queued" in body and "event: cancelled" in body
@@ -0,0 +1,91 @@
+from src.analyzer.mapreduce import _Partial
+
+
+def _report(genre, curve):
+    return {
+        "genre": genre,
+        "personality": {},
+        "excitement_points": [],
+        "golden_sentences": [],
+        "emotion_curve": {"curve": curve}
+    }
+
+
+def test_non_numeric_confidence_falls_back_to_default():
+    part = _Partial.from_report(_report({"genre": "玄幻", "confidence": "高"}, []), 0, 100)
+    assert part.genres["玄幻"] == 50
+
+
+def test_malformed_stages_are_skipped():
+    curve = [
+        {"emotion": "紧张", "intensity": "高"},
+        {"emotion": "愤怒", "intensity": 8},
+        {"emotion": "平静", "intensity": "2"},
+        "高潮",
+        {"emotion": "喜悦"}
+    ]
+    part = _Partial.from_report(_report({"genre": "待分析"}, curve), 3, 100)
+    assert part.curve == [{"start": 3, "end": 3, "emotion": "愤怒", "intensity": 5.0}]
+    assert not part.genres
+
+
+def test_no_valid_stage_gives_empty_curve():
+    part = _Partial.from_report(_report({"genre": "都市", "confidence": None}, [{"intensity": "强烈"}]), 0, 10)
+    assert part.curve == []
+    assert part.to_report()["genre"]["genre"] == "都市"
+
+
+class _BatchClient:
+    max_workers = 2
+
+    def __init__(self):
+        self.tasks = []
+
+    def batch_run(self, tasks, max_workers=None):
+        self.tasks += tasks
+        return [{"content": "{}", "usage": None, "latency": 0.0, "error": None} for _ in tasks]
+
+
+def test_batch_tasks_are_routed_as_analysis():
+    from src.analyzer.gene import GeneAnalyzer
+    from src.analyzer.mapreduce import MapReduceAnalyzer
+
+    client = _BatchClient()
+    analyzer = GeneAnalyzer(client)
+    MapReduceAnalyzer(analyzer, max_chars=50).analyze("第一章\n" + "正文" * 100)
+    analyzer._run_fanout("正文", ["personality", "golden_sentences"], {}, {"aspects": {}})
+    assert client.tasks and all(task["task"] == "analysis" for task in client.tasks)
+
+
+def test_map_prompt_contains_whole_chunk():
+    from src.analyzer.gene import GeneAnalyzer
+    from src.analyzer.mapreduce import MapReduceAnalyzer, iter_chapters
+
+    text = "\n".join(f"第{i}章\n" + f"第{i}章的正文。" * 400 for i in range(1, 4))
+    chunks = list(iter_chapters(text, max_chars=6000))
+    assert max(len(c) for c in chunks) > 2000
+
+    client = _BatchClient()
+    MapReduceAnalyzer(GeneAnalyzer(client), max_chars=6000).analyze(text)
+    prompts = [task["messages"][-1]["content"] for task in client.tasks]
+    assert len(prompts) == len(chunks)
+    assert all(chunk in prompt for chunk, prompt in zip(chunks, prompts))
+
+
+def test_full_analysis_reports_failed_chunks():
+    from types import SimpleNamespace
+
+    from src.api.minimax_client import MiniMaxClient
+
+    def batch_process(tasks):
+        # 第 2 块失败，合并正常
+        return [None if "第2章" in t["messages"][-1]["content"] else f"结果{i}" for i, t in enumerate(tasks)]
+
+    client = SimpleNamespace(
+        batch_process=batch_process,
+        _analyze_messages=MiniMaxClient._analyze_messages,
+        _merge_messages=MiniMaxClient._merge_messages
+    )
+    text = "\n".join(f"第{i}章\n" + "正文。" * 1500 for i in range(1, 4))
+    report = MiniMaxClient.analyze_content(client, text, full=True)
+    assert "[不完整]" in report and "第 2 块" in report
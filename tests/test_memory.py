@@ -0,0 +1,68 @@
+from src.generator.memory import StoryMemory
+
+
+class Summarizer:
+    """假摘要：记录调用次数，输出恰好 limit 字"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text, limit):
+        self.calls += 1
+        return (str(self.calls) + "摘" * limit)[:limit]
+
+
+def _chapter(num):
+    return f"第{num}章正文。" * 400
+
+
+def test_context_size_is_bounded():
+    memory = StoryMemory(summarize=Summarizer())
+    sizes = {}
+    for num in range(1, 301):
+        sizes[num] = len(memory.context(num))
+        memory.update(num, _chapter(num))
+
+    # 全书梗概 + 两卷摘要 + 本卷最多 7 章摘要 + 上一章结尾，外加标题与章节号
+    bound = memory.rollup_chars + memory.recent_arcs * memory.arc_summary_chars \
+        + (memory.arc_size - 1) * memory.chapter_summary_chars + memory.tail_chars + 400
+    assert max(sizes.values()) <= bound
+    # 三卷之后长度只随卷内位置变化，不随章节数增长（差别仅在章节号位数）
+    for num in range(25, 33):
+        assert abs(sizes[num + 8 * 33] - sizes[num]) <= 40
+
+
+def test_only_changed_sources_are_resummarized():
+    summarize = Summarizer()
+    memory = StoryMemory(summarize=summarize, arc_size=4, recent_arcs=1)
+    for num in range(1, 13):
+        memory.update(num, _chapter(num))
+    memory.context(13)
+    before = summarize.calls
+
+    # 内容不变：不重新摘要
+    assert memory.update(5, _chapter(5)) is False
+    memory.context(13)
+    assert summarize.calls == before
+
+    # 修改第 2 章：章节摘要 + 第 0 卷 + 第 0、1 卷梗概
+    assert memory.update(2, _chapter(2) + "改")
+    context = memory.context(13)
+    assert summarize.calls == before + 4
+    assert "全书梗概" in context and "第9-12章" in context
+
+
+def test_state_round_trip_keeps_summaries():
+    import json
+
+    summarize = Summarizer()
+    memory = StoryMemory(summarize=summarize)
+    for num in range(1, 20):
+        memory.update(num, _chapter(num))
+    expected = memory.context(20)
+
+    restored = StoryMemory(summarize=summarize)
+    restored.load(json.loads(json.dumps(memory.to_dict())))
+    calls = summarize.calls
+    assert restored.context(20) == expected
+    assert summarize.calls == calls
@@ -0,0 +1,68 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+from src.api import metrics  # noqa: E402
+
+
+def _value(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _chunk(text=None, finish_reason=None, usage=None):
+    choices = [] if text is None and finish_reason is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason)
+    ]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def test_stream_records_ttft_duration_usage_and_finish_reason():
+    model = "metrics-test-model"
+    usage = SimpleNamespace(prompt_tokens=11, completion_tokens=5)
+    chunks = [_chunk(""), _chunk("一"), _chunk("二"), _chunk(finish_reason="length"), _chunk(usage=usage)]
+    stream = metrics.meter_stream(iter(chunks), model, time.perf_counter())
+    assert list(stream) == chunks
+    stream.close()  # 结束后再关闭不重复记录
+
+    assert _value("llm_ttft_seconds_count", model=model) == 1
+    assert _value("llm_request_duration_seconds_count", model=model, stream="true") == 1
+    assert _value("llm_tokens_total", model=model, kind="prompt") == 11
+    assert _value("llm_tokens_total", model=model, kind="completion") == 5
+    assert _value("llm_finish_reason_total", model=model, reason="length") == 1
+
+
+def test_completion_and_prompt_timing():
+    model = "metrics-test-completion"
+    response = SimpleNamespace(choices=[SimpleNamespace(finish_reason="stop")],
+                               usage=SimpleNamespace(prompt_tokens=3, completion_tokens=4))
+    metrics.observe_completion(model, response, time.perf_counter())
+    assert _value("llm_request_duration_seconds_count", model=model, stream="false") == 1
+    assert _value("llm_finish_reason_total", model=model, reason="stop") == 1
+
+    @metrics.timed_prompt("metrics-test-task")
+    def build():
+        return ["prompt"]
+
+    before = _value("generator_prompt_build_seconds_count", task="metrics-test-task")
+    assert build() == ["prompt"]
+    assert _value("generator_prompt_build_seconds_count", task="metrics-test-task") == before + 1
+
+
+def test_http_routes_labelled_by_template(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.api import jobs, main
+
+    monkeypatch.setattr(jobs, "_queue", jobs.JobQueue(str(tmp_path / "jobs.db")))
+    labels = dict(method="GET", route="/api/jobs/{job_id}", status="404")
+    before = _value("http_request_duration_seconds_count", **labels)
+    client = TestClient(main.app)
+    for job_id in ("a", "b"):
+        assert client.get(f"/api/jobs/{job_id}").status_code == 404
+    # 不同的实际路径聚合到同一个路由模板
+    assert _value("http_request_duration_seconds_count", **labels) == before + 2
+
+    body = client.get("/metrics").text
+    assert "http_request_duration_seconds_bucket" in body and "llm_ttft_seconds" in body
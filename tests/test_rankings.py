@@ -0,0 +1,96 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from src.database.rankings import DAY, RankingStore
+
+
+def _books(*titles):
+    return [{"title": title, "url": f"/book/{title}", "rank": i + 1} for i, title in enumerate(titles)]
+
+
+def test_sees_writes_from_other_instances(tmp_path):
+    reader = RankingStore(str(tmp_path))
+    writer = RankingStore(str(tmp_path))
+    assert reader.stats()["rows"] == 0
+
+    writer.add_snapshot(_books("甲", "乙"), site="qidian", category="玄幻", ts=1000)
+    assert reader.stats()["rows"] == 2
+    assert [item["title"] for item in reader.find_titles("甲")] == ["甲"]
+
+    # reader 追加时基于最新的 meta，不会覆盖 writer 的数据
+    reader.add_snapshot(_books("乙", "甲"), site="qidian", category="玄幻", ts=1000 + DAY)
+    assert writer.stats()["rows"] == 4
+    assert writer.history(0)["rank"] == [1, 2]
+
+
+def test_risers_compare_ranks_within_list(tmp_path):
+    store = RankingStore(str(tmp_path))
+    day1, day2 = 10 * DAY, 11 * DAY
+    store.add_snapshots([
+        {"books": _books("甲", "乙", "丙"), "site": "qidian", "category": "玄幻", "list_name": "hot", "ts": day1},
+        {"books": _books("乙", "丙", "甲"), "site": "qidian", "category": "玄幻", "list_name": "new", "ts": day1},
+        {"books": _books("甲", "乙", "丙"), "site": "qidian", "category": "玄幻", "list_name": "hot", "ts": day2},
+        {"books": _books("丙", "乙", "甲"), "site": "qidian", "category": "玄幻", "list_name": "new", "ts": day2},
+    ])
+    risers = store.risers(days=7, now=day2)
+    # 「甲」在 hot 榜第 1、在 new 榜第 3，跨榜比较会误判为变化；只有 new 榜的「丙」真正上升
+    assert [(item["title"], item["list"], item["delta"]) for item in risers] == [("丙", "new", 1)]
+
+
+def test_concurrent_queries_during_writes(tmp_path):
+    import threading
+
+    store = RankingStore(str(tmp_path))
+    store.add_snapshot(_books("甲", "乙", "丙"), site="qidian", category="玄幻", ts=100 * DAY)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        reader = RankingStore(str(tmp_path))
+        while not stop.is_set():
+            try:
+                reader.risers(days=365)
+                reader.history(0)
+                reader.stats()
+            except Exception as e:  # 列长度不一致会在这里抛出
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=read) for _ in range(2)] + [threading.Thread(target=lambda: store.risers(days=365))]
+    for thread in threads:
+        thread.start()
+    for day in range(50):
+        # 交替写入新快照与补录旧快照（触发整体重写）
+        ts = (101 + day) * DAY if day % 2 else (99 - day) * DAY
+        store.add_snapshot(_books("乙", "甲", f"新{day}"), site="qidian", category="玄幻", ts=ts)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert store.stats()["rows"] == 3 + 50 * 3
+
+
+def test_writers_in_separate_processes_do_not_overwrite(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = (
+        "import sys\n"
+        "from src.database.rankings import RankingStore, DAY\n"
+        "store = RankingStore(sys.argv[1])\n"
+        "for i in range(30):\n"
+        "    store.add_snapshot([{'title': sys.argv[2] + str(i), 'rank': 1}], site='qidian', category='玄幻',"
+        " ts=100 * DAY + i)\n"
+    )
+    procs = [
+        subprocess.Popen([sys.executable, "-c", code, str(tmp_path), name], cwd=root)
+        for name in ("甲", "乙", "丙")
+    ]
+    assert all(proc.wait(60) == 0 for proc in procs)
+    store = RankingStore(str(tmp_path))
+    assert store.stats()["rows"] == 90
+    assert store.stats()["titles"] == 90
+    assert len(store.find_titles("乙", limit=100)) == 30
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.api.ratelimit import RateLimiter, SharedState
+
+HOLDER = """
+import sys, time
+from src.api.ratelimit import RateLimiter, SharedState
+limiter = RateLimiter(concurrency=1, state=SharedState(sys.argv[1]))
+limiter.enter()
+print("held", flush=True)
+time.sleep(60)
+"""
+
+
+def test_shared_buckets_span_limiters(tmp_path):
+    path = str(tmp_path / "limiter.db")
+    api = RateLimiter(rpm=60, tpm=600, state=SharedState(path))
+    worker = RateLimiter(rpm=60, tpm=600, state=SharedState(path))
+
+    assert api._reserve(600) == 0.0
+    # 另一个进程的限速器看到同一个桶：TPM 已用完，需等待约 6 秒（600/分钟即 10/秒）
+    assert 5.5 <= worker._reserve(60) <= 6.5
+    worker.settle(60, 0)
+    api.settle(600, 0)
+    assert worker._reserve(600) == 0.0  # 多预占的部分归还后双方都能再用
+
+
+def test_inflight_cap_shared_across_processes(tmp_path):
+    path = str(tmp_path / "limiter.db")
+    limiter = RateLimiter(concurrency=1, state=SharedState(path))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    holder = subprocess.Popen([sys.executable, "-c", HOLDER, path], stdout=subprocess.PIPE, text=True, cwd=root)
+    try:
+        assert holder.stdout.readline().strip() == "held"
+        assert not limiter.state.try_enter(1)
+
+        async def blocked():
+            await asyncio.wait_for(limiter.enter_async(), timeout=0.2)
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(blocked())
+    finally:
+        holder.kill()
+        holder.wait()
+
+    # 子进程崩溃后其名额被回收
+    start = time.monotonic()
+    limiter.enter()
+    assert time.monotonic() - start < 1
+    assert not limiter.state.try_enter(1)
+    limiter.leave()
+    assert limiter.state.try_enter(1)
+    limiter.leave()
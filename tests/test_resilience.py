@@ -0,0 +1,225 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from src.api.ratelimit import RateLimiter
+from src.api.resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, Resilience, retry_after
+
+
+def _status_error(status, headers=None):
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return openai.APIStatusError("upstream", response=response, body=None)
+
+
+def _resilience(**kwargs):
+    options = dict(max_retries=3, base_delay=0.001, max_delay=0.01, limiter=AdaptiveLimiter(initial=4))
+    options.update(kwargs)
+    return Resilience(**options)
+
+
+# ============ 熔断器 ============
+
+def test_breaker_opens_after_threshold_and_recovers_after_probe():
+    breaker = CircuitBreaker("m", threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    time.sleep(0.06)
+    breaker.check()  # 冷却后放行一个探测
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()  # 探测进行中，其余请求仍被拒绝
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker("m", threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+
+
+def test_rate_limited_responses_do_not_trip_breaker():
+    resilience = _resilience(max_retries=1, breaker_threshold=1)
+
+    def fn():
+        raise _status_error(429)
+
+    with pytest.raises(openai.APIStatusError):
+        resilience.call("m", fn)
+    assert resilience.breaker("m").state == "closed"
+    assert resilience.limiter.decreases == 1
+
+
+# ============ 重试 ============
+
+def test_retry_after_header_formats():
+    assert retry_after(_status_error(429, {"retry-after": "2"})) == 2
+    assert retry_after(_status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert 0 <= retry_after(_status_error(503, {"retry-after": "Thu, 01 Jan 1970 00:00:00 GMT"})) <= 0
+    assert retry_after(_status_error(500)) is None
+
+
+def test_delay_prefers_retry_after_capped_by_max_delay():
+    resilience = Resilience(base_delay=0.001, max_delay=5)
+    assert 1 <= resilience.delay(0, _status_error(429, {"retry-after": "1"})) <= 1.001
+    assert resilience.delay(0, _status_error(429, {"retry-after": "60"})) <= 5.001
+
+
+def test_call_retries_retryable_errors_then_succeeds():
+    resilience = _resilience()
+    errors = [_status_error(502), _status_error(500)]
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert resilience.call("m", fn) == "ok"
+    assert resilience.retries == 2
+    assert resilience.limiter.in_flight == 0
+
+
+def test_call_does_not_retry_client_errors():
+    resilience = _resilience()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(openai.APIStatusError):
+        resilience.call("m", fn)
+    assert len(calls) == 1
+    assert resilience.limiter.in_flight == 0
+
+
+# ============ 流式响应的在途名额 ============
+
+def test_stream_holds_slot_until_exhausted():
+    resilience = _resilience()
+    stream = resilience.call("m", lambda: iter([1, 2]), stream=True)
+    assert resilience.limiter.in_flight == 1
+    assert list(stream) == [1, 2]
+    assert resilience.limiter.in_flight == 0
+
+
+def test_stream_slot_released_on_close_and_error():
+    resilience = _resilience()
+    stream = resilience.call("m", lambda: iter([1, 2]), stream=True)
+    next(stream)
+    stream.close()
+    assert resilience.limiter.in_flight == 0
+
+    def broken():
+        yield 1
+        raise _status_error(503)
+
+    limit = resilience.limiter.limit
+    stream = resilience.call("m", broken, stream=True)
+    with pytest.raises(openai.APIStatusError):
+        list(stream)
+    assert resilience.limiter.in_flight == 0
+    assert resilience.limiter.limit < limit
+
+
+def test_async_stream_holds_slot_until_exhausted():
+    resilience = _resilience()
+
+    async def chunks():
+        yield 1
+        yield 2
+
+    async def main():
+        async def fn():
+            return chunks()
+
+        stream = await resilience.call_async("m", fn, stream=True)
+        assert resilience.limiter.in_flight == 1
+        assert [chunk async for chunk in stream] == [1, 2]
+        assert resilience.limiter.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_client_keeps_rate_limiter_slot_for_stream():
+    from src.api.minimax_client import MiniMaxClient
+
+    limiter = RateLimiter(concurrency=1)
+    client = MiniMaxClient(api_key="test", rate_limiter=limiter, resilience=_resilience())
+    chunk = SimpleNamespace(choices=[], usage=None)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **params: iter([chunk, chunk])
+    )))
+
+    stream = client.chat([{"role": "user", "content": "hi"}], stream=True, use_cache=False)
+    assert not limiter._slots.acquire(blocking=False)
+    assert len(list(stream)) == 2
+    assert limiter._slots.acquire(blocking=False)
+    limiter._slots.release()
+
+
+def _stream_client(limiter, chunks):
+    from src.api.minimax_client import MiniMaxClient
+
+    client = MiniMaxClient(api_key="test", rate_limiter=limiter, resilience=_resilience())
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **params: iter(chunks)
+    )))
+    return client
+
+
+def test_stream_settles_tpm_from_usage_chunk():
+    limiter = RateLimiter(tpm=100000)
+    chunk = SimpleNamespace(choices=[], usage=None)
+    final = SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=12))
+    client = _stream_client(limiter, [chunk, final])
+    list(client.chat([{"role": "user", "content": "hi"}], stream=True, use_cache=False, max_tokens=8000))
+    # 预占 2 + 8000，实际 12：只扣 12
+    assert limiter.tokens.tokens >= 100000 - 12 - 1
+
+
+def test_stream_settles_tpm_from_chunk_count_when_closed_early():
+    limiter = RateLimiter(tpm=100000)
+    chunk = SimpleNamespace(choices=[], usage=None)
+    client = _stream_client(limiter, [chunk] * 5)
+    stream = client.chat([{"role": "user", "content": "hi"}], stream=True, use_cache=False, max_tokens=8000)
+    next(stream)
+    next(stream)
+    stream.close()
+    # 提示约 2 + 已读 2 个分块
+    assert 100000 - 5 <= limiter.tokens.tokens <= 100000 - 3
+
+
+def test_adaptive_limiter_starts_at_cap_and_shrinks_on_overload(monkeypatch):
+    import src.api.resilience as resilience
+
+    monkeypatch.delenv("LLM_AIMD_INITIAL", raising=False)
+    monkeypatch.setenv("MINIMAX_MAX_INFLIGHT", "32")
+    monkeypatch.setattr(resilience, "_resilience", None)
+    limiter = resilience.get_resilience().limiter
+    assert limiter.limit == 32
+    for _ in range(32):
+        assert limiter._try_enter()
+    assert not limiter._try_enter()
+
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    assert resilience.overloaded(openai.APITimeoutError(request))
+    assert resilience.overloaded(_status_error(503))
+    assert not resilience.overloaded(_status_error(500))
+    limiter.on_overload()
+    assert limiter.limit == 16
@@ -0,0 +1,108 @@
+import pytest
+
+from src.api.minimax_client import _BaseMiniMaxClient
+from src.api.router import ModelRouter, configured_models
+
+
+def test_model_env_applies_to_task_routes(monkeypatch):
+    monkeypatch.setenv("MODEL", "my-model")
+    router = ModelRouter(configured_models(_BaseMiniMaxClient.MODELS))
+    for task in ("default", "chapter", "outline", "analysis", "polish", "unknown"):
+        assert router.route(task, tokens=100, max_tokens=100)[0] == "my-model"
+
+
+def test_alias_and_route_overrides(monkeypatch):
+    monkeypatch.delenv("MODEL", raising=False)
+    monkeypatch.setenv("MODEL_LONG", "big-model")
+    monkeypatch.setenv("ROUTER_ROUTES", '{"chapter": ["long"]}')
+    models = configured_models(_BaseMiniMaxClient.MODELS)
+    assert models["fast"] == _BaseMiniMaxClient.MODELS["fast"]
+    router = ModelRouter(models)
+    assert router.candidates("chapter") == ["big-model"]
+    assert router.candidates("outline") == [models["fast"], "big-model"]
+
+
+def test_long_prompts_skip_small_context_models(monkeypatch):
+    monkeypatch.delenv("MODEL", raising=False)
+    router = ModelRouter(configured_models(_BaseMiniMaxClient.MODELS), cost_weight=5)
+    assert router.route("chapter", tokens=1000, max_tokens=2000) == ["MiniMax-M2.5", "MiniMax-Text-01"]
+    # 超出 M2.5 的 32K 上下文：只剩长文本模型
+    assert router.route("chapter", tokens=50000, max_tokens=2000) == ["MiniMax-Text-01"]
+    # 都放不下时退回上下文最大的模型
+    assert router.route("code", tokens=500000) == ["kimi-code/kimi-for-codi"]
+    assert router.candidates("no-such-task") == router.candidates("default")
+
+
+def test_observed_latency_and_errors_reorder_chain(monkeypatch):
+    monkeypatch.delenv("MODEL", raising=False)
+    router = ModelRouter(configured_models(_BaseMiniMaxClient.MODELS), alpha=1.0)
+    router.observe("MiniMax-M2.5", seconds=120, max_tokens=2000)
+    assert router.route("outline", tokens=100, max_tokens=2000)[0] == "MiniMax-Text-01"
+    router.observe("MiniMax-M2.5", seconds=2, max_tokens=2000)
+    router.observe("MiniMax-Text-01", seconds=0, max_tokens=2000, error=True)
+    assert router.route("outline", tokens=100, max_tokens=2000)[0] == "MiniMax-M2.5"
+    assert router.stats()["MiniMax-Text-01"]["errors"] == 1
+
+
+def _error(cls, status):
+    import httpx
+
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    return cls("upstream", response=httpx.Response(status, request=request), body=None)
+
+
+def _client(create):
+    from types import SimpleNamespace
+
+    from src.api.minimax_client import MiniMaxClient
+    from src.api.ratelimit import RateLimiter
+    from tests.test_resilience import _resilience
+
+    router = ModelRouter(configured_models(_BaseMiniMaxClient.MODELS))
+    client = MiniMaxClient(api_key="test", rate_limiter=RateLimiter(), resilience=_resilience(max_retries=0),
+                           router=router)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return client
+
+
+def test_client_falls_back_along_chain(monkeypatch):
+    from types import SimpleNamespace
+
+    import openai
+
+    monkeypatch.delenv("MODEL", raising=False)
+    models = []
+
+    def create(**params):
+        models.append(params["model"])
+        if params["model"] == "MiniMax-M2.5":
+            raise _error(openai.InternalServerError, 503)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=params["model"]))], usage=None)
+
+    client = _client(create)
+    response = client.chat([{"role": "user", "content": "hi"}], task="chapter", temperature=0.9, max_tokens=100)
+    assert response.choices[0].message.content == "MiniMax-Text-01"
+    assert models == ["MiniMax-M2.5", "MiniMax-Text-01"]
+    assert client.router.stats()["MiniMax-M2.5"]["errors"] == 1
+
+    # 指定 model 时不走路由，也没有回退
+    models.clear()
+    with pytest.raises(openai.InternalServerError):
+        client.chat([{"role": "user", "content": "hi"}], model="MiniMax-M2.5", temperature=0.9)
+    assert models == ["MiniMax-M2.5"]
+
+
+def test_client_does_not_fall_back_on_bad_request(monkeypatch):
+    import openai
+
+    monkeypatch.delenv("MODEL", raising=False)
+    models = []
+
+    def create(**params):
+        models.append(params["model"])
+        raise _error(openai.BadRequestError, 400)
+
+    client = _client(create)
+    with pytest.raises(openai.BadRequestError):
+        client.chat([{"role": "user", "content": "hi"}], task="chapter", temperature=0.9)
+    assert models == ["MiniMax-M2.5"]
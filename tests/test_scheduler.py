@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("apscheduler")
+
+from src.scheduler import cron
+
+
+def _set_next_run_time(path, job_id, when):
+    """直接改任务库：在运行中的调度器上改成过去的时间会被立即执行"""
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+    store = SQLAlchemyJobStore(url=f"sqlite:///{path}")
+    job = store.lookup_job(job_id)
+    job.next_run_time = when
+    store.update_job(job)
+    store.shutdown()
+
+
+def _open(path):
+    scheduler = cron.build_scheduler(f"sqlite:///{path}")
+    scheduler.start(paused=True)
+    cron.register_jobs(scheduler)
+    return scheduler
+
+
+def test_register_keeps_stored_next_run_time(tmp_path):
+    path = tmp_path / "scheduler.db"
+    scheduler = _open(path)
+    missed = datetime.now(scheduler.timezone).replace(microsecond=0) - timedelta(hours=1)
+    scheduler.shutdown(wait=False)
+    _set_next_run_time(path, "crawl_rankings", missed)
+
+    scheduler = _open(path)
+    try:
+        assert scheduler.get_job("crawl_rankings").next_run_time == missed
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+def test_register_reschedules_changed_expression(tmp_path, monkeypatch):
+    path = tmp_path / "scheduler.db"
+    scheduler = _open(path)
+    missed = datetime.now(scheduler.timezone).replace(microsecond=0) - timedelta(hours=1)
+    scheduler.shutdown(wait=False)
+    _set_next_run_time(path, "crawl_rankings", missed)
+
+    monkeypatch.setenv("SCHEDULE_CRAWL_RANKINGS", "0 5 * * *")
+    scheduler = _open(path)
+    try:
+        job = scheduler.get_job("crawl_rankings")
+        assert job.next_run_time > missed
+        assert "hour='5'" in str(job.trigger)
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+def test_register_removes_disabled_job(tmp_path, monkeypatch):
+    path = tmp_path / "scheduler.db"
+    _open(path).shutdown(wait=False)
+
+    monkeypatch.setenv("SCHEDULE_EVOMAP_HEARTBEAT", "off")
+    scheduler = _open(path)
+    try:
+        assert scheduler.get_job("evomap_heartbeat") is None
+    finally:
+        scheduler.shutdown(wait=False)
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from src.api.singleflight import AsyncSingleFlight, SingleFlight, coalescible
+
+
+def test_concurrent_calls_share_one_upstream():
+    flights = SingleFlight()
+    calls, release = [], threading.Event()
+
+    def upstream():
+        calls.append(1)
+        release.wait(2)
+        return "result"
+
+    with ThreadPoolExecutor(5) as pool:
+        futures = [pool.submit(flights.do, "k", upstream) for _ in range(5)]
+        while flights.metrics.calls < 5:
+            time.sleep(0.005)
+        release.set()
+        assert [f.result() for f in futures] == ["result"] * 5
+    assert len(calls) == 1
+    stats = flights.stats()
+    assert stats["calls"] == 5 and stats["upstream"] == 1 and stats["saved"] == 4
+    assert stats["saved_rate"] == 0.8 and stats["in_flight"] == 0
+
+    # 上一次完成后的同键调用重新请求上游
+    assert flights.do("k", upstream) == "result" and len(calls) == 2
+
+
+def test_error_reaches_every_waiter():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def upstream():
+        release.wait(2)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flights.do, "k", upstream) for _ in range(3)]
+        while flights.metrics.calls < 3:
+            time.sleep(0.005)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="upstream down"):
+                future.result()
+    assert flights.stats()["upstream"] == 1
+
+
+def test_async_calls_share_one_upstream_and_survive_cancel():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        tasks = [asyncio.ensure_future(flights.do("k", upstream)) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        tasks[0].cancel()  # 首个调用方（发起者）被取消，其余等待者照常拿到结果
+        results = await asyncio.gather(*tasks[1:])
+        return results, tasks[0].cancelled()
+
+    results, cancelled = asyncio.run(main())
+    assert results == ["result"] * 3 and cancelled
+    assert len(calls) == 1
+    assert flights.stats()["saved"] == 3
+
+
+class _Upstream:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_subscribers_replay_shared_chunks():
+    flights = SingleFlight()
+    opened = []
+
+    def opener():
+        opened.append(_Upstream(["a", "b", "c"]))
+        return opened[-1]
+
+    first = flights.stream("k", opener)
+    assert next(first) == "a"
+    late = flights.stream("k", opener)
+    # 后加入者从头回放
+    assert list(late) == ["a", "b", "c"]
+    assert list(first) == ["b", "c"]
+    assert len(opened) == 1
+    stats = flights.stats()
+    assert stats["stream_calls"] == 2 and stats["stream_upstream"] == 1 and stats["in_flight"] == 0
+
+
+def test_stream_closes_upstream_after_last_subscriber():
+    flights = SingleFlight()
+    upstream = _Upstream(["a", "b", "c"])
+    views = [flights.stream("k", lambda: upstream) for _ in range(2)]
+    next(views[0])
+    views[0].close()
+    assert not upstream.closed
+    next(views[1])
+    views[1].close()
+    assert upstream.closed and flights.stats()["in_flight"] == 0
+
+
+def test_async_stream_subscribers_share_upstream():
+    flights = AsyncSingleFlight()
+    opened = []
+
+    class Upstream:
+        def __init__(self):
+            self.chunks = iter(["a", "b"])
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.sleep(0)
+            try:
+                return next(self.chunks)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    async def opener():
+        opened.append(Upstream())
+        return opened[-1]
+
+    async def read(view):
+        return [chunk async for chunk in view]
+
+    async def main():
+        return await asyncio.gather(*(read(flights.stream("k", opener)) for _ in range(3)))
+
+    assert asyncio.run(main()) == [["a", "b"]] * 3
+    assert len(opened) == 1
+    assert flights.stats()["stream_upstream"] == 1
+
+
+def test_only_deterministic_requests_coalesce(monkeypatch):
+    assert coalescible({"temperature": 0.2})
+    assert coalescible({})
+    assert not coalescible({"temperature": 0.7})
+    assert not coalescible({"temperature": 0, "n": 2})
+    monkeypatch.setenv("SINGLEFLIGHT", "0")
+    assert not coalescible({"temperature": 0})
+
+
+def test_client_coalesces_identical_requests():
+    from src.api.minimax_client import MiniMaxClient
+    from src.api.ratelimit import RateLimiter
+    from tests.test_resilience import _resilience
+
+    created = []
+
+    def create(**params):
+        created.append(params)
+        time.sleep(0.1)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=None)
+
+    client = MiniMaxClient(api_key="test", rate_limiter=RateLimiter(), resilience=_resilience())
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def ask(temperature):
+        messages = [{"role": "user", "content": f"合并测试 {temperature}"}]
+        return client.chat(messages, temperature=temperature).choices[0].message.content
+
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(ask, [0.1] * 4)) == ["ok"] * 4
+    assert len(created) == 1
+    # 创作类温度不合并
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(ask, [0.9] * 2))
+    assert len(created) == 3
@@ -0,0 +1,133 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from src.api.streaming import stream_events
+
+
+def _chunk(text=None, finish_reason=None, usage=None):
+    choices = [] if text is None and finish_reason is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason)
+    ]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+USAGE = SimpleNamespace(model_dump=lambda: {"total_tokens": 7})
+CHUNKS = [_chunk("第一"), _chunk("章"), _chunk(finish_reason="stop"), _chunk(usage=USAGE)]
+
+
+class _Stream:
+    def __init__(self, chunks, fail=None):
+        self.chunks = iter(chunks)
+        self.fail = fail
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            if self.fail:
+                raise self.fail
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.closed = True
+
+
+class _SyncStream:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.closed = True
+
+
+def _parse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+async def _collect(stream, request=None):
+    return _parse("".join([event async for event in stream_events(stream, request)]))
+
+
+def test_event_order_and_done_summary():
+    stream = _Stream(CHUNKS)
+    events = asyncio.run(_collect(stream))
+    assert [name for name, _ in events] == ["ttft", "token", "token", "done"]
+    assert [data["text"] for name, data in events if name == "token"] == ["第一", "章"]
+    done = events[-1][1]
+    assert done["finish_reason"] == "stop" and done["usage"] == {"total_tokens": 7}
+    assert done["characters"] == 3 and done["ttft"] <= done["duration"]
+    assert stream.closed
+
+
+def test_sync_upstream_stream():
+    stream = _SyncStream(CHUNKS)
+    assert [name for name, _ in asyncio.run(_collect(stream))] == ["ttft", "token", "token", "done"]
+    assert stream.closed
+
+
+def test_upstream_error_becomes_error_event():
+    stream = _Stream([_chunk("半")], fail=RuntimeError("upstream reset"))
+    events = asyncio.run(_collect(stream))
+    assert [name for name, _ in events] == ["ttft", "token", "error"]
+    assert events[-1][1]["error"] == "RuntimeError: upstream reset"
+    assert stream.closed
+
+
+def test_client_disconnect_closes_upstream():
+    class Request:
+        checks = 0
+
+        async def is_disconnected(self):
+            self.checks += 1
+            return self.checks > 1
+
+    stream = _Stream(CHUNKS)
+    events = asyncio.run(_collect(stream, Request()))
+    # 第二个分块到达前客户端已断开：不再发送后续 token 与 done
+    assert [name for name, _ in events] == ["ttft", "token"]
+    assert stream.closed
+
+
+def test_generator_closed_early_closes_upstream():
+    async def main():
+        stream = _Stream(CHUNKS)
+        events = stream_events(stream)
+        assert (await events.__anext__()).startswith("event: ttft")
+        await events.aclose()
+        return stream
+
+    assert asyncio.run(main()).closed
+
+
+def test_stream_endpoint(monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.api import main
+
+    calls = []
+
+    class FakeLLM:
+        async def chat(self, **params):
+            calls.append(params)
+            return _Stream(CHUNKS)
+
+    monkeypatch.setattr(main, "llm", FakeLLM())
+    response = TestClient(main.app).post(
+        "/api/generate/story/stream", json={"genre": "玄幻", "theme": "逆袭", "main_char": "林凡"}
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [name for name, _ in _parse(response.text)] == ["ttft", "token", "token", "done"]
+    assert calls[0]["task"] == "outline" and calls[0]["stream"] is True
+    assert calls[0]["stream_options"] == {"include_usage": True}
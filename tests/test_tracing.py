@@ -0,0 +1,79 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from src.api import tracing
+from src.generator.novel import NovelGenerator
+from tests.test_generator import FakeClient
+
+
+@pytest.fixture
+def trace_dir(tmp_path):
+    rate, directory = tracing._rate, tracing._directory
+    tracing.configure(rate=1.0, directory=str(tmp_path))
+    yield tmp_path
+    tracing.configure(rate=rate, directory=directory)
+
+
+def _load(trace_dir):
+    files = sorted(trace_dir.glob("*.json"))
+    return [json.loads(path.read_text(encoding="utf-8")) for path in files]
+
+
+def _spans(payload):
+    return {event["name"]: event for event in payload["traceEvents"] if event["ph"] == "X"}
+
+
+def test_top_level_call_writes_chrome_trace(trace_dir):
+    NovelGenerator(FakeClient()).generate_outline("玄幻", "逆袭", "林凡")
+    [payload] = _load(trace_dir)
+    assert payload["otherData"]["root"] == "generator.outline"
+    spans = _spans(payload)
+    root, prompt = spans["generator.outline"], spans["prompt.outline"]
+    # 嵌套阶段落在顶层 span 的时间范围内
+    assert root["ts"] <= prompt["ts"] and prompt["ts"] + prompt["dur"] <= root["ts"] + root["dur"]
+    assert all(event["pid"] == root["pid"] for event in payload["traceEvents"])
+
+
+def test_thread_pool_spans_join_trace_on_own_lanes(trace_dir):
+    def work(i):
+        with tracing.span("worker", index=i):
+            time.sleep(0.01)
+
+    with tracing.trace("batch"):
+        with ThreadPoolExecutor(2) as pool:
+            list(pool.map(tracing.wrap(work), range(2)))
+    [payload] = _load(trace_dir)
+    workers = [event for event in payload["traceEvents"] if event["name"] == "worker"]
+    assert sorted(event["args"]["index"] for event in workers) == [0, 1]
+    assert len({event["tid"] for event in workers}) == 2
+    lanes = [event for event in payload["traceEvents"] if event["ph"] == "M"]
+    assert len(lanes) == 3
+
+
+def test_stream_defers_file_until_consumed(trace_dir):
+    chunk = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="字"))])
+    with tracing.trace("chat"):
+        stream = tracing.trace_stream(iter([chunk, chunk]), "m", time.perf_counter())
+    assert _load(trace_dir) == []
+    assert len(list(stream)) == 2
+    [payload] = _load(trace_dir)
+    spans = _spans(payload)
+    assert spans["llm.streaming"]["args"] == {"model": "m", "chunks": 2}
+    assert "llm.ttft" in spans and "chat" in spans
+
+
+def test_errors_recorded_and_sampling_off_writes_nothing(trace_dir):
+    with pytest.raises(ValueError):
+        with tracing.trace("failing"):
+            raise ValueError("boom")
+    [payload] = _load(trace_dir)
+    assert _spans(payload)["failing"]["args"]["error"] == "ValueError: boom"
+
+    tracing.configure(rate=0)
+    with tracing.trace("off") as span:
+        assert span is tracing.NOOP and not tracing.active()
+    assert len(_load(trace_dir)) == 1